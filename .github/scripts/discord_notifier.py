@@ -1,16 +1,117 @@
 """
 Discord notification script for test results.
-Usage: python discord_notifier.py test_results.json <repository_name>
+Usage: python discord_notifier.py <test_results.json>... <repository_name>
+
+Large reports are streamed, keeping only the ids of failed and errored tests,
+and the message is split into chunks under Discord's 2000-character limit.
+All chunks go over one HTTP session, waiting out 429 responses (retry_after)
+and the webhook's rate-limit bucket instead of failing. With several reports,
+the messages queued within DISCORD_COALESCE_SECONDS (default 2) of each other
+are sent together.
 """
 
-import json, sys, os, requests
-from typing import Dict, Any
+import json, sys, os, threading, time, requests
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Discord rejects messages with more content than this
+MESSAGE_LIMIT = 2000
 
 def load_test_results(filepath: str) -> Dict[str, Any]:
     """Load and parse test results JSON file."""
     with open(filepath, 'r') as f:
         return json.load(f)
 
+class _JSONStream:
+    """Reads consecutive JSON values from a file without loading all of it"""
+
+    def __init__(self, f, chunk_size: int = 64 * 1024):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = 0) -> bool:
+        data = self.f.read(max(size, self.chunk_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next value, reading more of the file until it is complete.
+
+        A failed decode restarts from the value's first character, so the
+        unread part of the buffer is doubled before each retry. A value of n
+        characters is then decoded O(log n) times and copied O(n) in total.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(len(self.buffer) - self.pos)
+
+def iter_report(filepath: str) -> Iterator[Tuple[str, Any]]:
+    """(key, value) for each top-level entry of a pytest JSON report; "tests" is yielded one test at a time"""
+    with open(filepath, 'r') as f:
+        stream = _JSONStream(f)
+        stream.expect("{")
+        while stream.peek() not in ("}", ""):
+            key = stream.value()
+            stream.expect(":")
+            if key == "tests" and stream.peek() == "[":
+                stream.expect("[")
+                while stream.peek() != "]":
+                    yield "tests", stream.value()
+                    if stream.peek() == ",":
+                        stream.expect(",")
+                stream.expect("]")
+            else:
+                yield key, stream.value()
+            if stream.peek() == ",":
+                stream.expect(",")
+        stream.expect("}")
+
+def load_test_summary(filepath: str) -> Dict[str, Any]:
+    """The parts of a test report the message needs, read by streaming.
+
+    Only the summary, collectors and the nodeid/outcome of failed or errored
+    tests are kept, so per-test logs and tracebacks are never held in memory.
+    """
+    data: Dict[str, Any] = {"tests": []}
+    for key, value in iter_report(filepath):
+        if key == "tests":
+            if value.get("outcome") in ("failed", "error"):
+                data["tests"].append({"nodeid": value.get("nodeid", "unknown"), "outcome": value["outcome"]})
+        elif key in ("summary", "collectors"):
+            data[key] = value
+    return data
+
 def format_failure_message(data: Dict[str, Any], repository: str) -> str:
     """Format the failure message with numbered failed tests."""
     summary = data.get('summary', {})
@@ -71,53 +172,168 @@ def format_failure_message(data: Dict[str, Any], repository: str) -> str:
     
     return "\n".join(message_lines)
 
+def split_message(message: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split message into chunks of at most limit characters, at line breaks where possible"""
+    chunks, current = [], ""
+    for line in message.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+class DiscordWebhook:
+    """Sends messages to one webhook over a reused session.
+
+    Messages passed to notify() within coalesce_seconds of each other are
+    joined and sent together. Each message is split to the 2000-character
+    limit. A 429 is retried after its retry_after. When the rate-limit
+    headers say the bucket is empty, the next send waits for the reset.
+    Server errors are retried with backoff, up to max_retries times per chunk.
+    """
+
+    def __init__(self, url: str, session: Optional[requests.Session] = None,
+                 coalesce_seconds: float = 0.0, max_retries: int = 5, timeout: float = 10.0):
+        self.url = url
+        self.session = session or requests.Session()
+        self.coalesce_seconds = coalesce_seconds
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.failed = False
+        self._pending: List[str] = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    def _wait_for_bucket(self):
+        delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _track_bucket(self, response):
+        headers = getattr(response, "headers", None) or {}
+        if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset-After"):
+            self._blocked_until = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+
+    def _post(self, content: str) -> bool:
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_bucket()
+            try:
+                response = self.session.post(self.url, json={"content": content}, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Error sending Discord notification: {e}", file=sys.stderr)
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            self._track_bucket(response)
+            if response.status_code == 429:
+                try:
+                    retry_after = float(response.json().get("retry_after", 1.0))
+                except ValueError:
+                    retry_after = float(response.headers.get("Retry-After", 1.0))
+                print(f"Discord rate limited; retrying in {retry_after:.2f}s", file=sys.stderr)
+                time.sleep(retry_after)
+                continue
+            if response.status_code >= 500:
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            try:
+                response.raise_for_status()
+                return True
+            except requests.RequestException as e:
+                print(f"Error sending Discord notification: {e}", file=sys.stderr)
+                return False
+        print(f"Error sending Discord notification: gave up after {self.max_retries} retries", file=sys.stderr)
+        return False
+
+    def send(self, message: str) -> bool:
+        """Send message now, in as many chunks as it needs; False if any chunk failed"""
+        with self._send_lock:
+            ok = all([self._post(chunk) for chunk in split_message(message)])
+        if not ok:
+            self.failed = True
+        return ok
+
+    def notify(self, message: str):
+        """Queue message; it is sent with any others queued within coalesce_seconds"""
+        with self._lock:
+            self._pending.append(message)
+            if self.coalesce_seconds > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.coalesce_seconds, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self) -> bool:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, []
+        if not pending:
+            return not self.failed
+        return self.send("\n\n".join(pending))
+
+    def close(self) -> bool:
+        """Send anything still queued and close the session; False if any send failed"""
+        ok = self.flush()
+        self.session.close()
+        return ok and not self.failed
+
 def send_discord_notification(message: str, webhook_url: str) -> bool:
-    """Send message to Discord via webhook."""
-    payload = {"content": message}
-    
+    """Send message to Discord via webhook, split to the message limit."""
+    webhook = DiscordWebhook(webhook_url)
     try:
-        response = requests.post(
-            webhook_url,
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()
-        return True
-    except requests.RequestException as e:
-        print(f"Error sending Discord notification: {e}", file=sys.stderr)
-        return False
+        return webhook.send(message)
+    finally:
+        webhook.session.close()
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python discord_notifier.py <test_results.json> <repository_name>", file=sys.stderr)
+    if len(sys.argv) < 3:
+        print("Usage: python discord_notifier.py <test_results.json>... <repository_name>", file=sys.stderr)
         sys.exit(1)
     
-    test_results_file = sys.argv[1]
-    repository = sys.argv[2]
+    test_results_files = sys.argv[1:-1]
+    repository = sys.argv[-1]
     webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
     
     if not webhook_url:
         print("Error: DISCORD_WEBHOOK_URL environment variable not set", file=sys.stderr)
         sys.exit(1)
     
+    webhook = DiscordWebhook(webhook_url, coalesce_seconds=float(os.getenv('DISCORD_COALESCE_SECONDS', '2')))
     try:
-        # Load test results
-        test_data = load_test_results(test_results_file)
-        
-        # Format message
-        message = format_failure_message(test_data, repository)
-        
-        # Send to Discord
-        if send_discord_notification(message, webhook_url):
-            print("Discord notification sent successfully")
-        else:
-            sys.exit(1)
+        for test_results_file in test_results_files:
+            # Load test results (streamed; only failures are kept)
+            test_data = load_test_summary(test_results_file)
+            
+            # Queue the message; reports finished close together share a send
+            webhook.notify(format_failure_message(test_data, repository))
             
     except FileNotFoundError:
         print(f"Error: Test results file '{test_results_file}' not found", file=sys.stderr)
+        webhook.close()
         sys.exit(1)
     except json.JSONDecodeError as e:
         print(f"Error parsing test results JSON: {e}", file=sys.stderr)
+        webhook.close()
+        sys.exit(1)
+    
+    # Send whatever is still queued
+    if webhook.close():
+        print("Discord notification sent successfully")
+    else:
         sys.exit(1)
 
 if __name__ == "__main__":
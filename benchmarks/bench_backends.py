@@ -0,0 +1,74 @@
+"""
+Compare local backends (transformers pipeline vs ONNX Runtime) on the same prompts.
+Usage: python benchmarks/bench_backends.py [--model HuggingFaceTB/SmolLM2-360M-Instruct] [--onnx-path onnx/bench] [--tokens 48]
+
+Each backend runs in its own process so its load time and peak memory are
+measured in isolation. Reports load seconds, tokens/sec and peak RSS.
+"""
+
+import argparse, multiprocessing, os, queue, sys, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+MESSAGES = [
+    [{"role": "system", "content": "You are Diogenes."}, {"role": "user", "content": "What is virtue?"}],
+    [{"role": "system", "content": "You are Socrates."}, {"role": "user", "content": "What is justice?"}],
+    [{"role": "system", "content": "You are Epicurus."}, {"role": "user", "content": "How should one live?"}],
+]
+
+def run_backend(spec, tokens, results):
+    from model_manager import CancellationToken, create_backend
+    from ui_image_scraper import peak_rss_mb
+
+    backend = create_backend(spec)
+    start = time.perf_counter()
+    backend.load_model()
+    load_seconds = time.perf_counter() - start
+    if not backend.is_ready():
+        results.put((spec["type"], None))
+        return
+    # Warm up
+    for _ in backend.generate(MESSAGES[0], max_tokens=4):
+        pass
+    generated = 0
+    start = time.perf_counter()
+    for messages in MESSAGES:
+        token = CancellationToken()
+        for _ in backend.generate(messages, max_tokens=tokens, cancel_token=token):
+            pass
+        generated += token.generated_tokens
+    elapsed = time.perf_counter() - start
+    results.put((spec["type"], (load_seconds, generated / elapsed, peak_rss_mb())))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default="HuggingFaceTB/SmolLM2-360M-Instruct")
+    parser.add_argument('--onnx-path', default=os.path.join("onnx", "bench"))
+    parser.add_argument('--tokens', type=int, default=48)
+    args = parser.parse_args()
+
+    specs = [
+        {"type": "transformers", "model_name": args.model},
+        {"type": "onnx", "model": args.model, "path": args.onnx_path, "export": True},
+    ]
+    context = multiprocessing.get_context("spawn")
+    print(f"{'backend':<14}{'load s':>9}{'tok/s':>9}{'peak MB':>10}")
+    for spec in specs:
+        results = context.Queue()
+        process = context.Process(target=run_backend, args=(spec, args.tokens, results))
+        process.start()
+        process.join()
+        try:
+            _, stats = results.get(timeout=1)
+        except queue.Empty:
+            stats = None
+        name = spec["type"]
+        if stats is None:
+            print(f"{name:<14}{'failed to load':>28}")
+            continue
+        load_seconds, rate, peak = stats
+        peak_text = f"{peak:.0f}" if peak is not None else "n/a"
+        print(f"{name:<14}{load_seconds:>9.1f}{rate:>9.2f}{peak_text:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Measure ChatHandler's per-request overhead with a backend that costs nothing.
+Usage: python benchmarks/bench_chat_handler.py [--requests 2000] [--history 0 10 50] [--personas 1 6 50] [--baseline benchmarks/chat_handler_baseline.json] [--update] [--threshold 0.25]
+
+A null local model streams a fixed set of chunks instantly, so everything
+measured is framework cost: persona resolution and grounding, message
+building, metrics, timing_decorator, logging and response assembly. For each
+(history length, persona count) it reports microseconds per respond() call,
+the share of that spent outside the backend, and the peak memory allocated
+per request (tracemalloc). stdout is discarded while measuring, as it would
+go to a log rather than a terminal.
+
+With --baseline, results are compared with the saved JSON and the script
+exits non-zero if any case got slower (or allocates more) by more than
+--threshold; the baseline is written if it doesn't exist yet, or with --update.
+"""
+
+import argparse, contextlib, copy, json, os, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from config_manager import ConfigManager
+from model_manager import ModelInterface, ModelManager
+from chat_handler import ChatHandler
+
+CHUNKS = ["Get ", "out ", "of ", "my ", "sun", "."] * 4
+
+class NullModel(ModelInterface):
+    def is_ready(self): return True
+    def is_loading(self): return False
+
+    def generate(self, messages, cancel_token=None, **kwargs):
+        yield from CHUNKS
+
+def make_prompts(prompts, count):
+    """count personas, cycling through the real ones under new names"""
+    personas = list(prompts.values())
+    return {f"Persona{i}": copy.deepcopy(personas[i % len(personas)]) for i in range(count)}
+
+def make_history(length):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"Turn {i}: what is virtue, really?"}
+            for i in range(length)]
+
+def measure(handler, history, gallery, requests):
+    """(microseconds per request, microseconds per backend-only run, peak KB per request)"""
+    def once():
+        for _ in handler.respond("Why do you live in a barrel?", history, gallery, 64, 0.7, 0.9, "local"):
+            pass
+
+    for _ in range(min(50, requests)):
+        once()
+    start = time.perf_counter()
+    for _ in range(requests):
+        once()
+    per_request = (time.perf_counter() - start) / requests * 1e6
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        for _ in NullModel().generate([]):
+            pass
+    per_backend = (time.perf_counter() - start) / requests * 1e6
+
+    tracemalloc.start()
+    once()
+    peaks = []
+    for _ in range(min(200, requests)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        once()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return per_request, per_backend, sorted(peaks)[len(peaks) // 2] / 1024
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, current in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        for metric in ("us_per_request", "peak_kb_per_request"):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{case} {metric}: {previous[metric]:.1f} -> {current[metric]:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--history', type=int, nargs='+', default=[0, 10, 50])
+    parser.add_argument('--personas', type=int, nargs='+', default=[1, 6, 50])
+    parser.add_argument('--baseline', help="JSON file of previous results to compare against")
+    parser.add_argument('--update', action='store_true', help="Overwrite the baseline with these results")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed slowdown/growth before a case counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    config_manager = ConfigManager()
+    config = copy.deepcopy(config_manager.load_config())
+    config["history_limit"] = max(args.history + [1])
+    prompts = config_manager.load_prompts()
+
+    results = {}
+    devnull = open(os.devnull, "w")
+    print(f"{'history':>8}{'personas':>9}{'us/req':>10}{'overhead':>10}{'peak KB':>9}")
+    for persona_count in args.personas:
+        with contextlib.redirect_stdout(devnull):
+            handler = ChatHandler(ModelManager(config, local_model=NullModel()), config,
+                                  make_prompts(prompts, persona_count))
+        gallery = f"images/Persona{persona_count - 1}.jpg"
+        for length in args.history:
+            with contextlib.redirect_stdout(devnull):
+                per_request, per_backend, peak_kb = measure(handler, make_history(length), gallery,
+                                                            args.requests)
+            overhead = 1 - per_backend / per_request
+            results[f"history={length},personas={persona_count}"] = {
+                "us_per_request": round(per_request, 2),
+                "us_backend": round(per_backend, 2),
+                "peak_kb_per_request": round(peak_kb, 2),
+            }
+            print(f"{length:>8}{persona_count:>9}{per_request:>10.1f}{overhead:>10.1%}{peak_kb:>9.1f}")
+    devnull.close()
+
+    if not args.baseline:
+        return
+    if args.update or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark serial vs process-pool image transforms.
+Usage: python benchmarks/bench_image_transforms.py [--images 12] [--size 4000x3000] [--workers 2 4]
+
+Generates a fixture set of large noisy JPEGs, then runs the scraper's
+transform stage over them serially and with each requested worker count.
+"""
+
+import argparse, io, os, sys, tempfile, time
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from ui_image_scraper import UIImageScraper, transform_images
+
+def make_fixture_images(count, size):
+    """Create noisy JPEGs (noise keeps the encoder and resampler honest)."""
+    images = []
+    for i in range(count):
+        image = Image.effect_noise(size, 64 + i).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+def run(sources, settings, workers, output_dir):
+    jobs = [(source, os.path.join(output_dir, f"{workers}_{i}.jpg")) for i, source in enumerate(sources)]
+    start = time.perf_counter()
+    transform_images(jobs, settings, workers=workers)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=12)
+    parser.add_argument('--size', default='4000x3000')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument('--no-draft', action='store_true', help="Decode at full resolution")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    settings = UIImageScraper()._transform_settings()
+    settings["draft_decode"] = not args.no_draft
+
+    print(f"Generating {args.images} fixture images at {size[0]}x{size[1]}...")
+    sources = make_fixture_images(args.images, size)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        baseline = run(sources, settings, 0, output_dir)
+        print(f"{'mode':<12}{'seconds':>10}{'img/s':>10}{'speedup':>10}")
+        print(f"{'serial':<12}{baseline:>10.3f}{args.images / baseline:>10.2f}{1.0:>10.2f}")
+        for workers in sorted(set(w for w in args.workers if w > 1)):
+            elapsed = run(sources, settings, workers, output_dir)
+            print(f"{f'{workers} procs':<12}{elapsed:>10.3f}{args.images / elapsed:>10.2f}"
+                  f"{baseline / elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
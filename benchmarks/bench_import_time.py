@@ -0,0 +1,68 @@
+"""
+Check the import cost of the src modules against a budget using -X importtime.
+Usage: python benchmarks/bench_import_time.py [--modules chat_handler model_manager ...] [--budget-ms 500] [--top 5]
+
+Each module is imported in a fresh interpreter. Reports the total import
+time, the slowest imports underneath it (by their own time) and whether a
+heavy package (gradio, torch, transformers) was pulled in. Exits 1 if any
+module is over budget or loads a heavy package. ui_factory builds the UI
+and needs gradio, so it is left out by default; if named explicitly it is
+only checked against the budget.
+"""
+
+import argparse, os, re, subprocess, sys
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+HEAVY = ("gradio", "torch", "transformers")
+LIGHTWEIGHT = [
+    "app", "chat_handler", "config_manager", "conversation_store", "drain", "health", "model_manager",
+    "model_server", "onnx_backend", "persona_retrieval", "prefork", "replay_backend",
+    "resource_governor", "router_gateway", "scheduler", "startup", "streaming", "ui_image_scraper",
+]
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def import_profile(module):
+    """[(self us, cumulative us, depth, name)] for importing module in a fresh interpreter"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SRC, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append((int(match.group(1)), int(match.group(2)), len(match.group(3)), match.group(4)))
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=LIGHTWEIGHT)
+    parser.add_argument('--budget-ms', type=float, default=500.0)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<20}{'total ms':>10}  heavy packages / slowest imports (self ms)")
+    for module in args.modules:
+        entries = import_profile(module)
+        # Top-level entries (depth 1) are everything the interpreter imported for this statement
+        total_ms = sum(cumulative for _, cumulative, depth, _ in entries if depth == 1) / 1000
+        heavy = sorted({name for *_, name in entries if name in HEAVY})
+        slowest = sorted(entries, reverse=True)[:args.top]
+        print(f"{module:<20}{total_ms:>10.1f}  {', '.join(heavy) or '-'}")
+        for self_us, _, _, name in slowest:
+            print(f"{'':<32}{self_us / 1000:>8.1f}  {name}")
+        if total_ms > args.budget_ms:
+            failures.append(f"{module} took {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        if heavy and module != "ui_factory":
+            failures.append(f"{module} imports {', '.join(heavy)}")
+
+    if failures:
+        print("Import budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All modules within {args.budget_ms:.0f} ms")
+
+if __name__ == "__main__":
+    main()
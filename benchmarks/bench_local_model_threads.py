@@ -0,0 +1,77 @@
+"""
+Sweep torch thread counts against concurrent local generations.
+Usage: python benchmarks/bench_local_model_threads.py [--threads 4 8 16] [--concurrency 1 2 4] [--requests 8]
+
+Loads the configured local model once, then for each (intra-op threads,
+concurrency) pair runs a fixed batch of generations through the resource
+governor's slots and reports throughput and latency.
+"""
+
+import argparse, os, statistics, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from config_manager import ConfigManager
+from model_manager import LocalModel
+from resource_governor import ResourceGovernor, available_cores
+
+MESSAGES = [
+    {"role": "system", "content": "You are a friendly Chatbot."},
+    {"role": "user", "content": "In one sentence, what is the good life?"},
+]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(model, governor, requests, max_tokens):
+    def one(_):
+        start = time.perf_counter()
+        with governor.generation_slot():
+            for _token in model.generate(MESSAGES, max_tokens=max_tokens):
+                pass
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    # More submitters than slots, like Gradio's worker threads
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    return time.perf_counter() - start, latencies
+
+def main():
+    cores = len(available_cores())
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[max(1, cores // 4), max(1, cores // 2), cores])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--max-tokens', type=int, default=32)
+    parser.add_argument('--model', default=None, help="Defaults to model.local_model_name")
+    args = parser.parse_args()
+
+    import torch
+
+    config = ConfigManager().load_config()
+    model = LocalModel(args.model or config["model"]["local_model_name"])
+    model.load_model()
+    if not model.is_ready():
+        sys.exit("Local model failed to load")
+
+    # Warm up once so the first row doesn't pay for lazy initialisation
+    for _token in model.generate(MESSAGES, max_tokens=4):
+        pass
+
+    print(f"{cores} cores, {args.requests} requests of {args.max_tokens} tokens per run")
+    print(f"{'threads':>8}{'concur':>8}{'oversub':>9}{'req/s':>9}{'p50 s':>9}{'p95 s':>9}")
+    for threads in args.threads:
+        for concurrency in args.concurrency:
+            governor = ResourceGovernor({"intra_op_threads": threads,
+                                         "max_concurrent_generations": concurrency})
+            torch.set_num_threads(threads)
+            elapsed, latencies = run(model, governor, args.requests, args.max_tokens)
+            print(f"{threads:>8}{concurrency:>8}{threads * concurrency / cores:>9.2f}"
+                  f"{args.requests / elapsed:>9.2f}{statistics.median(latencies):>9.2f}"
+                  f"{percentile(latencies, 0.95):>9.2f}")
+
+if __name__ == "__main__":
+    main()
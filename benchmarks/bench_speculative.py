@@ -0,0 +1,87 @@
+"""
+Benchmark plain vs speculative (assisted) decoding for the local model.
+Usage: python benchmarks/bench_speculative.py --model ./models/SmolLM2-360M --draft ./models/SmolLM2-135M [--tokens 64] [--assistant-tokens 3 5 8]
+
+Runs offline against locally stored models (HF_HUB_OFFLINE is set). For each
+prompt it generates with the main model alone and then with the draft model
+assisting, and reports tokens/sec, speedup and the draft acceptance rate.
+--greedy also checks that greedy outputs are identical in both modes; with
+sampling the outputs differ run to run but follow the same distribution.
+"""
+
+import argparse, os, sys, time
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from model_manager import LocalModel, _stopping_criteria
+
+PROMPTS = [
+    "system: You are Diogenes.\nuser: What is virtue?\nDiogenes:",
+    "system: You are Socrates.\nuser: Is the unexamined life worth living?\nSocrates:",
+    "system: You are a friendly Chatbot.\nuser: Describe the agora of Athens.\nassistant:",
+]
+
+def generate(model, prompt, tokens, greedy, assistant):
+    """Returns (generated token ids, seconds, (draft tokens proposed, accepted))"""
+    model._reset_passes()
+    inputs = model.pipe.tokenizer(prompt, return_tensors="pt")
+    kwargs = {"do_sample": False} if greedy else {"do_sample": True, "temperature": 0.7, "top_p": 0.9}
+    if assistant:
+        kwargs.update(model._assisted_kwargs())
+        kwargs["stopping_criteria"] = _stopping_criteria(lambda: False, model._count_step)
+    start = time.perf_counter()
+    output = model.pipe.model.generate(**inputs, max_new_tokens=tokens, min_new_tokens=tokens,
+                                       pad_token_id=model.pipe.tokenizer.eos_token_id, **kwargs)
+    elapsed = time.perf_counter() - start
+    generated = output[0, inputs["input_ids"].shape[-1]:].tolist()
+    return generated, elapsed, model.acceptance()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', required=True, help="Path to the main model")
+    parser.add_argument('--draft', required=True, help="Path to the draft model (same tokenizer)")
+    parser.add_argument('--tokens', type=int, default=64)
+    parser.add_argument('--assistant-tokens', type=int, nargs='+', default=[5])
+    parser.add_argument('--greedy', action='store_true', help="Greedy decoding; verify identical outputs")
+    args = parser.parse_args()
+
+    model = LocalModel(args.model, draft_model_name=args.draft)
+    model.load_model()
+    if not model.is_ready():
+        sys.exit("Models failed to load")
+
+    # Warm up both paths once
+    generate(model, PROMPTS[0], 4, True, False)
+    generate(model, PROMPTS[0], 4, True, True)
+
+    print(f"{'mode':<14}{'tok/s':>9}{'speedup':>9}{'accept':>9}{'match':>7}")
+    baseline_tokens = baseline_time = 0
+    baseline_outputs = []
+    for prompt in PROMPTS:
+        generated, elapsed, _ = generate(model, prompt, args.tokens, args.greedy, False)
+        baseline_outputs.append(generated)
+        baseline_tokens += len(generated)
+        baseline_time += elapsed
+    baseline_rate = baseline_tokens / baseline_time
+    print(f"{'plain':<14}{baseline_rate:>9.2f}{1.0:>9.2f}{'-':>9}{'-':>7}")
+
+    for assistant_tokens in args.assistant_tokens:
+        model.num_assistant_tokens = assistant_tokens
+        total_tokens = total_time = proposed = accepted = 0
+        matches = True
+        for prompt, expected in zip(PROMPTS, baseline_outputs):
+            generated, elapsed, (step_proposed, step_accepted) = generate(
+                model, prompt, args.tokens, args.greedy, True)
+            total_tokens += len(generated)
+            total_time += elapsed
+            proposed += step_proposed
+            accepted += step_accepted
+            matches = matches and generated == expected
+        rate = total_tokens / total_time
+        match = ("yes" if matches else "NO") if args.greedy else "-"
+        print(f"{f'assisted k={assistant_tokens}':<14}{rate:>9.2f}{rate / baseline_rate:>9.2f}"
+              f"{accepted / max(1, proposed):>9.2f}{match:>7}")
+
+if __name__ == "__main__":
+    main()
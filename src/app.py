@@ -1,5 +1,4 @@
 import os, sys
-from prometheus_client import start_http_server
 
 
 # Add the src directory to Python path to ensure imports work
@@ -10,25 +9,86 @@ from prometheus_client import start_http_server
 #     sys.path.insert(0, src_dir)
 
 
-from config_manager import ConfigManager
+from config_manager import ConfigManager, ConfigWatcher
+from drain import DrainController
 from model_manager import ModelManager
-from chat_handler import ChatHandler
-from ui_factory import UIFactory
+from health import HealthServer
+from startup import StartupStages, preload_modules
+from ui_image_scraper import UIImageScraper
 
 class ChatApp:
     """Main application class"""
     
-    def __init__(self, script_dir: str = None):
+    def __init__(self, script_dir: str = None, local_model=None):
+        # Startup runs as overlapping stages: gradio imports, local model
+        # loading and image fetching proceed in the background while the
+        # config is read, and the UI is built as soon as gradio is importable.
+        self.startup = StartupStages()
         self.config_manager = ConfigManager(script_dir)
-        self.config = self.config_manager.load_config()
-        self.prompts = self.config_manager.load_prompts()
-        self.css = self.config_manager.load_css()
+        self.config = self.startup.run("config", self.config_manager.load_config)
+        startup_config = self.config.get("startup", {})
+
+        self.startup.start("import_ui", preload_modules, ["gradio"])
+        if startup_config.get("preload_modules"):
+            self.startup.start("import_extra", preload_modules, startup_config["preload_modules"])
+
+        self.prompts = self.startup.run("prompts", self.config_manager.load_prompts)
+        self.css = self.startup.run("css", self.config_manager.load_css)
         
-        self.model_manager = ModelManager(self.config)
+        self.model_manager = ModelManager(self.config, local_model=local_model)
+        if startup_config.get("preload_local_model", True):
+            self.startup.track("model_load", self.model_manager.start_model_loading())
+
+        self.scraper = UIImageScraper()
+        self.startup.start("assets", self.scraper.download_images_to_local)
+
+        self.startup.wait("import_ui")
+        from chat_handler import ChatHandler
+        from ui_factory import UIFactory
+
         self.chat_handler = ChatHandler(self.model_manager, self.config, self.prompts)
+
+        # Finishes in-flight streams before exiting (SIGTERM or POST /drain)
+        self.drain = DrainController(self.chat_handler,
+                                     self.config.get("drain", {}).get("deadline_seconds", 25))
+
+        # Pick up edits to app_config.json / app_prompts.json without a restart
+        # (and without reloading the local model). The UI layout, CSS and slider
+        # defaults are built once and still need a restart.
+        self.config_watcher = None
+        reload_config = self.config.get("config_reload", {})
+        if reload_config.get("enabled", False):
+            self.config_watcher = ConfigWatcher(self.config_manager, reload_config.get("poll_seconds", 2.0))
+            self.config_watcher.subscribe(self._apply_config)
+            self.config_watcher.start()
         
-        self.chatbot = UIFactory.create_chatbot_interface(self.chat_handler, self.config)
+        # Give the asset stage a moment (a warm cache finishes in milliseconds);
+        # otherwise come up with placeholders and swap the images in later
+        image_paths = self._asset_paths(startup_config.get("asset_wait_seconds", 2.0))
+        self.chatbot = self.startup.run(
+            "build_ui", UIFactory.create_chatbot_interface,
+            self.chat_handler, self.config,
+            image_paths=image_paths,
+            pending_images=None if image_paths is not None else (lambda: self._asset_paths(0)),
+            scraper=self.scraper
+        )
         self.demo = UIFactory.create_main_interface(self.chatbot, self.config, self.css)
+
+        self.startup.mark_ui_ready()
+        self.startup.report_when_done()
+
+    def _apply_config(self, config, prompts):
+        self.config, self.prompts = config, prompts
+        self.model_manager.apply_config(config)
+        self.chat_handler.apply_config(config, prompts)
+
+    def _asset_paths(self, timeout: float):
+        """Processed image paths, or None if the asset stage is still running"""
+        try:
+            return self.startup.wait("assets", timeout)
+        except Exception:
+            # Fetching failed outright; show whatever the gallery can without images
+            return []
     
     def launch(self, **kwargs):
         """Launch the application"""
@@ -39,8 +99,14 @@ class ChatApp:
         self.demo.launch(**kwargs)
 
 if __name__ == "__main__":
-    # Start Prometheus metrics server on port 8000
-    start_http_server(8000)
+    # Start Prometheus metrics and health endpoints on port 8000
+    health_server = HealthServer(port=8000).start()
     # Start the chat application
     app = ChatApp()
+    # Drain instead of dying when the container is replaced
+    app.drain.install_signal_handler()
+    health_server.attach(app.model_manager, app.chat_handler, app.config, drain_controller=app.drain)
+    if app.config_watcher is not None:
+        app.config_watcher.subscribe(
+            lambda config, prompts: health_server.attach(app.model_manager, app.chat_handler, config))
     app.launch()
@@ -1,10 +1,30 @@
 
 
-from typing import List, Dict, Generator, Optional, Any
-import gradio as gr
-from model_manager import ModelManager
-import time, os, datetime
-from prometheus_client import Counter, Summary
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Dict, Generator, Optional, Any, Union
+from model_manager import ModelManager, CancellationToken
+from scheduler import Throttled
+from conversation_store import ConversationStore, HISTORY_PAYLOAD_BYTES, history_payload_size
+from streaming import ResponseAssembler
+from persona_retrieval import PersonaIndex
+from drain import DRAIN_REQUESTS
+import time, os, datetime, threading
+from prometheus_client import Counter, Summary, Gauge
+
+if TYPE_CHECKING:
+    # Only needed for annotations; importing gradio costs seconds, so the
+    # batch tools and tests that use ChatHandler don't pay for it
+    import gradio as gr
+
+def bind_gradio_annotations():
+    """Make gr resolvable in this module's annotations.
+
+    Gradio injects gr.Request and gr.OAuthToken into respond() by resolving
+    its type hints against this module, so the UI calls this once gradio
+    has been imported.
+    """
+    global gr
+    import gradio as gr
 
 # Prometheus metrics definitions
 REQUEST_COUNTER = Counter('app_requests_total', 'Total number of requests')
@@ -31,12 +51,37 @@ API_MODEL_REQUESTS = Counter(
     'Total number of requests handled by the API model'
 )
 
+# Counter labeled by backend name for requests routed to each configured backend
+BACKEND_REQUESTS = Counter(
+    'app_backend_requests_total',
+    'Total number of requests handled by each backend',
+    ['backend']
+)
+
 # Summary for time taken to generate a response from local model
 LOCAL_MODEL_REQUEST_DURATION = Summary(
     'app_local_model_request_duration_seconds',
     'Time spent generating responses from the local model'
 )
 
+# Counter for requests abandoned by the client (closed tab, stop button, dropped connection)
+CANCELLED_REQUESTS = Counter(
+    'app_cancelled_requests_total',
+    'Total number of requests cancelled before the response finished'
+)
+
+# Counter for generation budget (max_tokens) that cancellation saved from being generated
+CANCELLED_TOKENS_SAVED = Counter(
+    'app_cancelled_tokens_saved_total',
+    'Tokens of the requested max_tokens budget not generated because the request was cancelled'
+)
+
+# Gauge for requests currently being answered (used for readiness/saturation)
+IN_FLIGHT_REQUESTS = Gauge(
+    'app_in_flight_requests',
+    'Number of chat requests currently being processed'
+)
+
 # Completly generated using GitHub Copilot
 def timing_decorator(func):
     def wrapper(*args, **kwargs):
@@ -76,31 +121,153 @@ class ChatHandler:
     
     def __init__(self, model_manager: ModelManager, config: Dict[str, Any], prompts: Dict[str, Any]):
         self.model_manager = model_manager
-        self.config = config
-        self.prompts = prompts
+        # (config, prompts, system prompt per persona, few-shot index), swapped as one on reload
+        self._settings = (config, prompts, {}, PersonaIndex.from_config(config, prompts))
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Cancellation tokens of the requests being processed, with their
+        # conversation id, for drain mode and the stop button
+        self._active_tokens: Dict[CancellationToken, Optional[str]] = {}
+        self.draining = False
+        store_config = config.get("conversation_store", {})
+        # Optional server-side copy of each session's turns, used instead of the client's history
+        self.conversations = ConversationStore(store_config) if store_config.get("enabled", False) else None
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._settings[0]
+
+    @property
+    def prompts(self) -> Dict[str, Any]:
+        return self._settings[1]
+
+    def apply_config(self, config: Dict[str, Any], prompts: Dict[str, Any]):
+        """Use new config and prompts for requests that start from now on.
+
+        Requests already streaming keep the snapshot they started with, and
+        the cached persona system prompts and few-shot index are rebuilt from
+        the new prompts.
+        """
+        self._settings = (config, prompts, {}, PersonaIndex.from_config(config, prompts))
+        print("[CONFIG] Chat handler now using reloaded config and prompts")
+
+    def system_prompt(self, philosopher: Optional[str]) -> str:
+        """Cached system prompt (introduction) for a persona"""
+        _, prompts, system_prompts, _ = self._settings
+        cached = system_prompts.get(philosopher)
+        if cached is None:
+            cached = ""
+            if philosopher and prompts and philosopher in prompts:
+                cached = prompts[philosopher].get("introduction", "")
+            system_prompts[philosopher] = cached
+        return cached
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests currently being processed"""
+        return self._in_flight
+
+    def _track_in_flight(self, delta: int, cancel_token: Optional[CancellationToken] = None):
+        with self._in_flight_lock:
+            self._in_flight += delta
+            if cancel_token is not None:
+                if delta > 0:
+                    self._active_tokens[cancel_token] = None
+                else:
+                    self._active_tokens.pop(cancel_token, None)
+        IN_FLIGHT_REQUESTS.inc(delta)
+
+    def try_admit(self, cancel_token: Optional[CancellationToken] = None,
+                  conversation_id: Optional[str] = None) -> bool:
+        """Count a request as in flight, unless draining. The check and the
+        increment happen under one lock, so a drain can't miss a request
+        that got past the check."""
+        with self._in_flight_lock:
+            if self.draining:
+                return False
+            self._in_flight += 1
+            if cancel_token is not None:
+                self._active_tokens[cancel_token] = conversation_id
+        IN_FLIGHT_REQUESTS.inc()
+        return True
+
+    def begin_drain(self) -> int:
+        """Turn away new requests from now on; returns how many are still in flight"""
+        with self._in_flight_lock:
+            self.draining = True
+            return self._in_flight
+
+    def cancel_all(self):
+        """Cancel every request in flight (used when a drain reaches its deadline)"""
+        with self._in_flight_lock:
+            tokens = list(self._active_tokens)
+        for token in tokens:
+            token.cancel()
+
+    def cancel(self, request: Optional[gr.Request]) -> int:
+        """Cancel the session's requests in flight (the stop button); returns how many"""
+        conversation_id = self.conversation_id(request)
+        if conversation_id is None:
+            return 0
+        with self._in_flight_lock:
+            tokens = [token for token, owner in self._active_tokens.items() if owner == conversation_id]
+        for token in tokens:
+            token.cancel()
+        return len(tokens)
     
     def build_messages(self, message: str, history: List[Dict[str, str]], 
-                      system_prompt: str) -> List[Dict[str, str]]:
+                      system_prompt: str, config: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
         """Build message list from history and current message, using system_prompt from prompt_config"""
+        config = config or self.config
         messages = [{"role": "system", "content": system_prompt}]
-        if self.config["history_limit"] > 0: # -1 means no memory
-            messages.extend(history[-self.config["history_limit"]:])
+        if config["history_limit"] > 0: # -1 means no memory
+            messages.extend(history[-config["history_limit"]:])
         messages.append({"role": "user", "content": message})
         return messages
     
     def respond(self, 
                 message: str, 
-                history: List[Dict[str, str]], 
+                history: Optional[List[Dict[str, str]]], 
                 gallery: Any,
                 max_tokens: int, 
                 temperature: float, 
                 top_p: float, 
-                use_local_model: bool,
-                hf_token: Optional[gr.OAuthToken]) -> Generator[str, None, None]:
-        """Generate response to user message, using prompt from prompt_config based on gallery selection"""
+                backend: Union[str, bool, None] = None,
+                hf_token: Optional[gr.OAuthToken] = None,
+                request: Optional[gr.Request] = None,
+                local_model_name: Optional[str] = None,
+                use_local_model: Optional[bool] = None) -> Generator[str, None, None]:
+        """Generate response to user message, using prompt from prompt_config based on gallery selection.
+        backend names a configured backend; use_local_model (or a bool backend) picks local/api as before.
+        history is None when the client doesn't send one and the conversation store supplies it."""
+
+        # One snapshot for the whole request, so a config reload mid-stream
+        # doesn't change it
+        settings = self._settings
+        # Set if the client goes away, so the backend can stop generating
+        cancel_token = CancellationToken()
+        if not self.try_admit(cancel_token, self.conversation_id(request)):
+            # This replica is shutting down; the client should retry on another one
+            DRAIN_REQUESTS.labels(result="rejected").inc()
+            yield settings[0]["messages"]["draining"]
+            return
+        try:
+            yield from self._respond(settings, cancel_token, message, history, gallery, max_tokens,
+                                     temperature, top_p, backend, hf_token, request,
+                                     local_model_name, use_local_model)
+        finally:
+            self._track_in_flight(-1, cancel_token)
+
+    def _respond(self, settings, cancel_token: CancellationToken, message: str,
+                 history: Optional[List[Dict[str, str]]], gallery: Any, max_tokens: int,
+                 temperature: float, top_p: float, backend: Union[str, bool, None],
+                 hf_token: Optional[gr.OAuthToken], request: Optional[gr.Request],
+                 local_model_name: Optional[str],
+                 use_local_model: Optional[bool]) -> Generator[str, None, None]:
+        """respond() for an admitted request"""
+        config, prompts, _, persona_index = settings
 
         # Determine selected philosopher from gallery input
-        prompts = self.prompts
 
         selected_philosopher = None
         if gallery:
@@ -122,14 +289,30 @@ class ChatHandler:
             selected_philosopher = next(iter(prompts.keys()))
 
         # Get introduction/system prompt
-        system_prompt = ""
-        if selected_philosopher and prompts and selected_philosopher in prompts:
-            system_prompt = prompts[selected_philosopher].get("introduction", "")
-        messages = self.build_messages(message, history, system_prompt)
+        system_prompt = self.system_prompt(selected_philosopher)
+        if persona_index is not None:
+            # Ground the persona with the samples and attributes closest to this message
+            retrieval = config.get("persona_retrieval", {})
+            system_prompt += persona_index.grounding(
+                selected_philosopher, message,
+                token_budget=retrieval.get("token_budget", 96),
+                max_samples=retrieval.get("max_samples", 2),
+                max_attributes=retrieval.get("max_attributes", 2))
+        session_id = self.session_id(request)
+        HISTORY_PAYLOAD_BYTES.observe(history_payload_size(history or []))
+        # Callers without a session (API, batch) have nothing to key a stored conversation on
+        conversation_id = self.conversation_id(request) if self.conversations is not None else None
+        if conversation_id is not None:
+            if history is not None and not history:
+                # The client cleared the chat (or this is a new one): start over
+                self.conversations.clear(conversation_id)
+            history = self.conversations.history(conversation_id)
+        messages = self.build_messages(message, history or [], system_prompt, config)
 
         # Start metrics for this request
         REQUEST_COUNTER.inc()
-        print(f"[REQUEST] Philosopher: {selected_philosopher}, Local Model: {use_local_model}")
+        backend = self.resolve_backend(use_local_model if use_local_model is not None else backend, config)
+        print(f"[REQUEST] Philosopher: {selected_philosopher}, Backend: {backend}")
         if selected_philosopher:
             try:
                 PHILOSOPHER_COUNTER.labels(philosopher=selected_philosopher).inc()
@@ -138,85 +321,162 @@ class ChatHandler:
                 # Labels may fail if invalid; ignore metric failure
                 pass
 
+        # What the backend generated, without loading or error messages; only
+        # a completed reply is kept in the conversation store
+        reply = {"parts": [], "completed": False}
+
         # Increment local/api specific counters
-        if use_local_model:
+        BACKEND_REQUESTS.labels(backend=backend).inc()
+        if getattr(self.model_manager.backends[backend], "is_local", True):
             LOCAL_MODEL_REQUESTS.inc()
             print("[METRICS] Incremented local model request counter")
-            gen = self._handle_local_model(messages, max_tokens, temperature, top_p)
+            gen = self._handle_local_model(messages, max_tokens, temperature, top_p,
+                                           session_id=session_id,
+                                           cancel_token=cancel_token,
+                                           model_name=local_model_name,
+                                           backend=backend,
+                                           config=config,
+                                           reply=reply)
         else:
             API_MODEL_REQUESTS.inc()
             print("[METRICS] Incremented API model request counter")
-            gen = self._handle_api_model(messages, max_tokens, temperature, top_p, hf_token)
+            gen = self._handle_api_model(messages, max_tokens, temperature, top_p, hf_token,
+                                         cancel_token=cancel_token, backend=backend, config=config,
+                                         reply=reply)
 
-        # Consume the generator and return a final string to Gradio
-        # Gradio's ChatInterface expects a message-like object (not a raw generator)
-        full_response = ""
+        # Stream the accumulated response to Gradio, coalescing deltas into
+        # frames. When the user closes the tab or presses stop, Gradio stops
+        # iterating and closes this generator; GeneratorExit then cancels the
+        # backend instead of letting it run on.
+        frames = ResponseAssembler.from_config(config).stream(gen)
         with REQUEST_DURATION.time():
             print("[METRICS] Timing total request duration")
             try:
-                for chunk in gen:
-                    # Append chunk to the accumulating response. Generators may
-                    # yield incremental strings or cumulative text; append whatever
-                    # is produced.
-                    if isinstance(chunk, str):
-                        full_response += chunk
-                    else:
-                        full_response += str(chunk)
+                for frame in frames:
+                    yield frame
+                if cancel_token.cancelled:
+                    # Stopped by the stop button or a drain deadline; the backend ended early
+                    self._record_cancellation(cancel_token, max_tokens)
                 SUCCESSFUL_REQUESTS.inc()
                 print("[METRICS] Incremented successful request counter")
+                if conversation_id is not None and reply["completed"]:
+                    self.conversations.append(conversation_id, "user", message)
+                    self.conversations.append(conversation_id, "assistant", "".join(reply["parts"]))
+            except GeneratorExit:
+                cancel_token.cancel()
+                frames.close()
+                self._record_cancellation(cancel_token, max_tokens)
+                raise
             except Exception:
                 FAILED_REQUESTS.inc()
                 print("[METRICS] Incremented failed request counter")
                 raise
 
-        return full_response
+    def _record_cancellation(self, cancel_token: CancellationToken, max_tokens: int):
+        saved = max(0, max_tokens - cancel_token.generated_tokens)
+        CANCELLED_REQUESTS.inc()
+        CANCELLED_TOKENS_SAVED.inc(saved)
+        print(f"[CANCEL] Request cancelled after {cancel_token.generated_tokens} tokens; "
+              f"saved up to {saved} of {max_tokens}")
     
+    def resolve_backend(self, backend: Union[str, bool, None],
+                        config: Optional[Dict[str, Any]] = None) -> str:
+        """Backend name for a request: a configured name, True/False for local/api, or the default"""
+        if isinstance(backend, bool):
+            return "local" if backend else "api"
+        if backend in self.model_manager.backends:
+            return backend
+        defaults = (config or self.config)["defaults"]
+        return defaults.get("backend") or ("local" if defaults["use_local_model"] else "api")
+
+    @staticmethod
+    def conversation_id(request: Optional[gr.Request]) -> Optional[str]:
+        """The HF username if logged in, else the browser session; None without a request"""
+        if request is None:
+            return None
+        return getattr(request, "username", None) or getattr(request, "session_hash", None)
+
+    @staticmethod
+    def session_id(request: Optional[gr.Request]) -> str:
+        """Key used for per-session scheduling; requests without a session share "anonymous" """
+        return ChatHandler.conversation_id(request) or "anonymous"
+
+    def stored_history(self, request: Optional[gr.Request]) -> List[Dict[str, str]]:
+        """The session's turns in the conversation store (empty if it is off or there is no session)"""
+        conversation_id = self.conversation_id(request)
+        if self.conversations is None or conversation_id is None:
+            return []
+        return self.conversations.history(conversation_id)
+
+    def clear_conversation(self, request: Optional[gr.Request]):
+        conversation_id = self.conversation_id(request)
+        if self.conversations is not None and conversation_id is not None:
+            self.conversations.clear(conversation_id)
+
     @timing_decorator
     def _handle_local_model(self, messages: List[Dict[str, str]], max_tokens: int, 
-                           temperature: float, top_p: float) -> Generator[str, None, None]:
+                           temperature: float, top_p: float,
+                           session_id: str = "anonymous",
+                           cancel_token: Optional[CancellationToken] = None,
+                           model_name: Optional[str] = None,
+                           backend: str = "local",
+                           config: Optional[Dict[str, Any]] = None,
+                           reply: Optional[Dict[str, Any]] = None) -> Generator[str, None, None]:
         """Handle local model response generation"""
-        print("[MODE] local")
-        local_model = self.model_manager.local_model
-        # Check if model is still loading
-        if local_model.is_loading():
-            queued_data = {
-                'messages': messages,
-                'max_tokens': max_tokens,
-                'temperature': temperature,
-                'top_p': top_p,
-                'use_local_model': True
-            }
-            self.model_manager.queue_message(queued_data)
-            yield self.config["messages"]["loading_message"]
-            while local_model.is_loading():
-                time.sleep(1)
-            if not local_model.is_ready():
-                yield self.config["messages"]["model_load_failed"]
+        messages_config = (config or self.config)["messages"]
+        print(f"[MODE] {backend}")
+        # Reloads the model in the background if it was unloaded while idle, and
+        # keeps it resident while this request waits for the load, its scheduler
+        # turn and a generation slot (otherwise the idle reaper or the memory
+        # budget could unload it in the meantime)
+        with self.model_manager.using_backend(backend, model_name) as local_model:
+            # Check if model is still loading
+            if local_model.is_loading():
+                with self.model_manager.waiting_for_load():
+                    yield messages_config["loading_message"]
+                    while local_model.is_loading():
+                        time.sleep(1)
+                if not local_model.is_ready():
+                    yield messages_config["model_load_failed"]
+                    return
+                yield messages_config["model_ready"]
+            elif not local_model.is_ready():
+                yield messages_config["model_load_failed"]
                 return
-            yield self.config["messages"]["model_ready"]
-        elif not local_model.is_ready():
-            yield self.config["messages"]["model_load_failed"]
-            return
-        try:
-            # Time only the local model generation (not the loading messages)
-            with LOCAL_MODEL_REQUEST_DURATION.time():
-                print("[METRICS] Timing local model request duration")
-                for token in local_model.generate(
-                    messages,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=top_p,
-                ):
-                    yield token
-        except Exception as e:
-            yield f"Error generating response: {str(e)}"
+            try:
+                # Time only the local model generation (not the loading messages)
+                with self.model_manager.generation_turn(local_model, session_id, max_tokens) as turn, \
+                        LOCAL_MODEL_REQUEST_DURATION.time():
+                    print("[METRICS] Timing local model request duration")
+                    for token in local_model.generate(
+                        messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        cancel_token=cancel_token,
+                        **turn
+                    ):
+                        if reply is not None:
+                            reply["parts"].append(token)
+                        yield token
+                if reply is not None:
+                    reply["completed"] = True
+            except Throttled as e:
+                yield messages_config["rate_limited"].format(retry_after=e.retry_after)
+            except Exception as e:
+                yield f"Error generating response: {str(e)}"
     
     @timing_decorator
     def _handle_api_model(self, messages: List[Dict[str, str]], max_tokens: int,
                          temperature: float, top_p: float, 
-                         hf_token: Optional[gr.OAuthToken]) -> Generator[str, None, None]:
+                         hf_token: Optional[gr.OAuthToken],
+                         cancel_token: Optional[CancellationToken] = None,
+                         backend: str = "api",
+                         config: Optional[Dict[str, Any]] = None,
+                         reply: Optional[Dict[str, Any]] = None) -> Generator[str, None, None]:
         """Handle API model response generation"""
-        print("[MODE] api")
+        messages_config = (config or self.config)["messages"]
+        print(f"[MODE] {backend}")
         # Prefer token from Gradio login if provided, otherwise use environment variable
         token = None
         if hf_token and getattr(hf_token, "token", None):
@@ -224,18 +484,25 @@ class ChatHandler:
         else:
             token = os.environ.get("HF_TOKEN")
 
-        if not token:
+        model = self.model_manager.acquire_backend(backend)
+        if not token and getattr(model, "requires_token", True):
             # No token available; instruct user/admin to set HF_TOKEN
-            yield self.config["messages"]["login_required"]
+            yield messages_config["login_required"]
             return
 
         try:
-            yield from self.model_manager.api_model.generate(
+            for piece in model.generate(
                 messages,
                 hf_token=token,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                top_p=top_p
-            )
+                top_p=top_p,
+                cancel_token=cancel_token
+            ):
+                if reply is not None:
+                    reply["parts"].append(piece)
+                yield piece
+            if reply is not None:
+                reply["completed"] = True
         except Exception as e:
             yield f"Error generating response: {str(e)}"
@@ -1,5 +1,38 @@
-import json, os
-from typing import Dict, Any
+import json, os, threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from prometheus_client import Counter
+
+# Counter labeled by result (applied, invalid, error) for config hot reloads
+CONFIG_RELOADS = Counter(
+    'app_config_reloads_total',
+    'Reloads of app_config.json / app_prompts.json picked up while running',
+    ['result']
+)
+
+# Top-level sections the app reads without a fallback
+REQUIRED_CONFIG_KEYS = ("ui", "model", "defaults", "parameters", "history_limit", "messages")
+
+def validate_config(config: Any):
+    """Raise ValueError if config is missing anything the app needs"""
+    if not isinstance(config, dict):
+        raise ValueError("app_config.json must contain a JSON object")
+    missing = [key for key in REQUIRED_CONFIG_KEYS if key not in config]
+    if missing:
+        raise ValueError(f"app_config.json is missing {', '.join(missing)}")
+    for key in ("local_model_name", "api_model_name"):
+        if key not in config["model"]:
+            raise ValueError(f"app_config.json model section is missing {key}")
+    if not isinstance(config["messages"], dict) or \
+            not all(isinstance(text, str) for text in config["messages"].values()):
+        raise ValueError("app_config.json messages must map names to strings")
+
+def validate_prompts(prompts: Any):
+    """Raise ValueError unless prompts maps each persona to an object with a string introduction"""
+    if not isinstance(prompts, dict) or not prompts:
+        raise ValueError("app_prompts.json must contain a non-empty JSON object")
+    for name, persona in prompts.items():
+        if not isinstance(persona, dict) or not isinstance(persona.get("introduction", ""), str):
+            raise ValueError(f"app_prompts.json entry '{name}' needs a string introduction")
 
 class ConfigManager:
     """Handles loading and managing configuration files"""
@@ -18,6 +51,24 @@ class ConfigManager:
         self._config = None
         self._prompts = None
         self._css = None
+
+    def path(self, filename: str) -> str:
+        return os.path.abspath(os.path.join(self.project_root, 'cm', filename))
+
+    def reload(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Re-read config and prompts from disk and replace the cached copies.
+
+        Both files are validated before either cache changes; on any error
+        (ValueError, including bad JSON, or OSError) the old copies stay.
+        """
+        with open(self.path('app_config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        with open(self.path('app_prompts.json'), 'r', encoding='utf-8') as f:
+            prompts = json.load(f)
+        validate_config(config)
+        validate_prompts(prompts)
+        self._config, self._prompts = config, prompts
+        return config, prompts
     
     def load_config(self) -> Dict[str, Any]:
         """Load and cache configuration"""
@@ -57,3 +108,76 @@ class ConfigManager:
             with open(css_path, 'r', encoding='utf-8') as f:
                 self._css = f.read()
         return self._css
+
+
+class ConfigWatcher:
+    """Polls app_config.json and app_prompts.json and applies changes while running.
+
+    A change is reloaded through ConfigManager.reload and, if valid, passed to
+    every subscriber as (config, prompts). Subscribers swap in new objects
+    rather than mutating the old ones, so requests already in progress finish
+    with the settings they started with. Invalid edits are logged and ignored.
+    """
+
+    FILES = ('app_config.json', 'app_prompts.json')
+
+    def __init__(self, config_manager: ConfigManager, poll_seconds: float = 2.0):
+        self.config_manager = config_manager
+        self.poll_seconds = poll_seconds
+        self._subscribers: List[Callable[[Dict[str, Any], Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._mtimes = self._current_mtimes()
+
+    def _current_mtimes(self) -> Dict[str, Optional[int]]:
+        mtimes = {}
+        for filename in self.FILES:
+            try:
+                mtimes[filename] = os.stat(self.config_manager.path(filename)).st_mtime_ns
+            except OSError:
+                mtimes[filename] = None
+        return mtimes
+
+    def subscribe(self, callback: Callable[[Dict[str, Any], Dict[str, Any]], None]):
+        self._subscribers.append(callback)
+
+    def check(self) -> bool:
+        """Reload if either file changed since the last check; returns True if a reload was applied"""
+        with self._lock:
+            mtimes = self._current_mtimes()
+            if mtimes == self._mtimes:
+                return False
+            self._mtimes = mtimes
+            try:
+                config, prompts = self.config_manager.reload()
+            except (OSError, ValueError) as e:
+                CONFIG_RELOADS.labels(result="invalid").inc()
+                print(f"[CONFIG] Ignoring invalid config change: {e}")
+                return False
+            result = "applied"
+            for callback in self._subscribers:
+                try:
+                    callback(config, prompts)
+                except Exception as e:
+                    result = "error"
+                    print(f"[CONFIG] Failed to apply reloaded config: {e}")
+            CONFIG_RELOADS.labels(result=result).inc()
+            print(f"[CONFIG] Reloaded {', '.join(self.FILES)} ({result})")
+            return result == "applied"
+
+    def start(self) -> "ConfigWatcher":
+        if self._thread is None:
+            def poll():
+                while not self._stop.wait(self.poll_seconds):
+                    self.check()
+
+            self._thread = threading.Thread(target=poll, name="config-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
@@ -0,0 +1,178 @@
+import json, sqlite3, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from prometheus_client import Counter, Gauge, Summary
+
+# Summary of the size of the history payload each turn sends back from the client
+HISTORY_PAYLOAD_BYTES = Summary(
+    'app_history_payload_bytes',
+    'Size of the chat history received from the client with each turn'
+)
+
+# Gauge for bytes of conversation held in memory by the store
+CONVERSATION_STORE_BYTES = Gauge(
+    'app_conversation_store_bytes',
+    'Bytes of conversation turns held in memory by the server-side conversation store'
+)
+
+# Gauge for sessions held in memory by the store
+CONVERSATION_STORE_SESSIONS = Gauge(
+    'app_conversation_store_sessions',
+    'Number of sessions held in memory by the server-side conversation store'
+)
+
+# Counter labeled by reason (session_cap, spilled, dropped) for evicted conversation data
+CONVERSATION_STORE_EVICTIONS = Counter(
+    'app_conversation_store_evictions_total',
+    'Conversation turns or sessions evicted from memory',
+    ['reason']
+)
+
+# Fixed per-turn overhead counted against the caps (tuple + bytes object headers)
+_TURN_OVERHEAD = 64
+
+def history_payload_size(history: List[Dict[str, Any]]) -> int:
+    """Approximate wire size of a history list as Gradio sends it"""
+    return len(json.dumps(history, ensure_ascii=False, default=str).encode('utf-8'))
+
+class _Session:
+    __slots__ = ("turns", "size")
+
+    def __init__(self):
+        # (role id, UTF-8 content); roles are interned in the store's role table
+        self.turns: List[Tuple[int, bytes]] = []
+        self.size = 0
+
+class ConversationStore:
+    """Keeps each session's turns server-side in a compact form.
+
+    Turns are held as (role id, UTF-8 bytes) pairs. A session over
+    max_session_bytes drops its oldest turns. Once the store as a whole is
+    over max_total_bytes, least-recently-used sessions are evicted: they are
+    written to the SQLite file at spill_path (and read back when the session
+    returns), or dropped if there is no spill tier.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.max_session_bytes: int = config.get("max_session_bytes", 64 * 1024)
+        self.max_total_bytes: int = config.get("max_total_bytes", 64 * 1024 * 1024)
+        self.spill_path: Optional[str] = config.get("spill_path")
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._roles: List[str] = []
+        self._role_ids: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.RLock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.spill_path:
+            self._db = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, turns TEXT)")
+            self._db.commit()
+
+    def _role_id(self, role: str) -> int:
+        role_id = self._role_ids.get(role)
+        if role_id is None:
+            role_id = self._role_ids[role] = len(self._roles)
+            self._roles.append(role)
+        return role_id
+
+    def _update_metrics(self):
+        CONVERSATION_STORE_BYTES.set(self._total)
+        CONVERSATION_STORE_SESSIONS.set(len(self._sessions))
+
+    def _spill(self, session_id: str, session: _Session):
+        turns = [[self._roles[role_id], content.decode('utf-8')] for role_id, content in session.turns]
+        self._db.execute("INSERT OR REPLACE INTO sessions (session_id, turns) VALUES (?, ?)",
+                         (session_id, json.dumps(turns, ensure_ascii=False)))
+        self._db.commit()
+
+    def _unspill(self, session_id: str) -> Optional[_Session]:
+        row = self._db.execute("SELECT turns FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        session = _Session()
+        for role, content in json.loads(row[0]):
+            encoded = content.encode('utf-8')
+            session.turns.append((self._role_id(role), encoded))
+            session.size += len(encoded) + _TURN_OVERHEAD
+        return session
+
+    def _get(self, session_id: str, create: bool) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+        if self._db is not None:
+            session = self._unspill(session_id)
+        if session is None and create:
+            session = _Session()
+        if session is not None:
+            self._sessions[session_id] = session
+            self._total += session.size
+            self._evict_lru(keep=session_id)
+        return session
+
+    def _evict_lru(self, keep: str):
+        while self._total > self.max_total_bytes and len(self._sessions) > 1:
+            session_id, session = next(iter(self._sessions.items()))
+            if session_id == keep:
+                self._sessions.move_to_end(session_id)
+                continue
+            del self._sessions[session_id]
+            self._total -= session.size
+            if self._db is not None:
+                self._spill(session_id, session)
+                CONVERSATION_STORE_EVICTIONS.labels(reason="spilled").inc()
+            else:
+                CONVERSATION_STORE_EVICTIONS.labels(reason="dropped").inc()
+        self._update_metrics()
+
+    def append(self, session_id: str, role: str, content: str):
+        """Add a turn, trimming the session and evicting other sessions as needed"""
+        encoded = content.encode('utf-8')
+        with self._lock:
+            session = self._get(session_id, create=True)
+            session.turns.append((self._role_id(role), encoded))
+            added = len(encoded) + _TURN_OVERHEAD
+            session.size += added
+            self._total += added
+            while session.size > self.max_session_bytes and len(session.turns) > 1:
+                _, dropped = session.turns.pop(0)
+                session.size -= len(dropped) + _TURN_OVERHEAD
+                self._total -= len(dropped) + _TURN_OVERHEAD
+                CONVERSATION_STORE_EVICTIONS.labels(reason="session_cap").inc()
+            self._evict_lru(keep=session_id)
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """The session's turns as Gradio-style message dicts (empty for unknown sessions)"""
+        with self._lock:
+            session = self._get(session_id, create=False)
+            if session is None:
+                return []
+            return [{"role": self._roles[role_id], "content": content.decode('utf-8')}
+                    for role_id, content in session.turns]
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._total -= session.size
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+            self._update_metrics()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,94 @@
+import os, signal, threading, time
+from typing import Callable, Optional
+from prometheus_client import Counter, Gauge
+
+# Counter labeled by result: drained (finished during a drain), aborted (cancelled at the deadline),
+# rejected (arrived while draining)
+DRAIN_REQUESTS = Counter(
+    'app_drain_requests_total',
+    'Requests affected by drain mode',
+    ['result']
+)
+
+# Gauge set to 1 once this process has started draining
+DRAINING = Gauge(
+    'app_draining',
+    'Whether this process is draining before shutdown'
+)
+
+def _interrupt_main():
+    # Gradio's launch() blocks the main thread until KeyboardInterrupt, then closes the server
+    os.kill(os.getpid(), signal.SIGINT)
+
+class DrainController:
+    """Drains a replica before it exits, for zero-error rolling deploys.
+
+    start() puts the chat handler in drain mode: new requests are turned away
+    with the draining message and /readyz reports not ready, so load
+    balancers and the router gateway move traffic elsewhere. Requests
+    already streaming (including ones queued behind a loading model) get
+    until deadline_seconds to finish; whatever is left is then cancelled.
+    The drained/aborted counts are logged and on_exit is called.
+
+    Whatever stops the process has to wait longer than deadline_seconds
+    before killing it: a container's stop grace period (docker's default is
+    10s) must exceed it, and the app must be the process that receives
+    SIGTERM (see the Dockerfile's exec).
+    """
+
+    def __init__(self, chat_handler, deadline_seconds: float = 25.0,
+                 on_exit: Optional[Callable[[], None]] = None, poll_seconds: float = 0.1):
+        self.chat_handler = chat_handler
+        self.deadline_seconds = deadline_seconds
+        self.on_exit = on_exit if on_exit is not None else _interrupt_main
+        self.poll_seconds = poll_seconds
+        self.drained = 0
+        self.aborted = 0
+        self._started = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def draining(self) -> bool:
+        return self._started.is_set()
+
+    def start(self, reason: str = "requested") -> bool:
+        """Begin draining in the background; False if a drain is already under way"""
+        with self._lock:
+            if self._started.is_set():
+                return False
+            self._started.set()
+        DRAINING.set(1)
+        in_flight = self.chat_handler.begin_drain()
+        print(f"[DRAIN] Draining ({reason}): {in_flight} requests in flight, "
+              f"deadline {self.deadline_seconds:.0f}s")
+        self._thread = threading.Thread(target=self._drain, args=(in_flight,), name="drain", daemon=True)
+        self._thread.start()
+        return True
+
+    def _drain(self, in_flight: int):
+        deadline = time.monotonic() + self.deadline_seconds
+        while self.chat_handler.in_flight > 0 and time.monotonic() < deadline:
+            time.sleep(self.poll_seconds)
+        remaining = self.chat_handler.in_flight
+        if remaining:
+            self.chat_handler.cancel_all()
+            # Give the cancelled streams a moment to unwind before exiting
+            unwind = time.monotonic() + 2.0
+            while self.chat_handler.in_flight > 0 and time.monotonic() < unwind:
+                time.sleep(self.poll_seconds)
+        self.aborted = remaining
+        self.drained = max(0, in_flight - remaining)
+        DRAIN_REQUESTS.labels(result="drained").inc(self.drained)
+        DRAIN_REQUESTS.labels(result="aborted").inc(self.aborted)
+        print(f"[DRAIN] Done: {self.drained} drained, {self.aborted} aborted")
+        self._done.set()
+        self.on_exit()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def install_signal_handler(self, sig: int = signal.SIGTERM):
+        """Drain on sig (must be called from the main thread)"""
+        signal.signal(sig, lambda signum, frame: self.start(signal.Signals(signum).name))
@@ -0,0 +1,133 @@
+import json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, Optional, Tuple
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+
+class HealthServer:
+    """Serves Prometheus metrics plus /healthz (liveness), /readyz (readiness) and POST /drain on one port"""
+
+    def __init__(self, port: int = 8000, addr: str = '0.0.0.0'):
+        self.port = port
+        self.addr = addr
+        self.started_at = time.time()
+        self.model_manager = None
+        self.chat_handler = None
+        self.health_config: Dict[str, Any] = {}
+        self.drain_controller = None
+        self.admin_token: Optional[str] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, model_manager, chat_handler, config: Dict[str, Any], drain_controller=None):
+        """Attach the app components once they exist; until then /readyz reports starting.
+        With a drain_controller, POST /drain starts drain mode."""
+        self.health_config = config.get("health", {})
+        self.admin_token = config.get("drain", {}).get("admin_token")
+        if drain_controller is not None:
+            self.drain_controller = drain_controller
+        self.model_manager = model_manager
+        self.chat_handler = chat_handler
+
+    def _load_status(self) -> Dict[str, Any]:
+        """Current load indicators and backend state"""
+        status: Dict[str, Any] = {"uptime_seconds": round(time.time() - self.started_at, 1)}
+        if self.model_manager is not None:
+            local_model = self.model_manager.local_model
+            api_model = self.model_manager.api_model
+            status["local_model"] = {
+                "ready": local_model.is_ready(),
+                "loading": local_model.is_loading(),
+            }
+            status["api_model"] = {
+                "healthy": api_model.is_healthy(self.health_config.get("api_failure_threshold", 3)),
+                "consecutive_failures": api_model.consecutive_failures,
+                "last_error": api_model.last_error,
+            }
+            status["queue_depth"] = self.model_manager.queue_depth()
+        if self.chat_handler is not None:
+            status["in_flight"] = self.chat_handler.in_flight
+        return status
+
+    def liveness(self) -> Tuple[bool, Dict[str, Any]]:
+        """The process is up and able to answer; never depends on load"""
+        status = self._load_status()
+        status["status"] = "alive"
+        return True, status
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """Whether this replica should receive new traffic"""
+        status = self._load_status()
+        reasons = []
+        if self.model_manager is None or self.chat_handler is None:
+            reasons.append("starting")
+        elif getattr(self.chat_handler, "draining", False):
+            reasons.append("draining")
+        else:
+            max_in_flight = self.health_config.get("max_in_flight", 0)
+            if max_in_flight and status["in_flight"] >= max_in_flight:
+                reasons.append("saturated: in-flight requests")
+            max_queue_depth = self.health_config.get("max_queue_depth", 0)
+            if max_queue_depth and status["queue_depth"] >= max_queue_depth:
+                reasons.append("saturated: queue depth")
+            local_state = status["local_model"]
+            if self.health_config.get("require_local_model", False) and not local_state["ready"]:
+                reasons.append("local model loading" if local_state["loading"] else "local model unavailable")
+            if self.health_config.get("require_api_model", False) and not status["api_model"]["healthy"]:
+                reasons.append("api backend failing")
+        status["status"] = "ready" if not reasons else "not ready"
+        status["reasons"] = reasons
+        return not reasons, status
+
+    def _make_handler(self):
+        health = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code: int, body: bytes, content_type: str):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path in ('/healthz', '/readyz'):
+                    ok, status = health.liveness() if path == '/healthz' else health.readiness()
+                    self._send(200 if ok else 503, json.dumps(status).encode('utf-8'), 'application/json')
+                elif path in ('/', '/metrics'):
+                    self._send(200, generate_latest(REGISTRY), CONTENT_TYPE_LATEST)
+                else:
+                    self._send(404, b'not found', 'text/plain')
+
+            def do_POST(self):
+                if self.path.split('?', 1)[0] != '/drain' or health.drain_controller is None:
+                    self._send(404, b'not found', 'text/plain')
+                    return
+                if health.admin_token and self.headers.get('Authorization') != f"Bearer {health.admin_token}":
+                    self._send(403, b'forbidden', 'text/plain')
+                    return
+                started = health.drain_controller.start("admin request")
+                body = {"status": "draining" if started else "already draining",
+                        "in_flight": health.chat_handler.in_flight if health.chat_handler else 0}
+                self._send(202, json.dumps(body).encode('utf-8'), 'application/json')
+
+            def log_message(self, format, *args):
+                pass  # probes hit these endpoints every few seconds
+
+        return Handler
+
+    def start(self) -> 'HealthServer':
+        """Start serving on a daemon thread"""
+        self._server = ThreadingHTTPServer((self.addr, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="health-server", daemon=True)
+        self._thread.start()
+        print(f"[HEALTH] Serving /metrics, /healthz, /readyz and /drain on port {self.port}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
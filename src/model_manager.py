@@ -1,9 +1,99 @@
-import queue, threading, time
-from typing import Optional, Dict, Any, List, Generator
+import gc, queue, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Generator, Tuple
 from abc import ABC, abstractmethod
+from prometheus_client import Counter, Gauge, Summary
+from resource_governor import ResourceGovernor
+from scheduler import FairScheduler
+
+# Gauge labeled by model name: 1 while the model's weights are loaded
+LOCAL_MODEL_RESIDENT = Gauge(
+    'app_local_model_resident',
+    'Whether a local model is currently loaded in memory',
+    ['model']
+)
+
+# Counter labeled by model name for completed local model loads
+LOCAL_MODEL_LOADS = Counter(
+    'app_local_model_loads_total',
+    'Total number of times a local model was loaded',
+    ['model']
+)
+
+# Counter labeled by model name and reason (idle, memory_budget) for local model unloads
+LOCAL_MODEL_UNLOADS = Counter(
+    'app_local_model_unloads_total',
+    'Total number of times a local model was unloaded',
+    ['model', 'reason']
+)
+
+# Summary labeled by model name for how long loading a local model takes
+LOCAL_MODEL_LOAD_DURATION = Summary(
+    'app_local_model_load_seconds',
+    'Time spent loading a local model',
+    ['model']
+)
+
+# Summary labeled by model name for effective local generation speed (generated tokens / wall time)
+LOCAL_MODEL_TOKENS_PER_SECOND = Summary(
+    'app_local_model_tokens_per_second',
+    'Effective tokens per second of local model generations',
+    ['model']
+)
+
+# Counter for tokens proposed by the speculative-decoding draft model
+SPECULATIVE_DRAFT_TOKENS = Counter(
+    'app_speculative_draft_tokens_total',
+    'Tokens proposed by the draft model during speculative decoding'
+)
+
+# Counter for draft tokens the main model accepted (acceptance rate = accepted / draft)
+SPECULATIVE_ACCEPTED_TOKENS = Counter(
+    'app_speculative_accepted_tokens_total',
+    'Draft model tokens accepted by the main model during speculative decoding'
+)
+
+class CancellationToken:
+    """Set when whoever is consuming a generation goes away; backends stop at their next check"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        # Updated by the backend so callers can tell how much of max_tokens was saved
+        self.generated_tokens = 0
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+def _stopping_criteria(should_stop, on_step):
+    """A transformers StoppingCriteriaList that stops generation as soon as should_stop() is true.
+    on_step gets the current sequence length after every step."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _StopWhen(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            on_step(input_ids.shape[-1])
+            return torch.full((input_ids.shape[0],), should_stop(), dtype=torch.bool,
+                              device=input_ids.device)
+
+    return StoppingCriteriaList([_StopWhen()])
 
 class ModelInterface(ABC):
     """Abstract interface for model implementations"""
+
+    # Local backends run on this host's CPU and go through the scheduler and
+    # governor; remote ones (the HF Inference API) don't
+    is_local = True
+    # Remote backends that can't be called without an HF token
+    requires_token = False
+    # Local backends that queue and cap their own generations (the model
+    # server); they get the session id instead of this process's slots
+    schedules_itself = False
     
     @abstractmethod
     def generate(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
@@ -14,26 +104,51 @@ class ModelInterface(ABC):
         pass
 
 class LocalModel(ModelInterface):
-    """Local model implementation using transformers"""
+    """Local model implementation using transformers.
+
+    With a draft_model_name, generation uses transformers' assisted
+    generation: the small draft model proposes num_assistant_tokens tokens
+    and the main model verifies them in one forward pass. With sampling,
+    proposals are accepted by speculative sampling, so the output
+    distribution is the same as sampling from the main model alone. The
+    draft must share the main model's tokenizer.
+    """
     
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, model_kwargs: Optional[Dict[str, Any]] = None,
+                 draft_model_name: Optional[str] = None, num_assistant_tokens: int = 5):
         self.model_name = model_name
+        self.model_kwargs = model_kwargs or {}
+        self.draft_model_name = draft_model_name
+        self.num_assistant_tokens = num_assistant_tokens
         self.pipe = None
+        self.draft_model = None
         self._ready = False
         self._loading = False
+        self._state_lock = threading.Lock()
+        # Draft passes and decoding steps of the current generation thread, for acceptance stats
+        self._passes = threading.local()
     
     def load_model(self):
         """Load the local model"""
-        if self._loading or self._ready:
-            return
-            
-        self._loading = True
+        if self.begin_load():
+            self.complete_load()
+
+    def begin_load(self) -> bool:
+        """Mark the model as loading, so is_loading() is true before the load
+        itself starts (e.g. on another thread); False if it is already loaded or loading"""
+        with self._state_lock:
+            if self._loading or self._ready:
+                return False
+            self._loading = True
+            return True
+
+    def complete_load(self):
+        """Load the weights for a load marked with begin_load()"""
         try:
-            from transformers import pipeline
-            import torch
-            
             print(f"[BACKGROUND] Loading local model: {self.model_name}")
-            self.pipe = pipeline("text-generation", model=self.model_name)
+            self.pipe = self._create_pipeline()
+            if self.draft_model_name:
+                self._load_draft_model()
             self._ready = True
             print("[BACKGROUND] Local model loaded successfully!")
         except Exception as e:
@@ -42,15 +157,87 @@ class LocalModel(ModelInterface):
         finally:
             self._loading = False
     
+    def _create_pipeline(self):
+        """Build the text-generation pipeline; other runtimes override this"""
+        from transformers import pipeline
+
+        return pipeline("text-generation", model=self.model_name, model_kwargs=self.model_kwargs)
+
+    def _load_draft_model(self):
+        from transformers import AutoModelForCausalLM
+
+        print(f"[BACKGROUND] Loading draft model: {self.draft_model_name}")
+        self.draft_model = AutoModelForCausalLM.from_pretrained(self.draft_model_name, **self.model_kwargs)
+        self.draft_model.generation_config.num_assistant_tokens = self.num_assistant_tokens
+        # Adapt the number of proposed tokens to how many are being accepted
+        self.draft_model.generation_config.num_assistant_tokens_schedule = "heuristic"
+        self.draft_model.register_forward_hook(lambda *args: self._count_pass("draft"))
+
+    def _assisted_kwargs(self) -> Dict[str, Any]:
+        """Extra generate() arguments for assisted generation (empty without a draft model)"""
+        if self.draft_model is None:
+            return {}
+        return {"assistant_model": self.draft_model, "num_assistant_tokens": self.num_assistant_tokens}
+
+    def _count_pass(self, which: str):
+        setattr(self._passes, which, getattr(self._passes, which, 0) + 1)
+
+    def _reset_passes(self):
+        passes = self._passes
+        passes.draft = passes.steps = 0
+        passes.first_length = passes.last_length = passes.draft_before_decode = 0
+
+    def _count_step(self, length: int):
+        """Called after every decoding step with the sequence length. The first
+        step is the prefill: it reads the prompt and isn't a draft verification."""
+        passes = self._passes
+        if not getattr(passes, "steps", 0):
+            passes.first_length = length
+            passes.draft_before_decode = getattr(passes, "draft", 0)
+            passes.steps = 0
+        passes.steps += 1
+        passes.last_length = length
+
+    def acceptance(self) -> Tuple[int, int]:
+        """(draft tokens proposed, draft tokens accepted) for the last generation on this
+        thread, counting only the decoding steps after the prefill"""
+        passes = self._passes
+        steps = getattr(passes, "steps", 0)
+        if steps < 2:
+            return 0, 0
+        proposed = passes.draft - passes.draft_before_decode
+        # Each verification step keeps the accepted draft tokens plus one token
+        # of the main model's own. Tokens cut off by a stopping criterion make
+        # this approximate.
+        accepted = (passes.last_length - passes.first_length) - (steps - 1)
+        return proposed, min(proposed, max(0, accepted))
+
     def is_ready(self) -> bool:
         return self._ready
     
     def is_loading(self) -> bool:
         return self._loading
+
+    def memory_bytes(self) -> int:
+        """Size of the loaded weights, including any draft model (0 when unloaded)"""
+        if self.pipe is None:
+            return 0
+        models = [self.pipe.model] + ([self.draft_model] if self.draft_model is not None else [])
+        return sum(p.numel() * p.element_size() for model in models for p in model.parameters())
+
+    def unload(self):
+        """Drop the weights; load_model() brings them back"""
+        if self._loading:
+            return
+        self.pipe = None
+        self.draft_model = None
+        self._ready = False
+        gc.collect()
     
     def generate(self, messages: List[Dict[str, str]], max_tokens: int = 512, 
-                temperature: float = 0.7, top_p: float = 0.9, **kwargs) -> Generator[str, None, None]:
-        """Generate response from local model (single-turn, avoids self-conversation)"""
+                temperature: float = 0.7, top_p: float = 0.9,
+                cancel_token: Optional[CancellationToken] = None, **kwargs) -> Generator[str, None, None]:
+        """Stream the first line of the local model's response (single-turn, avoids self-conversation)"""
         if not self._ready:
             raise RuntimeError("Model not ready")
 
@@ -65,79 +252,547 @@ class LocalModel(ModelInterface):
                 break
         prompt = f"system: {system_msg}\nuser: {user_msg}\n{assistant_name}:"
 
-        outputs = self.pipe(
-            prompt,
-            max_new_tokens=max_tokens,
-            do_sample=True,
-            temperature=temperature,
-            top_p=top_p,
-            return_full_text=False
-        )
+        from transformers import TextIteratorStreamer
+
+        cancel_token = cancel_token or CancellationToken()
+        # Set once the first line is complete or the consumer stops reading;
+        # checked by the model after every generated token
+        done = threading.Event()
+
+        prompt_length = len(self.pipe.tokenizer(prompt)["input_ids"])
+
+        def count_step(length: int):
+            cancel_token.generated_tokens = length - prompt_length
+            self._count_step(length)
 
-        response = outputs[0]["generated_text"]
-        # Only return the first line (up to next newline or end)
-        first_line = response.strip().split("\n")[0]
-        yield first_line
+        streamer = TextIteratorStreamer(self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors: List[BaseException] = []
+        generate_kwargs = self._assisted_kwargs()
+
+        def run_pipeline():
+            self._reset_passes()
+            start = time.perf_counter()
+            try:
+                self.pipe(
+                    prompt,
+                    max_new_tokens=max_tokens,
+                    do_sample=True,
+                    temperature=temperature,
+                    top_p=top_p,
+                    return_full_text=False,
+                    streamer=streamer,
+                    stopping_criteria=_stopping_criteria(
+                        lambda: done.is_set() or cancel_token.cancelled, count_step),
+                    **generate_kwargs
+                )
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()
+                return
+            self._record_speed(cancel_token.generated_tokens, time.perf_counter() - start)
+
+        worker = threading.Thread(target=run_pipeline, name="local-generate", daemon=True)
+        worker.start()
+        try:
+            text = ""
+            for piece in streamer:
+                if not text:
+                    piece = piece.lstrip()
+                # Only return the first line (up to next newline or end)
+                line, newline, _ = piece.partition("\n")
+                if line:
+                    text += line
+                    yield line
+                if newline and text:
+                    break
+        finally:
+            done.set()
+            worker.join()
+        if errors:
+            raise errors[0]
+
+    def _record_speed(self, tokens: int, elapsed: float):
+        """Export tokens/sec and, with a draft model, how many proposed tokens were accepted"""
+        if tokens <= 0 or elapsed <= 0:
+            return
+        LOCAL_MODEL_TOKENS_PER_SECOND.labels(model=self.model_name).observe(tokens / elapsed)
+        if self.draft_model is None:
+            return
+        proposed, accepted = self.acceptance()
+        SPECULATIVE_DRAFT_TOKENS.inc(proposed)
+        SPECULATIVE_ACCEPTED_TOKENS.inc(accepted)
+        print(f"[SPECULATIVE] {tokens} tokens in {elapsed:.2f}s ({tokens / elapsed:.1f} tok/s), "
+              f"accepted {accepted}/{proposed} draft tokens")
 
 class APIModel(ModelInterface):
     """API model implementation using HuggingFace Inference Client"""
+
+    is_local = False
+    requires_token = True
     
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, record_path: Optional[str] = None):
         self.model_name = model_name
+        self.consecutive_failures = 0
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Completed responses are appended here (chunks and timings) for ReplayModel
+        self.recorder = None
+        if record_path:
+            from replay_backend import StreamRecorder
+            self.recorder = StreamRecorder(record_path)
     
     def is_ready(self) -> bool:
         return True  # API is always "ready" if we have a token
+
+    def is_healthy(self, failure_threshold: int = 3) -> bool:
+        """False once the last failure_threshold API calls in a row have failed"""
+        return self.consecutive_failures < failure_threshold
     
     def generate(self, messages: List[Dict[str, str]], hf_token: str, 
                 max_tokens: int = 512, temperature: float = 0.7, top_p: float = 0.9, 
+                cancel_token: Optional[CancellationToken] = None,
                 **kwargs) -> Generator[str, None, None]:
         """Generate response from API model"""
         from huggingface_hub import InferenceClient
         
         client = InferenceClient(token=hf_token, model=self.model_name)
         
-        response = ""
-        for chunk in client.chat_completion(
-            messages,
-            max_tokens=max_tokens,
-            stream=True,
-            temperature=temperature,
-            top_p=top_p,
-        ):
-            choices = chunk.choices
-            token = ""
-            if len(choices) and choices[0].delta.content:
-                token = choices[0].delta.content
-            # The client yields incremental deltas. Yield the delta token
-            # directly (not the cumulative response) so callers can append
-            # fragments without duplicating prefixes.
-            if token:
-                yield token
+        chunks = [] if self.recorder is not None else None
+        last = time.perf_counter()
+        stream = None
+        try:
+            stream = client.chat_completion(
+                messages,
+                max_tokens=max_tokens,
+                stream=True,
+                temperature=temperature,
+                top_p=top_p,
+            )
+            for chunk in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    break
+                choices = chunk.choices
+                token = ""
+                if len(choices) and choices[0].delta.content:
+                    token = choices[0].delta.content
+                # The client yields incremental deltas. Yield the delta token
+                # directly (not the cumulative response) so callers can append
+                # fragments without duplicating prefixes.
+                if token:
+                    if cancel_token is not None:
+                        cancel_token.generated_tokens += 1
+                    if chunks is not None:
+                        now = time.perf_counter()
+                        chunks.append((now - last, token))
+                        last = now
+                    yield token
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            # Close the upstream HTTP stream so an abandoned request stops
+            # being generated (and billed) instead of draining in the background.
+            # Not every huggingface_hub version has InferenceClient.close(), so
+            # close the stream itself as well.
+            for closeable in (stream, client):
+                close = getattr(closeable, "close", None)
+                if close is not None:
+                    close()
+        self.consecutive_failures = 0
+        self.last_success = time.time()
+        if chunks is not None and not (cancel_token is not None and cancel_token.cancelled):
+            self.recorder.record(self.model_name, messages,
+                                 {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p},
+                                 chunks)
+
+class ModelPool:
+    """Loads local models on demand and unloads them when idle or over a memory budget.
+
+    Models are loaded by name the first time they are acquired (the default
+    model is loaded at startup by ModelManager.start_model_loading). A model
+    unused for idle_unload_seconds is unloaded by a background reaper, and
+    before a load would take resident models past memory_budget_mb, the
+    least-recently-used models not currently generating are unloaded.
+    A model is kept resident while a request holds it with use(), including
+    while that request waits for the load or its scheduler turn. A failed
+    load is not retried for load_retry_seconds.
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]], idle_unload_seconds: float = 0,
+                 memory_budget_mb: float = 0, model_factory=None, load_retry_seconds: float = 30):
+        model_factory = model_factory or (lambda entry: LocalModel(
+            entry["name"], entry.get("model_kwargs"),
+            draft_model_name=entry.get("draft_model"),
+            num_assistant_tokens=entry.get("num_assistant_tokens", 5)
+        ))
+        self.idle_unload_seconds = idle_unload_seconds
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.load_retry_seconds = load_retry_seconds
+        self.models: Dict[str, ModelInterface] = {}
+        self._estimates: Dict[str, int] = {}
+        for entry in entries:
+            self.models[entry["name"]] = model_factory(entry)
+            self._estimates[entry["name"]] = int(entry.get("memory_mb", 0) * 1024 * 1024)
+        self.default_name = entries[0]["name"]
+        # Resident models, least recently used first
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        # Models this pool unloaded, which are reloaded the next time they're acquired
+        self._unloaded = set()
+        # When each model's last load failed, for the retry backoff
+        self._load_failed_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_interval: Optional[float] = None
+        # Set to make the reaper re-read idle_unload_seconds before its next pass
+        self._reaper_wake = threading.Event()
+
+    def names(self) -> List[str]:
+        return list(self.models)
+
+    def get(self, name: Optional[str] = None) -> ModelInterface:
+        return self.models[name or self.default_name]
+
+    def resident(self) -> List[str]:
+        with self._lock:
+            return [name for name, model in self.models.items() if model.is_ready()]
+
+    def _size(self, name: str) -> int:
+        measured = self.models[name].memory_bytes() if self.models[name].is_ready() else 0
+        if measured:
+            self._estimates[name] = measured
+        return measured or self._estimates.get(name, 0)
+
+    def _make_room(self, name: str):
+        """Unload LRU idle models until loading name fits in the memory budget"""
+        if self.memory_budget_bytes <= 0:
+            return
+        needed = self._size(name)
+        for victim in list(self._last_used):
+            resident = sum(self._size(n) for n in self.resident() if n != name)
+            if resident + needed <= self.memory_budget_bytes:
+                return
+            if victim != name and not self._in_use.get(victim):
+                self.unload(victim, reason="memory_budget")
+
+    def _timed_load(self, name: str):
+        model = self.models[name]
+        start = time.perf_counter()
+        model.complete_load()
+        if not model.is_ready():
+            with self._lock:
+                self._load_failed_at[name] = time.monotonic()
+            print(f"[POOL] Loading {name} failed; not retrying for {self.load_retry_seconds:.0f}s")
+            return
+        elapsed = time.perf_counter() - start
+        LOCAL_MODEL_LOAD_DURATION.labels(model=name).observe(elapsed)
+        LOCAL_MODEL_LOADS.labels(model=name).inc()
+        LOCAL_MODEL_RESIDENT.labels(model=name).set(1)
+        with self._lock:
+            self._load_failed_at.pop(name, None)
+            self._last_used[name] = time.monotonic()
+            self._last_used.move_to_end(name)
+            # The real size may be larger than the configured estimate
+            self._make_room(name)
+        print(f"[POOL] Loaded {name} in {elapsed:.1f}s ({self._size(name) / 2**20:.0f} MB)")
+
+    def acquire(self, name: Optional[str] = None, background: bool = True) -> ModelInterface:
+        """Return the model, starting a load if it isn't resident"""
+        name = name or self.default_name
+        model = self.models[name]
+        with self._lock:
+            if model.is_ready():
+                self._last_used[name] = time.monotonic()
+                self._last_used.move_to_end(name)
+                return model
+            if model.is_loading():
+                return model
+            if background and name == self.default_name and name not in self._unloaded:
+                # The default model's first load belongs to start_model_loading;
+                # if that failed, don't retry it on every request
+                return model
+            failed_at = self._load_failed_at.get(name)
+            if background and failed_at is not None and \
+                    time.monotonic() - failed_at < self.load_retry_seconds:
+                # A recent load failed; requests get "load failed" until the backoff expires
+                return model
+            self._make_room(name)
+            # Mark loading before returning so callers see it immediately
+            if not model.begin_load():
+                return model
+        if background:
+            threading.Thread(target=self._timed_load, args=(name,), name=f"load-{name}", daemon=True).start()
+        else:
+            self._timed_load(name)
+        return model
+
+    def load(self, name: Optional[str] = None) -> ModelInterface:
+        return self.acquire(name, background=False)
+
+    @contextmanager
+    def use(self, name: Optional[str] = None):
+        """Keep a model from being unloaded while a generation runs on it"""
+        name = name or self.default_name
+        with self._lock:
+            self._in_use[name] = self._in_use.get(name, 0) + 1
+        try:
+            yield self.models[name]
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+                if name in self._last_used:
+                    self._last_used[name] = time.monotonic()
+                    self._last_used.move_to_end(name)
+
+    def unload(self, name: str, reason: str = "idle"):
+        with self._lock:
+            model = self.models[name]
+            if not model.is_ready() or self._in_use.get(name):
+                return
+            model.unload()
+            self._last_used.pop(name, None)
+            self._unloaded.add(name)
+        LOCAL_MODEL_UNLOADS.labels(model=name, reason=reason).inc()
+        LOCAL_MODEL_RESIDENT.labels(model=name).set(0)
+        print(f"[POOL] Unloaded {name} ({reason})")
+
+    def unload_idle(self, now: Optional[float] = None) -> List[str]:
+        """Unload models unused for idle_unload_seconds; returns their names"""
+        if self.idle_unload_seconds <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [name for name, last in self._last_used.items()
+                    if now - last >= self.idle_unload_seconds and not self._in_use.get(name)]
+        for name in idle:
+            self.unload(name, reason="idle")
+        return idle
+
+    def set_idle_unload_seconds(self, seconds: float):
+        """Change the idle timeout; a running reaper picks up the new interval at once"""
+        self.idle_unload_seconds = seconds
+        self._reaper_wake.set()
+        self.start_reaper()
+
+    def start_reaper(self, interval: Optional[float] = None):
+        if interval:
+            self._reaper_interval = interval
+        if self.idle_unload_seconds <= 0 or self._reaper is not None:
+            return
+
+        def reap():
+            while True:
+                interval = self._reaper_interval or max(1.0, self.idle_unload_seconds / 10)
+                if self._reaper_wake.wait(interval):
+                    self._reaper_wake.clear()
+                    continue
+                self.unload_idle()
+
+        self._reaper = threading.Thread(target=reap, name="model-pool-reaper", daemon=True)
+        self._reaper.start()
+
+# Backend types that can be declared in the "backends" section of app_config.json.
+# Values are classes or "module:Class" strings, imported only when used so
+# optional runtimes don't have to be installed.
+BACKEND_TYPES: Dict[str, Any] = {}
+
+def register_backend(type_name: str, backend: Any = None):
+    """Register a ModelInterface class under a backend type name; usable as a decorator"""
+    if backend is None:
+        return lambda cls: register_backend(type_name, cls)
+    BACKEND_TYPES[type_name] = backend
+    return backend
+
+def create_backend(spec: Dict[str, Any]) -> ModelInterface:
+    """Instantiate a backend from its config entry: {"type": ..., **constructor options}"""
+    backend = BACKEND_TYPES.get(spec["type"])
+    if backend is None:
+        raise ValueError(f"Unknown backend type: {spec['type']}")
+    if isinstance(backend, str):
+        import importlib
+        module_name, _, class_name = backend.partition(":")
+        backend = getattr(importlib.import_module(module_name), class_name)
+    options = {key: value for key, value in spec.items() if key not in ("type", "enabled", "preload")}
+    return backend(**options)
+
+register_backend("transformers", LocalModel)
+register_backend("hf_inference", APIModel)
+register_backend("onnx", "onnx_backend:OnnxModel")
+register_backend("replay", "replay_backend:ReplayModel")
 
 class ModelManager:
     """Manages model loading and message queuing"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], local_model: Optional[ModelInterface] = None):
         self.config = config
-        self.local_model = LocalModel(config["model"]["local_model_name"])
-        self.api_model = APIModel(config["model"]["api_model_name"])
+        self.model_pool: Optional[ModelPool] = None
+        server_config = config.get("model_server", {})
+        if local_model is not None:
+            # Already loaded by the caller, e.g. the prefork master
+            self.local_model = local_model
+        elif server_config.get("enabled", False):
+            # Share one model loaded in a separate model_server.py process
+            from model_server import RemoteModel
+            self.local_model = RemoteModel(
+                server_config["address"],
+                connect_timeout=server_config.get("connect_timeout", 5.0),
+                status_cache_seconds=server_config.get("status_cache_seconds", 1.0)
+            )
+        else:
+            pool_config = config.get("model_pool", {})
+            entries = config["model"].get("local_models") or [{"name": config["model"]["local_model_name"]}]
+            self.model_pool = ModelPool(
+                entries,
+                idle_unload_seconds=pool_config.get("idle_unload_seconds", 0),
+                memory_budget_mb=pool_config.get("memory_budget_mb", 0),
+                load_retry_seconds=pool_config.get("load_retry_seconds", 30)
+            )
+            self.model_pool.start_reaper()
+            self.local_model = self.model_pool.get()
+        self.api_model = APIModel(config["model"]["api_model_name"],
+                                  record_path=config["model"].get("api_record_path"))
+        # "local" and "api" are the models above; other declared backends are built from the registry
+        self.backends: Dict[str, ModelInterface] = {"local": self.local_model, "api": self.api_model}
+        self._preload_backends: List[str] = []
+        for name, spec in config.get("backends", {}).items():
+            if name in self.backends or not spec.get("enabled", True):
+                continue
+            self.backends[name] = create_backend(spec)
+            if spec.get("preload", False):
+                self._preload_backends.append(name)
+        self._backend_load_started = set()
+        self.governor = ResourceGovernor(config.get("resources", {}))
+        # Orders local generations across sessions; one grant per governor slot
+        self.scheduler = FairScheduler(self.governor.max_concurrent_generations,
+                                       config.get("scheduler", {}))
         self.message_queue = queue.Queue()
         self.processing_queue = False
+        # Requests currently waiting for a model to finish loading
+        self._load_waiters = 0
+        self._load_waiters_lock = threading.Lock()
         self._model_thread: Optional[threading.Thread] = None
     
-    def start_model_loading(self):
-        """Start background model loading"""
+    def start_model_loading(self) -> threading.Thread:
+        """Start background model loading and return the loader thread"""
         if self._model_thread is None or not self._model_thread.is_alive():
             self._model_thread = threading.Thread(
-                target=self.local_model.load_model, 
+                target=self._load_local_model, 
                 daemon=True
             )
             self._model_thread.start()
+        return self._model_thread
     
+    def _load_local_model(self):
+        """Load the local model, then release the messages queued while it loaded"""
+        if isinstance(self.local_model, LocalModel) and not self.local_model.is_ready():
+            # Size torch's thread pools before the model runs anything
+            self.governor.apply()
+        if self.model_pool is not None:
+            self.model_pool.load()
+        else:
+            self.local_model.load_model()
+        for name in self._preload_backends:
+            self.acquire_backend(name, background=False)
+        self.process_queued_messages()
+
+    def backend_names(self) -> List[str]:
+        return list(self.backends)
+
+    def apply_config(self, config: Dict[str, Any]):
+        """Take reloaded settings that can change without reloading any model.
+
+        Pool limits and scheduler rates apply from the next request. Model
+        names, backends and thread settings only change on restart.
+        """
+        if self.model_pool is not None:
+            pool_config = config.get("model_pool", {})
+            self.model_pool.memory_budget_bytes = int(pool_config.get("memory_budget_mb", 0) * 1024 * 1024)
+            self.model_pool.load_retry_seconds = pool_config.get("load_retry_seconds", 30)
+            self.model_pool.set_idle_unload_seconds(pool_config.get("idle_unload_seconds", 0))
+        self.scheduler.configure(config.get("scheduler", {}))
+        applied = dict(config)
+        for section in ("model", "backends", "resources", "model_server"):
+            if config.get(section) != self.config.get(section):
+                print(f"[CONFIG] Changes to '{section}' take effect after a restart")
+            # Keep the values still in use, so later reloads keep warning until a restart
+            if section in self.config:
+                applied[section] = self.config[section]
+            else:
+                applied.pop(section, None)
+        self.config = applied
+
+    def acquire_backend(self, name: str, local_model_name: Optional[str] = None,
+                        background: bool = True) -> ModelInterface:
+        """The named backend, starting its first load if it hasn't been loaded yet"""
+        if name == "local":
+            return self.acquire_local_model(local_model_name)
+        backend = self.backends[name]
+        if hasattr(backend, "load_model") and name not in self._backend_load_started:
+            self._backend_load_started.add(name)
+            if not background:
+                backend.load_model()
+            elif hasattr(backend, "begin_load"):
+                # Mark loading before returning so callers see it immediately
+                if backend.begin_load():
+                    threading.Thread(target=backend.complete_load, name=f"load-{name}", daemon=True).start()
+            else:
+                threading.Thread(target=backend.load_model, name=f"load-{name}", daemon=True).start()
+        return backend
+
+    def local_model_names(self) -> List[str]:
+        return self.model_pool.names() if self.model_pool is not None else [self.local_model.model_name]
+
+    def acquire_local_model(self, name: Optional[str] = None) -> ModelInterface:
+        """The named (or default) local model, reloading it in the background if it was unloaded"""
+        if self.model_pool is None:
+            return self.local_model
+        if name not in self.model_pool.models:
+            name = None
+        return self.model_pool.acquire(name)
+
+    @contextmanager
+    def using_backend(self, name: str, local_model_name: Optional[str] = None):
+        """acquire_backend() as a context that keeps a pooled local model resident
+        from before it is acquired until the block exits"""
+        if name != "local" or self.model_pool is None:
+            yield self.acquire_backend(name, local_model_name)
+            return
+        if local_model_name not in self.model_pool.models:
+            local_model_name = None
+        with self.model_pool.use(local_model_name):
+            yield self.model_pool.acquire(local_model_name)
+
+    @contextmanager
+    def generation_turn(self, model: ModelInterface, session_id: str, cost: float):
+        """Wait for the session's scheduler turn and a generation slot, and hold
+        both for the block. Yields extra generate() arguments: a model that
+        schedules itself gets the session id and waits on its own side."""
+        if getattr(model, "schedules_itself", False):
+            yield {"session_id": session_id}
+            return
+        with self.scheduler.slot(session_id, cost=cost), self.governor.generation_slot():
+            yield {}
+
     def queue_message(self, message_data: Dict[str, Any]):
         """Queue a message for later processing"""
         self.message_queue.put(message_data)
     
+    @contextmanager
+    def waiting_for_load(self):
+        """Count the enclosed wait for a loading model in queue_depth()"""
+        with self._load_waiters_lock:
+            self._load_waiters += 1
+        try:
+            yield
+        finally:
+            with self._load_waiters_lock:
+                self._load_waiters -= 1
+
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a model to load or for a generation slot"""
+        return self.message_queue.qsize() + self._load_waiters + self.scheduler.queued()
+
     def has_queued_messages(self) -> bool:
         """Check if there are queued messages"""
         return not self.message_queue.empty()
@@ -0,0 +1,247 @@
+"""
+Out-of-process model server for the local model.
+Usage: python src/model_server.py [--address /tmp/diogenic-model.sock]
+
+Loads one LocalModel and serves it to any number of UI worker processes over
+a Unix socket (or tcp://host:port), so the weights are held in memory once.
+Each request is one JSON line; the reply is a stream of JSON lines:
+    {"op": "generate", "messages": [...], "kwargs": {...}, "session_id": "..."}
+        -> {"type": "token", "text": "..."}* then {"type": "end"} or {"type": "error", "message": "..."}
+           or {"type": "throttled", "retry_after": seconds}
+    {"op": "status"}
+        -> {"type": "status", "ready": bool, "loading": bool}
+
+The server is where the weights run, so it applies the resources section
+(torch thread pools, pinning, concurrent generations) and orders the requests
+of every UI worker with one FairScheduler, keyed by the session id the worker
+sends. Generations are not batched: each one runs on its own.
+"""
+
+import argparse, json, os, socket, socketserver, sys, threading, time
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from model_manager import CancellationToken, ModelInterface, LocalModel
+from resource_governor import ResourceGovernor
+from scheduler import FairScheduler, Throttled
+
+def _parse_address(address: str) -> Tuple[int, Any]:
+    """Return (socket family, bind/connect address) for a path or tcp://host:port"""
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+def _send(wfile, message: Dict[str, Any]):
+    wfile.write(json.dumps(message).encode('utf-8') + b"\n")
+    wfile.flush()
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: "ModelServer" = self.server.model_server
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                _send(self.wfile, {"type": "error", "message": "invalid request"})
+                return
+            op = request.get("op")
+            if op == "status":
+                _send(self.wfile, {"type": "status", **server.status()})
+            elif op == "generate":
+                server.stream_generation(request, self.wfile)
+            else:
+                _send(self.wfile, {"type": "error", "message": f"unknown op: {op}"})
+
+class ModelServer:
+    """Serves one model instance to many clients. Generations wait for their turn
+    in the scheduler and for one of the governor's generation slots."""
+
+    def __init__(self, model: ModelInterface, address: str, governor: Optional[ResourceGovernor] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        self.model = model
+        self.address = address
+        self.family, self.bind_address = _parse_address(address)
+        self.governor = governor or ResourceGovernor()
+        self.scheduler = scheduler or FairScheduler(self.governor.max_concurrent_generations)
+        self._server: Optional[socketserver.BaseServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def status(self) -> Dict[str, bool]:
+        is_loading = getattr(self.model, "is_loading", lambda: False)
+        return {"ready": self.model.is_ready(), "loading": is_loading()}
+
+    def stream_generation(self, request: Dict[str, Any], wfile):
+        """Run one generation and stream its tokens back to the client"""
+        session_id = request.get("session_id") or "anonymous"
+        kwargs = request.get("kwargs", {})
+        try:
+            self.scheduler.acquire(session_id, cost=kwargs.get("max_tokens"))
+        except Throttled as e:
+            _send(wfile, {"type": "throttled", "retry_after": e.retry_after})
+            return
+        try:
+            with self.governor.generation_slot():
+                self._generate(request.get("messages", []), kwargs, wfile)
+        finally:
+            self.scheduler.release(session_id)
+
+    def _generate(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any], wfile):
+        tokens = None
+        try:
+            tokens = self.model.generate(messages, **kwargs)
+            for token in tokens:
+                _send(wfile, {"type": "token", "text": token})
+            _send(wfile, {"type": "end"})
+        except (BrokenPipeError, ConnectionResetError):
+            print("[MODEL SERVER] Client disconnected mid-generation")
+        except Exception as e:
+            try:
+                _send(wfile, {"type": "error", "message": str(e)})
+            except OSError:
+                pass
+        finally:
+            # Stop generating as soon as the client is gone
+            if tokens is not None:
+                tokens.close()
+
+    def start(self) -> "ModelServer":
+        """Start serving on a daemon thread"""
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.bind_address):
+                os.unlink(self.bind_address)
+            self._server = socketserver.ThreadingUnixStreamServer(self.bind_address, _RequestHandler)
+        else:
+            self._server = socketserver.ThreadingTCPServer(self.bind_address, _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.model_server = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="model-server", daemon=True)
+        self._thread.start()
+        print(f"[MODEL SERVER] Listening on {self.address}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if self.family == socket.AF_UNIX and os.path.exists(self.bind_address):
+                os.unlink(self.bind_address)
+
+class RemoteModel(ModelInterface):
+    """Client for a ModelServer; a drop-in replacement for LocalModel in UI workers"""
+
+    # The server orders and caps generations across all workers
+    schedules_itself = True
+
+    def __init__(self, address: str, connect_timeout: float = 5.0, load_timeout: float = 1800.0,
+                 status_cache_seconds: float = 1.0):
+        self.address = address
+        self.model_name = address
+        self.connect_timeout = connect_timeout
+        self.load_timeout = load_timeout
+        self.family, self.connect_address = _parse_address(address)
+        # is_ready()/is_loading() are polled by waiting requests and every
+        # /readyz probe; reuse a recent answer instead of asking each time
+        self.status_cache_seconds = status_cache_seconds
+        self._cached_status: Optional[Tuple[float, Dict[str, bool]]] = None
+        self._status_lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(self.connect_address)
+        except OSError:
+            sock.close()
+            raise
+        # Generations can pause for a long time between tokens
+        sock.settimeout(None)
+        return sock
+
+    def _status(self) -> Dict[str, bool]:
+        with self._status_lock:
+            cached = self._cached_status
+            if cached is not None and time.monotonic() - cached[0] < self.status_cache_seconds:
+                return cached[1]
+            status = self._fetch_status()
+            self._cached_status = (time.monotonic(), status)
+            return status
+
+    def _fetch_status(self) -> Dict[str, bool]:
+        try:
+            with self._connect() as sock, sock.makefile('rwb') as stream:
+                _send(stream, {"op": "status"})
+                reply = json.loads(stream.readline() or b"{}")
+            return {"ready": bool(reply.get("ready")), "loading": bool(reply.get("loading"))}
+        except (OSError, ValueError):
+            return {"ready": False, "loading": False}
+
+    def load_model(self):
+        """The server owns loading; wait until it reports the model ready or failed"""
+        deadline = time.time() + self.load_timeout
+        while time.time() < deadline:
+            status = self._status()
+            if status["ready"] or not status["loading"]:
+                return
+            time.sleep(1)
+
+    def is_ready(self) -> bool:
+        return self._status()["ready"]
+
+    def is_loading(self) -> bool:
+        return self._status()["loading"]
+
+    def generate(self, messages: List[Dict[str, str]], cancel_token: Optional[CancellationToken] = None,
+                 session_id: Optional[str] = None, **kwargs) -> Generator[str, None, None]:
+        """Stream tokens from the server; closing this generator (or cancelling) closes the
+        connection, which stops the generation on the server. session_id is what the
+        server's scheduler keys fairness and rate limits on."""
+        try:
+            sock = self._connect()
+        except OSError as e:
+            raise RuntimeError(f"Model server unavailable at {self.address}: {e}")
+        with sock, sock.makefile('rwb') as stream:
+            _send(stream, {"op": "generate", "messages": messages, "kwargs": kwargs, "session_id": session_id})
+            for line in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    return
+                reply = json.loads(line)
+                if reply["type"] == "token":
+                    if cancel_token is not None:
+                        cancel_token.generated_tokens += 1
+                    yield reply["text"]
+                elif reply["type"] == "end":
+                    return
+                elif reply["type"] == "throttled":
+                    raise Throttled(session_id or "anonymous", reply["retry_after"])
+                else:
+                    raise RuntimeError(reply.get("message", "model server error"))
+            raise RuntimeError("Model server closed the connection mid-generation")
+
+def main():
+    from config_manager import ConfigManager
+
+    config = ConfigManager().load_config()
+    server_config = config.get("model_server", {})
+    parser = argparse.ArgumentParser(description="Serve the local model to UI worker processes")
+    parser.add_argument("--address", default=server_config.get("address", "/tmp/diogenic-model.sock"))
+    args = parser.parse_args()
+
+    # Size torch's thread pools and pin before the model runs anything
+    governor = ResourceGovernor(config.get("resources", {}))
+    governor.apply()
+    scheduler = FairScheduler(governor.max_concurrent_generations, config.get("scheduler", {}))
+    model = LocalModel(config["model"]["local_model_name"])
+    server = ModelServer(model, args.address, governor, scheduler).start()
+    model.load_model()
+    if not model.is_ready():
+        print("[MODEL SERVER] Model failed to load; exiting", file=sys.stderr)
+        server.stop()
+        sys.exit(1)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
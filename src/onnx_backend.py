@@ -0,0 +1,65 @@
+import os
+from typing import Any, Dict, Optional
+
+from model_manager import LocalModel
+
+class OnnxModel(LocalModel):
+    """Local model served by ONNX Runtime on CPU through optimum.
+
+    The first load exports the transformers model to an ONNX graph and saves
+    it under path; later loads read the saved graph directly. Sessions run
+    with all graph optimizations enabled. Prompting, streaming, cancellation
+    and the first-line cut-off are inherited from LocalModel.
+    Requires: pip install optimum[onnxruntime]
+    """
+
+    def __init__(self, model: str, path: Optional[str] = None, export: bool = True,
+                 intra_op_threads: int = 0, session_options: Optional[Dict[str, Any]] = None):
+        super().__init__(model)
+        self.path = path
+        self.export = export
+        self.intra_op_threads = intra_op_threads
+        self.session_options = session_options or {}
+
+    def _has_saved_graph(self) -> bool:
+        return bool(self.path) and os.path.isdir(self.path) and \
+            any(name.endswith(".onnx") for name in os.listdir(self.path))
+
+    def _create_pipeline(self):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM
+        from transformers import AutoTokenizer, pipeline
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        for key, value in self.session_options.items():
+            setattr(options, key, value)
+
+        if self._has_saved_graph():
+            print(f"[ONNX] Loading saved graph from {self.path}")
+            source = self.path
+            model = ORTModelForCausalLM.from_pretrained(
+                self.path, provider="CPUExecutionProvider", session_options=options)
+        elif self.export:
+            print(f"[ONNX] Exporting {self.model_name} to ONNX (first load only)")
+            source = self.model_name
+            model = ORTModelForCausalLM.from_pretrained(
+                self.model_name, export=True, provider="CPUExecutionProvider", session_options=options)
+            if self.path:
+                model.save_pretrained(self.path)
+        else:
+            raise RuntimeError(f"No ONNX graph at {self.path} and export is disabled")
+
+        tokenizer = AutoTokenizer.from_pretrained(source)
+        if self.path and source != self.path:
+            tokenizer.save_pretrained(self.path)
+        return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+    def memory_bytes(self) -> int:
+        """Size of the ONNX graph and weights on disk (0 when unloaded)"""
+        if self.pipe is None or not self._has_saved_graph():
+            return 0
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path)
+                   if name.endswith((".onnx", ".onnx_data")))
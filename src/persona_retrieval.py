@@ -0,0 +1,150 @@
+import math, re, time, zlib
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from prometheus_client import Summary
+
+# Summary for time spent building the persona retrieval index
+PERSONA_INDEX_BUILD_DURATION = Summary(
+    'app_persona_index_build_seconds',
+    'Time spent building the persona few-shot retrieval index'
+)
+
+# Summary for time spent scoring persona samples against a user message
+PERSONA_RETRIEVAL_DURATION = Summary(
+    'app_persona_retrieval_seconds',
+    'Time spent selecting persona writing samples and attributes for a message'
+)
+
+# Summary of the estimated prompt tokens the selected grounding adds to the system prompt
+PERSONA_PROMPT_TOKENS = Summary(
+    'app_persona_prompt_tokens',
+    'Estimated tokens of persona grounding added to the system prompt'
+)
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i if in is it its me my not of on "
+    "or so that the their them then there they this to was we what when which who why will with "
+    "you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)"""
+    return max(1, math.ceil(len(text) / 4))
+
+class PersonaIndex:
+    """Hashed TF-IDF index over each persona's writing samples and notable attributes.
+
+    Every sample and attribute becomes one L2-normalised row of a float32
+    matrix; words are hashed into dim columns, so there is no vocabulary to
+    keep. A persona's rows are contiguous, so scoring a message is one
+    matrix-vector product over that slice. When a message shares no words
+    with any row, the persona's keywords are used as the query instead.
+    """
+
+    def __init__(self, prompts: Dict[str, Any], dim: int = 4096):
+        start = time.perf_counter()
+        self.dim = dim
+        self._items: List[Tuple[str, str]] = []
+        self._ranges: Dict[str, Tuple[int, int]] = {}
+        self._keywords: Dict[str, List[str]] = {}
+        token_rows: List[List[int]] = []
+        for name, persona in (prompts or {}).items():
+            if not isinstance(persona, dict):
+                continue
+            first = len(self._items)
+            for kind, key in (("sample", "writing_samples"), ("attribute", "notable_attributes")):
+                for text in persona.get(key, []):
+                    self._items.append((kind, text))
+                    token_rows.append(self._hash(tokenize(text)))
+            self._ranges[name] = (first, len(self._items))
+            self._keywords[name] = [word for keyword in persona.get("keywords", [])
+                                    for word in tokenize(keyword)]
+
+        # Document frequency per hashed column, then smoothed IDF
+        df = np.zeros(dim, dtype=np.float32)
+        for row in token_rows:
+            df[np.unique(row)] += 1
+        self.idf = (np.log((1 + len(token_rows)) / (1 + df)) + 1).astype(np.float32)
+
+        self.matrix = np.zeros((len(token_rows), dim), dtype=np.float32)
+        for i, row in enumerate(token_rows):
+            if row:
+                self.matrix[i] = np.bincount(row, minlength=dim) * self.idf
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.maximum(norms, 1e-12)
+
+        self.build_seconds = time.perf_counter() - start
+        PERSONA_INDEX_BUILD_DURATION.observe(self.build_seconds)
+        print(f"[PERSONA] Indexed {len(self._items)} samples/attributes for "
+              f"{len(self._ranges)} personas in {self.build_seconds * 1000:.1f} ms")
+
+    def _hash(self, tokens: List[str]) -> List[int]:
+        return [zlib.crc32(token.encode('utf-8')) % self.dim for token in tokens]
+
+    def _query(self, tokens: List[str]) -> np.ndarray:
+        columns = self._hash(tokens)
+        if not columns:
+            return np.zeros(self.dim, dtype=np.float32)
+        return np.bincount(columns, minlength=self.dim).astype(np.float32) * self.idf
+
+    def __contains__(self, persona: str) -> bool:
+        return persona in self._ranges
+
+    def rank(self, persona: str, message: str) -> List[Tuple[float, str, str]]:
+        """(score, kind, text) for the persona's samples and attributes, best first"""
+        if persona not in self._ranges:
+            return []
+        first, last = self._ranges[persona]
+        if first == last:
+            return []
+        rows = self.matrix[first:last]
+        scores = rows @ self._query(tokenize(message))
+        if not scores.any():
+            scores = rows @ self._query(self._keywords[persona])
+        order = np.argsort(-scores, kind="stable")
+        return [(float(scores[i]), *self._items[first + i]) for i in order]
+
+    def select(self, persona: str, message: str, token_budget: int = 96,
+               max_samples: int = 2, max_attributes: int = 2) -> Dict[str, List[str]]:
+        """Best samples and attributes for message, taken in score order until token_budget is spent"""
+        start = time.perf_counter()
+        limits = {"sample": max_samples, "attribute": max_attributes}
+        selected: Dict[str, List[str]] = {"sample": [], "attribute": []}
+        spent = 0
+        for _, kind, text in self.rank(persona, message):
+            if len(selected[kind]) >= limits[kind]:
+                continue
+            cost = estimate_tokens(text)
+            if spent + cost > token_budget:
+                continue
+            selected[kind].append(text)
+            spent += cost
+        PERSONA_RETRIEVAL_DURATION.observe(time.perf_counter() - start)
+        return selected
+
+    def grounding(self, persona: Optional[str], message: str, token_budget: int = 96,
+                  max_samples: int = 2, max_attributes: int = 2) -> str:
+        """Text to append to the persona's system prompt (empty if nothing fits)"""
+        if persona is None or persona not in self._ranges:
+            return ""
+        selected = self.select(persona, message, token_budget, max_samples, max_attributes)
+        parts = []
+        if selected["attribute"]:
+            parts.append("Traits: " + "; ".join(selected["attribute"]) + ".")
+        if selected["sample"]:
+            parts.append("Things you have said: " + " ".join(f'"{text}"' for text in selected["sample"]))
+        text = "\n" + "\n".join(parts) if parts else ""
+        PERSONA_PROMPT_TOKENS.observe(estimate_tokens(text) if text else 0)
+        return text
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], prompts: Dict[str, Any]) -> Optional["PersonaIndex"]:
+        """Index for prompts if persona_retrieval is enabled in config, else None"""
+        retrieval = config.get("persona_retrieval", {})
+        if not retrieval.get("enabled", False):
+            return None
+        return cls(prompts, dim=retrieval.get("hash_dim", 4096))
@@ -0,0 +1,232 @@
+"""
+Prefork serving mode for the local model.
+Usage: python src/prefork.py [--workers 4] [--threads-per-worker 8]
+
+The master process loads the LocalModel weights once and then forks the
+serving workers. The weights are never written after loading, so the forked
+workers keep sharing the parent's pages copy-on-write and N workers cost
+roughly the memory of one model. Each worker sets its own torch intra-op
+thread budget and serves its own Gradio UI on base_port + i, with its
+metrics/health endpoints on metrics_base_port + i.
+
+Linux only: relies on os.fork and /proc/<pid>/smaps_rollup.
+"""
+
+import argparse, gc, os, signal, sys, threading, time
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Gauge
+
+# Gauge labeled by kind (shared/private/rss/pss) with this process's memory
+PROCESS_MEMORY = Gauge(
+    'app_process_memory_bytes',
+    'Memory of this serving process split into pages shared with other processes and private pages',
+    ['kind']
+)
+
+_SMAPS_FIELDS = {
+    "Rss": "rss", "Pss": "pss",
+    "Shared_Clean": "shared", "Shared_Dirty": "shared",
+    "Private_Clean": "private", "Private_Dirty": "private",
+}
+
+def parse_smaps_rollup(text: str) -> Dict[str, int]:
+    """Sum /proc/<pid>/smaps_rollup into rss/pss/shared/private byte counts"""
+    usage = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    for line in text.splitlines():
+        field, _, value = line.partition(":")
+        kind = _SMAPS_FIELDS.get(field.strip())
+        if kind is None:
+            continue
+        amount, _, unit = value.strip().partition(" ")
+        usage[kind] += int(amount) * (1024 if unit.strip() == "kB" else 1)
+    return usage
+
+def memory_usage(pid: Optional[int] = None) -> Optional[Dict[str, int]]:
+    """Shared/private memory for a process, or None where smaps_rollup is unavailable"""
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            return parse_smaps_rollup(f.read())
+    except OSError:
+        return None
+
+def format_memory_report(usage_by_worker: Dict[str, Optional[Dict[str, int]]]) -> List[str]:
+    mb = 1024 * 1024
+    lines = [f"[PREFORK] {'process':<10} {'rss MB':>9} {'pss MB':>9} {'shared MB':>10} {'private MB':>11}"]
+    for name, usage in usage_by_worker.items():
+        if usage is None:
+            lines.append(f"[PREFORK] {name:<10} {'n/a':>9}")
+            continue
+        lines.append(f"[PREFORK] {name:<10} {usage['rss'] / mb:9.1f} {usage['pss'] / mb:9.1f} "
+                     f"{usage['shared'] / mb:10.1f} {usage['private'] / mb:11.1f}")
+    return lines
+
+def set_thread_budget(threads: int):
+    """Limit torch's intra-op thread pool for this process"""
+    if threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+class PreforkSupervisor:
+    """Forks worker processes after the expensive setup and restarts workers that exit"""
+
+    def __init__(self, workers: int, worker_main: Callable[[int], None],
+                 memory_report_seconds: float = 60.0, restart: bool = True):
+        self.workers = max(1, workers)
+        self.worker_main = worker_main
+        self.memory_report_seconds = memory_report_seconds
+        self.restart = restart
+        self.pids: Dict[int, int] = {}
+        self._stopping = threading.Event()
+
+    def _spawn(self, index: int) -> int:
+        # Hold SIGTERM/SIGINT across the fork until the child has dropped the
+        # supervisor's handlers; otherwise a signal arriving in that window
+        # would run the supervisor's stop() inside the worker
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM, signal.SIGINT})
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            code = 0
+            try:
+                self.worker_main(index)
+            except BaseException as e:
+                print(f"[PREFORK] Worker {index} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        self.pids[index] = pid
+        print(f"[PREFORK] Started worker {index} (pid {pid})")
+        return pid
+
+    def start(self) -> "PreforkSupervisor":
+        """Fork all workers. Call this after loading the model in this process."""
+        # Move everything allocated so far out of the collector's reach, so
+        # gc passes in the workers don't write to (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+        for index in range(self.workers):
+            self._spawn(index)
+        return self
+
+    def memory_report(self) -> Dict[str, Optional[Dict[str, int]]]:
+        report = {"master": memory_usage(os.getpid())}
+        for index, pid in sorted(self.pids.items()):
+            report[f"worker-{index}"] = memory_usage(pid)
+        return report
+
+    def log_memory_report(self):
+        for line in format_memory_report(self.memory_report()):
+            print(line)
+
+    def stop(self, sig: int = signal.SIGTERM):
+        """Signal every worker and wait for them to exit"""
+        self._stopping.set()
+        for pid in list(self.pids.values()):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+        for index, pid in list(self.pids.items()):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.pids.pop(index, None)
+
+    def wait(self):
+        """Supervise workers until stop() is called or every worker has exited"""
+        next_report = time.monotonic() + self.memory_report_seconds
+        while self.pids and not self._stopping.is_set():
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                index = next((i for i, p in self.pids.items() if p == pid), None)
+                if index is not None:
+                    del self.pids[index]
+                    code = os.waitstatus_to_exitcode(status)
+                    print(f"[PREFORK] Worker {index} (pid {pid}) exited with {code}")
+                    if self.restart and not self._stopping.is_set():
+                        self._spawn(index)
+                continue
+            if self.memory_report_seconds > 0 and time.monotonic() >= next_report:
+                self.log_memory_report()
+                next_report = time.monotonic() + self.memory_report_seconds
+            time.sleep(0.2)
+
+def _report_own_memory(interval: float):
+    while True:
+        usage = memory_usage()
+        if usage is not None:
+            for kind, value in usage.items():
+                PROCESS_MEMORY.labels(kind=kind).set(value)
+        time.sleep(interval)
+
+def main():
+    from config_manager import ConfigManager
+    from model_manager import LocalModel
+    from resource_governor import ResourceGovernor
+
+    config = ConfigManager().load_config()
+    prefork_config = config.get("prefork", {})
+    parser = argparse.ArgumentParser(description="Serve the chat UI from forked workers sharing one model")
+    parser.add_argument("--workers", type=int, default=prefork_config.get("workers", 2))
+    parser.add_argument("--threads-per-worker", type=int,
+                        default=prefork_config.get("threads_per_worker", 0))
+    parser.add_argument("--base-port", type=int, default=prefork_config.get("base_port", 7860))
+    parser.add_argument("--metrics-base-port", type=int,
+                        default=prefork_config.get("metrics_base_port", 8000))
+    args = parser.parse_args()
+
+    # Load on one thread: an intra-op pool started here would not survive the fork
+    set_thread_budget(1)
+    model = LocalModel(config["model"]["local_model_name"],
+                       model_kwargs=prefork_config.get("model_kwargs", {}))
+    model.load_model()
+    if not model.is_ready():
+        print("[PREFORK] Model failed to load; exiting", file=sys.stderr)
+        sys.exit(1)
+
+    report_seconds = prefork_config.get("memory_report_seconds", 60)
+    governor = ResourceGovernor(config.get("resources", {}))
+
+    def worker_main(index: int):
+        from app import ChatApp
+        from health import HealthServer
+
+        cores = governor.core_set_for(index)
+        if cores:
+            governor.pin(cores)
+        set_thread_budget(args.threads_per_worker or (len(cores) if cores else governor.intra_op_threads))
+        health_server = HealthServer(port=args.metrics_base_port + index).start()
+        if report_seconds > 0:
+            threading.Thread(target=_report_own_memory, args=(report_seconds,),
+                             name="memory-report", daemon=True).start()
+        app = ChatApp(local_model=model)
+        # supervisor.stop() sends SIGTERM: drain, then leave launch() through KeyboardInterrupt
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        app.drain.install_signal_handler()
+        health_server.attach(app.model_manager, app.chat_handler, app.config, drain_controller=app.drain)
+        app.launch(server_port=args.base_port + index)
+
+    supervisor = PreforkSupervisor(args.workers, worker_main, memory_report_seconds=report_seconds)
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop())
+    supervisor.start()
+    try:
+        supervisor.wait()
+    except KeyboardInterrupt:
+        supervisor.stop()
+
+if __name__ == "__main__":
+    main()
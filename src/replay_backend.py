@@ -0,0 +1,147 @@
+import gzip, hashlib, json, os, threading, time
+from typing import Any, Dict, Generator, List, Optional, Tuple
+from prometheus_client import Counter
+from model_manager import CancellationToken, ModelInterface
+
+# Counter labeled by result (exact, fallback) for how replayed requests were matched to recordings
+REPLAYED_STREAMS = Counter(
+    'app_replayed_streams_total',
+    'Responses served from recorded streams, by whether the conversation matched exactly',
+    ['match']
+)
+
+def conversation_key(messages: List[Dict[str, str]]) -> str:
+    """Stable key for a conversation: hash of its roles and contents"""
+    canonical = json.dumps([[m.get("role"), m.get("content")] for m in messages],
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def _open(path: str, mode: str):
+    # .gz recordings are written as one gzip member per append, which gzip reads back as one stream
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class StreamRecorder:
+    """Appends streamed responses to a JSON Lines file (gzipped if the path ends in .gz).
+
+    Each line is one response: the conversation key, model, sampling
+    parameters, request messages and the chunks as [seconds since the
+    previous chunk (or the request, for the first), text] pairs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any],
+               chunks: List[Tuple[float, str]]):
+        line = json.dumps({
+            "key": conversation_key(messages),
+            "model": model,
+            "params": params,
+            "messages": messages,
+            "chunks": [[round(delay, 4), text] for delay, text in chunks],
+        }, ensure_ascii=False, separators=(",", ":"))
+        with self._lock, _open(self.path, "a") as f:
+            f.write(line + "\n")
+
+def load_recordings(path: str) -> List[Dict[str, Any]]:
+    with _open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class ReplayModel(ModelInterface):
+    """Serves recorded response streams offline, for load tests and latency regressions.
+
+    A request whose conversation was recorded gets that recording; any other
+    request gets a recording picked deterministically from its key. timing
+    is "original" (the recorded gaps between chunks), "scaled" (the gaps
+    multiplied by time_scale) or "none" (no delay). It is served like the
+    API backend: no HF token, and no local scheduler or generation slots, so
+    a load test sees the API path's concurrency.
+    """
+
+    is_local = False
+
+    def __init__(self, path: str, timing: str = "original", time_scale: float = 1.0):
+        if timing not in ("original", "scaled", "none"):
+            raise ValueError(f"Unknown replay timing '{timing}'")
+        self.model_name = f"replay:{os.path.basename(path)}"
+        self.path = path
+        self.timing = timing
+        self.time_scale = time_scale
+        self.recordings: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+        self._loading = False
+        self._lock = threading.Lock()
+        # Set whenever no load is running, so generate() can wait for one in progress
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def load_model(self):
+        if self.begin_load():
+            self.complete_load()
+
+    def begin_load(self) -> bool:
+        """Mark the recordings as loading; False if they are loaded or already loading"""
+        with self._lock:
+            if self._loading or self._loaded:
+                return False
+            self._loading = True
+            self._idle.clear()
+            return True
+
+    def complete_load(self):
+        """Parse the recordings file for a load marked with begin_load()"""
+        try:
+            self.recordings = load_recordings(self.path)
+            self._by_key = {recording["key"]: recording for recording in self.recordings}
+            self._loaded = True
+            print(f"[REPLAY] Loaded {len(self.recordings)} recorded streams from {self.path}")
+        except Exception as e:
+            print(f"[REPLAY] Error loading recorded streams from {self.path}: {e}")
+        finally:
+            self._loading = False
+            self._idle.set()
+
+    def is_ready(self) -> bool:
+        return self._loaded and bool(self.recordings)
+
+    def is_loading(self) -> bool:
+        return self._loading
+
+    def conversations(self) -> List[List[Dict[str, str]]]:
+        """The recorded request messages, e.g. to drive a load test with them"""
+        return [recording["messages"] for recording in self.recordings]
+
+    def _delay(self, recorded: float) -> float:
+        if self.timing == "none":
+            return 0.0
+        return recorded * (self.time_scale if self.timing == "scaled" else 1.0)
+
+    def generate(self, messages: List[Dict[str, str]], max_tokens: int = 512,
+                 cancel_token: Optional[CancellationToken] = None,
+                 **kwargs) -> Generator[str, None, None]:
+        if not self._loaded:
+            self.load_model()
+            self._idle.wait()
+        if not self.recordings:
+            raise RuntimeError(f"No recorded streams in {self.path}")
+        key = conversation_key(messages)
+        recording = self._by_key.get(key)
+        REPLAYED_STREAMS.labels(match="exact" if recording is not None else "fallback").inc()
+        if recording is None:
+            recording = self.recordings[int(key, 16) % len(self.recordings)]
+        for delay, text in recording["chunks"][:max_tokens]:
+            delay = self._delay(delay)
+            if delay > 0:
+                time.sleep(delay)
+            if cancel_token is not None:
+                if cancel_token.cancelled:
+                    return
+                cancel_token.generated_tokens += 1
+            yield text
@@ -0,0 +1,114 @@
+import os, threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from prometheus_client import Gauge
+
+# Gauge for local generations currently holding a compute slot
+ACTIVE_GENERATIONS = Gauge(
+    'app_local_generations_active',
+    'Number of local model generations currently running'
+)
+
+# Gauge for local generations waiting for a compute slot
+WAITING_GENERATIONS = Gauge(
+    'app_local_generations_waiting',
+    'Number of local model generations waiting for a free compute slot'
+)
+
+def available_cores() -> List[int]:
+    """Cores this process may run on (respects cgroup/taskset limits where the OS reports them)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+class ResourceGovernor:
+    """Sizes torch's thread pools and caps concurrent local generations to fit the cores available.
+
+    Without it a single generation uses every core, and concurrent requests
+    oversubscribe the CPU. intra_op_threads x max_concurrent_generations is
+    kept at or under the number of cores: set either one and the other is
+    derived, or leave both at 0 for one generation using every core. If both
+    are set and their product is over the core count, intra_op_threads is
+    lowered to fit.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, cores: Optional[List[int]] = None):
+        config = config or {}
+        self.cores = list(cores) if cores is not None else available_cores()
+        self.cpu_affinity: Optional[List[int]] = config.get("cpu_affinity")
+        if self.cpu_affinity:
+            self.cores = list(self.cpu_affinity)
+        self.worker_core_sets: List[List[int]] = config.get("worker_core_sets") or []
+        self.inter_op_threads: int = config.get("inter_op_threads", 1)
+
+        core_count = max(1, len(self.cores))
+        intra = config.get("intra_op_threads", 0) or 0
+        concurrency = config.get("max_concurrent_generations", 0) or 0
+        if intra and not concurrency:
+            concurrency = max(1, core_count // intra)
+        elif concurrency and not intra:
+            intra = max(1, core_count // concurrency)
+        elif not intra and not concurrency:
+            intra, concurrency = core_count, 1
+        elif intra * concurrency > core_count:
+            fitted = max(1, core_count // concurrency)
+            print(f"[GOVERNOR] {intra} intra-op threads x {concurrency} concurrent generations "
+                  f"oversubscribes {core_count} cores; using {fitted} intra-op threads")
+            intra = fitted
+        self.intra_op_threads = intra
+        self.max_concurrent_generations = concurrency
+
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._applied = False
+
+    def apply(self):
+        """Pin the process and size torch's thread pools. Call before the model runs anything."""
+        if self._applied:
+            return
+        self._applied = True
+        if self.cpu_affinity:
+            self.pin(self.cpu_affinity)
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(self.intra_op_threads)
+        try:
+            # Only allowed once, before any inter-op parallel work has started
+            torch.set_num_interop_threads(self.inter_op_threads)
+        except RuntimeError as e:
+            print(f"[GOVERNOR] Could not set inter-op threads: {e}")
+        print(f"[GOVERNOR] {self.intra_op_threads} intra-op threads, {self.inter_op_threads} inter-op, "
+              f"{self.max_concurrent_generations} concurrent generations on {len(self.cores)} cores")
+
+    def core_set_for(self, worker_index: int) -> Optional[List[int]]:
+        """Cores for a forked model worker, or None when workers aren't pinned"""
+        if not self.worker_core_sets:
+            return None
+        return self.worker_core_sets[worker_index % len(self.worker_core_sets)]
+
+    @staticmethod
+    def pin(cores: List[int]) -> bool:
+        """Restrict this process to the given cores; False where the OS can't"""
+        try:
+            os.sched_setaffinity(0, set(cores))
+            return True
+        except (AttributeError, OSError) as e:
+            print(f"[GOVERNOR] Could not pin to cores {cores}: {e}")
+            return False
+
+    @contextmanager
+    def generation_slot(self):
+        """Hold one of the max_concurrent_generations slots for the duration of a generation"""
+        WAITING_GENERATIONS.inc()
+        try:
+            self._slots.acquire()
+        finally:
+            WAITING_GENERATIONS.dec()
+        ACTIVE_GENERATIONS.inc()
+        try:
+            yield
+        finally:
+            ACTIVE_GENERATIONS.dec()
+            self._slots.release()
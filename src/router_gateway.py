@@ -0,0 +1,364 @@
+"""
+Session- and persona-affine routing gateway in front of several app replicas.
+Usage: python src/router_gateway.py [--port 7850] [--replica http://127.0.0.1:7860 ...]
+
+Requests are placed on a consistent-hash ring keyed by the Gradio session
+(session_hash), falling back to the persona named in the request and then
+the client address, so a session's history and a persona's caches stay warm
+on one replica. Placement uses bounded loads: a replica already carrying
+more than load_factor times the average in-flight load is skipped and the
+key moves to the next replica on the ring, so a hot persona spreads out
+instead of swamping its home replica. A session stays pinned to the replica
+that served its first request (Gradio's queue join and its event stream
+must reach the same process). Adding or removing a replica only moves the
+keys that hashed to it.
+
+With no --replica, the prefork workers from app_config.json are used
+(base_port + i, probed through /readyz on metrics_base_port + i).
+"""
+
+import argparse, bisect, hashlib, http.client, json, math, re, sys, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from prometheus_client import Counter, Gauge
+
+# Gauge labeled by replica for requests the gateway currently has open to it
+GATEWAY_REPLICA_LOAD = Gauge(
+    'app_gateway_replica_in_flight',
+    'Requests currently proxied to each replica',
+    ['replica']
+)
+
+# Counter labeled by replica and key kind (session, persona, client) for routed requests
+GATEWAY_REQUESTS = Counter(
+    'app_gateway_requests_total',
+    'Requests routed to each replica',
+    ['replica', 'key']
+)
+
+# Counter labeled by result (hit, miss, new) for whether a key landed on the replica that served it last
+GATEWAY_AFFINITY = Counter(
+    'app_gateway_affinity_total',
+    'Routed requests whose key went to the same replica as its previous request (hit), a different one (miss), or was new',
+    ['result']
+)
+
+# Gauge labeled by replica: 1 while the replica is on the ring, 0 while it is marked down
+GATEWAY_REPLICA_UP = Gauge(
+    'app_gateway_replica_up',
+    'Whether each replica is currently receiving traffic',
+    ['replica']
+)
+
+_HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+               "trailers", "transfer-encoding", "upgrade", "content-length"}
+
+def _hash(value: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+class ConsistentHashRing:
+    """Consistent-hash ring with virtual nodes and bounded-load placement"""
+
+    def __init__(self, replicas: Iterable[str] = (), virtual_nodes: int = 100, load_factor: float = 1.25):
+        self.virtual_nodes = virtual_nodes
+        self.load_factor = load_factor
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.replicas: List[str] = []
+        for replica in replicas:
+            self.add(replica)
+
+    def add(self, replica: str):
+        if replica in self.replicas:
+            return
+        self.replicas.append(replica)
+        for i in range(self.virtual_nodes):
+            point = _hash(f"{replica}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, replica)
+
+    def remove(self, replica: str):
+        if replica not in self.replicas:
+            return
+        self.replicas.remove(replica)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != replica]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def _walk(self, key: str):
+        """Distinct replicas in ring order starting at key's position"""
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        seen = set()
+        for i in range(len(self._points)):
+            owner = self._owners[(start + i) % len(self._points)]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+                if len(seen) == len(self.replicas):
+                    return
+
+    def home(self, key: str) -> Optional[str]:
+        """Replica that owns key when load is ignored"""
+        return next(self._walk(key), None)
+
+    def capacity(self, loads: Dict[str, int]) -> int:
+        """Most in-flight requests a replica may hold before keys spill past it"""
+        total = sum(loads.get(replica, 0) for replica in self.replicas)
+        return max(1, math.ceil(self.load_factor * (total + 1) / max(1, len(self.replicas))))
+
+    def choose(self, key: str, loads: Dict[str, int]) -> Optional[str]:
+        """First replica from key's position that is under the bounded-load capacity"""
+        capacity = self.capacity(loads)
+        first = None
+        for replica in self._walk(key):
+            first = first or replica
+            if loads.get(replica, 0) < capacity:
+                return replica
+        return first
+
+def request_key(path: str, body: bytes, personas: Iterable[str] = (),
+                client: str = "") -> Tuple[str, str]:
+    """(kind, key) to route on: the Gradio session, else a persona named in the request, else the client"""
+    query = parse_qs(urlsplit(path).query)
+    if query.get("session_hash"):
+        return "session", query["session_hash"][0]
+    text = body.decode('utf-8', errors='ignore') if body else ""
+    if text.lstrip().startswith("{"):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and payload.get("session_hash"):
+            return "session", str(payload["session_hash"])
+    haystack = urlsplit(path).path + " " + text
+    for persona in personas:
+        if re.search(rf"\b{re.escape(persona)}\b", haystack):
+            return "persona", persona
+    return "client", client
+
+class Router:
+    """Chooses a replica per request and tracks per-replica load and affinity"""
+
+    def __init__(self, replicas: Iterable[str], virtual_nodes: int = 100, load_factor: float = 1.25,
+                 max_tracked_keys: int = 100000):
+        self.ring = ConsistentHashRing(replicas, virtual_nodes, load_factor)
+        self.max_tracked_keys = max_tracked_keys
+        self.loads: Dict[str, int] = {replica: 0 for replica in self.ring.replicas}
+        # Replica that last served each key, least recently used first; sessions stay on it
+        self._last: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        for replica in self.ring.replicas:
+            GATEWAY_REPLICA_UP.labels(replica=replica).set(1)
+
+    def add(self, replica: str):
+        with self._lock:
+            self.ring.add(replica)
+            self.loads.setdefault(replica, 0)
+        GATEWAY_REPLICA_UP.labels(replica=replica).set(1)
+        print(f"[GATEWAY] Replica joined: {replica}")
+
+    def remove(self, replica: str):
+        with self._lock:
+            if replica not in self.ring.replicas:
+                return
+            # Sessions pinned there move to their next replica on their next request
+            self.ring.remove(replica)
+        GATEWAY_REPLICA_UP.labels(replica=replica).set(0)
+        print(f"[GATEWAY] Replica left: {replica}")
+
+    def route(self, kind: str, key: str) -> Optional[str]:
+        tracked = f"{kind}:{key}"
+        with self._lock:
+            previous = self._last.get(tracked)
+            if kind == "session" and previous in self.ring.replicas:
+                replica = previous
+            else:
+                replica = self.ring.choose(tracked, self.loads)
+            if replica is None:
+                return None
+            self._last[tracked] = replica
+            self._last.move_to_end(tracked)
+            while len(self._last) > self.max_tracked_keys:
+                self._last.popitem(last=False)
+        result = "new" if previous is None else ("hit" if previous == replica else "miss")
+        GATEWAY_AFFINITY.labels(result=result).inc()
+        GATEWAY_REQUESTS.labels(replica=replica, key=kind).inc()
+        return replica
+
+    @contextmanager
+    def in_flight(self, replica: str):
+        with self._lock:
+            self.loads[replica] = self.loads.get(replica, 0) + 1
+        GATEWAY_REPLICA_LOAD.labels(replica=replica).inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.loads[replica] -= 1
+            GATEWAY_REPLICA_LOAD.labels(replica=replica).dec()
+
+class RouterGateway:
+    """HTTP reverse proxy that forwards each request to the replica the Router picks.
+
+    Responses are streamed through as they arrive, so Gradio's server-sent
+    event streams work. Replicas that refuse connections (or fail their
+    health_url probe) are taken off the ring and put back once they answer.
+    """
+
+    def __init__(self, replicas: List[Dict[str, str]], port: int = 7850, addr: str = '0.0.0.0',
+                 personas: Iterable[str] = (), virtual_nodes: int = 100, load_factor: float = 1.25,
+                 probe_seconds: float = 5.0, timeout: float = 600.0):
+        self.replicas = {replica["url"].rstrip("/"): replica.get("health_url") for replica in replicas}
+        self.router = Router(self.replicas, virtual_nodes, load_factor)
+        self.personas = list(personas)
+        self.port = port
+        self.addr = addr
+        self.probe_seconds = probe_seconds
+        self.timeout = timeout
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+
+    def _probe(self, url: str) -> bool:
+        target = urlsplit(self.replicas[url] or url + "/")
+        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=self.probe_seconds or 5)
+        try:
+            connection.request("GET", target.path or "/")
+            return connection.getresponse().status < 500
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+    def probe_all(self):
+        """Put answering replicas on the ring and take the others off"""
+        for url in self.replicas:
+            if self._probe(url):
+                if url not in self.router.ring.replicas:
+                    self.router.add(url)
+            elif url in self.router.ring.replicas:
+                self.router.remove(url)
+
+    def forward(self, handler: BaseHTTPRequestHandler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        kind, key = request_key(handler.path, body, self.personas, handler.client_address[0])
+        # Try the chosen replica, then the next ones if it turns out to be down
+        for _ in range(max(1, len(self.replicas))):
+            replica = self.router.route(kind, key)
+            if replica is None:
+                break
+            target = urlsplit(replica)
+            connection = http.client.HTTPConnection(target.hostname, target.port, timeout=self.timeout)
+            with self.router.in_flight(replica):
+                try:
+                    headers = {name: value for name, value in handler.headers.items()
+                               if name.lower() not in _HOP_BY_HOP}
+                    headers["X-Forwarded-For"] = handler.client_address[0]
+                    connection.request(handler.command, handler.path, body=body or None, headers=headers)
+                    response = connection.getresponse()
+                except OSError as e:
+                    connection.close()
+                    print(f"[GATEWAY] {replica} unreachable ({e}); rerouting")
+                    self.router.remove(replica)
+                    continue
+                try:
+                    handler.send_response(response.status, response.reason)
+                    for name, value in response.getheaders():
+                        if name.lower() not in _HOP_BY_HOP:
+                            handler.send_header(name, value)
+                    handler.send_header("X-Routed-To", replica)
+                    handler.send_header("Connection", "close")
+                    handler.end_headers()
+                    while True:
+                        chunk = response.read1(64 * 1024)
+                        if not chunk:
+                            break
+                        handler.wfile.write(chunk)
+                        handler.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client went away; closing upstream lets the replica cancel
+                finally:
+                    connection.close()
+                return
+        handler.send_error(503, "No replica available")
+
+    def _make_handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self): gateway.forward(self)
+            def do_POST(self): gateway.forward(self)
+            def do_PUT(self): gateway.forward(self)
+            def do_DELETE(self): gateway.forward(self)
+            def do_HEAD(self): gateway.forward(self)
+
+            def log_message(self, format, *args):
+                pass  # every request is counted in the gateway metrics instead
+
+        return Handler
+
+    def start(self) -> "RouterGateway":
+        self._server = ThreadingHTTPServer((self.addr, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="router-gateway", daemon=True).start()
+        if self.probe_seconds > 0:
+            def probe():
+                while not self._stop.wait(self.probe_seconds):
+                    self.probe_all()
+
+            threading.Thread(target=probe, name="gateway-probe", daemon=True).start()
+        print(f"[GATEWAY] Routing port {self.port} across {len(self.replicas)} replicas")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def main():
+    from config_manager import ConfigManager
+    from health import HealthServer
+
+    config_manager = ConfigManager()
+    config = config_manager.load_config()
+    gateway_config = config.get("gateway", {})
+    prefork_config = config.get("prefork", {})
+    parser = argparse.ArgumentParser(description="Route chat traffic across replicas by session and persona")
+    parser.add_argument("--port", type=int, default=gateway_config.get("port", 7850))
+    parser.add_argument("--metrics-port", type=int, default=gateway_config.get("metrics_port", 8100))
+    parser.add_argument("--replica", action="append", default=[],
+                        help="Replica base URL (repeatable); defaults to the prefork workers")
+    args = parser.parse_args()
+
+    replicas = [{"url": url} for url in args.replica] or gateway_config.get("replicas") or [
+        {"url": f"http://127.0.0.1:{prefork_config.get('base_port', 7860) + i}",
+         "health_url": f"http://127.0.0.1:{prefork_config.get('metrics_base_port', 8000) + i}/readyz"}
+        for i in range(prefork_config.get("workers", 2))
+    ]
+    HealthServer(port=args.metrics_port).start()
+    gateway = RouterGateway(
+        replicas, port=args.port,
+        personas=config_manager.load_prompts().keys(),
+        virtual_nodes=gateway_config.get("virtual_nodes", 100),
+        load_factor=gateway_config.get("load_factor", 1.25),
+        probe_seconds=gateway_config.get("probe_seconds", 5.0),
+    ).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        gateway.stop()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
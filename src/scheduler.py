@@ -0,0 +1,215 @@
+import itertools, threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from prometheus_client import Counter, Gauge, Summary
+
+# Counter for local requests rejected because their session ran out of token budget
+THROTTLED_REQUESTS = Counter(
+    'app_scheduler_throttled_requests_total',
+    'Total number of local model requests rejected by the per-session rate limit'
+)
+
+# Gauge for sessions whose token bucket is currently too low for a default-sized request
+THROTTLED_SESSIONS = Gauge(
+    'app_scheduler_throttled_sessions',
+    'Number of sessions currently being throttled by the per-session rate limit'
+)
+
+# Gauge for sessions with a request waiting for or holding a local generation slot
+ACTIVE_SESSIONS = Gauge(
+    'app_scheduler_active_sessions',
+    'Number of sessions with local model requests queued or running'
+)
+
+# Summary for how long requests wait in the scheduler before generating
+QUEUE_WAIT = Summary(
+    'app_scheduler_queue_wait_seconds',
+    'Time local model requests spend waiting for a generation slot'
+)
+
+class Throttled(Exception):
+    """Raised when a session has spent its token budget; retry_after is in seconds"""
+
+    def __init__(self, session_id: str, retry_after: float):
+        super().__init__(f"session {session_id} is rate limited for {retry_after:.1f}s")
+        self.session_id = session_id
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Refills at rate tokens per second up to capacity"""
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """Take amount tokens; returns 0 on success, otherwise seconds until they'd be available"""
+        self.refill(now)
+        # A request bigger than the bucket may go through once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+class _Ticket:
+    __slots__ = ("session_id", "cost", "finish", "seq", "enqueued")
+
+    def __init__(self, session_id: str, cost: float, finish: float, seq: int, enqueued: float):
+        self.session_id = session_id
+        self.cost = cost
+        self.finish = finish
+        self.seq = seq
+        self.enqueued = enqueued
+
+class FairScheduler:
+    """Grants local generation slots fairly across sessions.
+
+    Each session has a token bucket refilled at tokens_per_second (a request
+    costs its max_tokens), so a single user can't keep the model busy on
+    their own. Waiting requests are then served by weighted fair queuing:
+    every session advances its own virtual clock by cost / weight, and the
+    request with the smallest finish tag goes next, so light sessions aren't
+    stuck behind a heavy one's backlog. With shortest_job_first, smaller
+    requests go first, except that requests waiting longer than
+    max_wait_seconds go ahead of everything so large ones still finish.
+    """
+
+    def __init__(self, capacity: int, config: Optional[Dict[str, Any]] = None):
+        self.capacity = max(1, capacity)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting: List[_Ticket] = []
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._sessions: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """Set the rate limit and ordering options (also used to apply a config reload)"""
+        config = config or {}
+        with self._cond:
+            self.tokens_per_second: float = config.get("tokens_per_second", 0)
+            self.burst_tokens: float = config.get("burst_tokens", 4096)
+            self.shortest_job_first: bool = config.get("shortest_job_first", False)
+            self.max_wait_seconds: float = config.get("max_wait_seconds", 30.0)
+            self.idle_session_seconds: float = config.get("idle_session_seconds", 600.0)
+            self.default_cost: float = config.get("default_cost", 512)
+            # Existing buckets keep their tokens but use the new rate and size
+            for bucket in self._buckets.values():
+                bucket.rate = self.tokens_per_second
+                bucket.capacity = self.burst_tokens
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+            self._cond.notify_all()
+
+    def _priority(self, ticket: _Ticket, now: float):
+        aged = now - ticket.enqueued >= self.max_wait_seconds
+        cost = ticket.cost if self.shortest_job_first else 0
+        return (0 if aged else 1, 0 if aged else cost, ticket.finish, ticket.seq)
+
+    def _next(self, now: float) -> Optional[_Ticket]:
+        if not self._waiting:
+            return None
+        return min(self._waiting, key=lambda ticket: self._priority(ticket, now))
+
+    def _check_rate(self, session_id: str, cost: float, now: float):
+        if self.tokens_per_second <= 0:
+            return
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = TokenBucket(self.tokens_per_second, self.burst_tokens, now)
+        retry_after = bucket.take(cost, now)
+        self._update_throttled(now)
+        if retry_after:
+            THROTTLED_REQUESTS.inc()
+            raise Throttled(session_id, retry_after)
+
+    def _update_throttled(self, now: float):
+        throttled = 0
+        for bucket in self._buckets.values():
+            bucket.refill(now)
+            if bucket.tokens < min(self.default_cost, bucket.capacity):
+                throttled += 1
+        THROTTLED_SESSIONS.set(throttled)
+
+    def _forget_idle(self, now: float):
+        """Drop state for idle sessions; by then their bucket would have refilled anyway"""
+        for session_id, last_seen in list(self._last_seen.items()):
+            if session_id not in self._sessions and now - last_seen > self.idle_session_seconds:
+                del self._last_seen[session_id]
+                self._buckets.pop(session_id, None)
+                self._last_finish.pop(session_id, None)
+
+    def _enter(self, session_id: str):
+        self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+        ACTIVE_SESSIONS.set(len(self._sessions))
+
+    def _leave(self, session_id: str):
+        remaining = self._sessions.get(session_id, 1) - 1
+        if remaining:
+            self._sessions[session_id] = remaining
+        else:
+            self._sessions.pop(session_id, None)
+        ACTIVE_SESSIONS.set(len(self._sessions))
+
+    def acquire(self, session_id: str, cost: Optional[float] = None, weight: float = 1.0,
+                timeout: Optional[float] = None) -> bool:
+        """Wait for a generation slot. Raises Throttled if the session is over its rate limit;
+        returns False if timeout expires first."""
+        cost = float(cost or self.default_cost)
+        with self._cond:
+            now = time.monotonic()
+            self._forget_idle(now)
+            self._last_seen[session_id] = now
+            self._check_rate(session_id, cost, now)
+            start = max(self._virtual_time, self._last_finish.get(session_id, 0.0))
+            finish = start + cost / max(weight, 1e-6)
+            self._last_finish[session_id] = finish
+            ticket = _Ticket(session_id, cost, finish, next(self._seq), now)
+            self._waiting.append(ticket)
+            self._enter(session_id)
+
+            deadline = None if timeout is None else now + timeout
+            while not (self._running < self.capacity and self._next(time.monotonic()) is ticket):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._leave(session_id)
+                    self._cond.notify_all()
+                    return False
+                # Wake up periodically so aging can promote long waiters
+                self._cond.wait(min(remaining, 1.0) if remaining is not None else 1.0)
+
+            self._waiting.remove(ticket)
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, ticket.finish - cost / max(weight, 1e-6))
+            QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued)
+            return True
+
+    def release(self, session_id: str):
+        with self._cond:
+            self._running -= 1
+            self._leave(session_id)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, session_id: str, cost: Optional[float] = None, weight: float = 1.0):
+        """Hold a generation slot for the duration of the block"""
+        self.acquire(session_id, cost, weight)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._waiting)
@@ -0,0 +1,128 @@
+import importlib, threading, time
+from typing import Any, Callable, Dict, List, Optional
+from prometheus_client import Gauge
+
+# Gauge labeled by stage name with how long each startup stage took
+STARTUP_STAGE_DURATION = Gauge(
+    'app_startup_stage_seconds',
+    'Time spent in each application startup stage',
+    ['stage']
+)
+
+# Gauge for wall-clock time from the start of startup until the UI was built
+STARTUP_TIME_TO_UI = Gauge(
+    'app_startup_time_to_ui_seconds',
+    'Time from the start of application startup until the UI was built'
+)
+
+def preload_modules(module_names: List[str]) -> List[str]:
+    """Import heavy modules ahead of first use. Returns the names that imported."""
+    loaded = []
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError as e:
+            print(f"[STARTUP] Skipping preload of {name}: {e}")
+    return loaded
+
+class StartupStages:
+    """Runs named startup stages inline or on background threads and times each one"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._results: Dict[str, Any] = {}
+        self._errors: Dict[str, BaseException] = {}
+        self._order: List[str] = []
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, elapsed: float):
+        with self._lock:
+            self.timings[name] = elapsed
+        STARTUP_STAGE_DURATION.labels(stage=name).set(elapsed)
+
+    def _call(self, name: str, fn: Callable, args, kwargs):
+        start = time.perf_counter()
+        try:
+            self._results[name] = fn(*args, **kwargs)
+        except BaseException as e:
+            self._errors[name] = e
+            print(f"[STARTUP] Stage {name} failed: {e}")
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def run(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run a stage on the calling thread and return its result"""
+        self._order.append(name)
+        self._call(name, fn, args, kwargs)
+        if name in self._errors:
+            raise self._errors[name]
+        return self._results[name]
+
+    def start(self, name: str, fn: Callable, *args, **kwargs) -> threading.Thread:
+        """Start a stage on a daemon thread; collect it later with wait()"""
+        thread = threading.Thread(target=self._call, args=(name, fn, args, kwargs),
+                                  name=f"startup-{name}", daemon=True)
+        self._order.append(name)
+        self._threads[name] = thread
+        thread.start()
+        return thread
+
+    def track(self, name: str, thread: threading.Thread) -> threading.Thread:
+        """Time a thread started elsewhere (e.g. model loading) as a stage"""
+        start = time.perf_counter()
+
+        def watch():
+            thread.join()
+            self._record(name, time.perf_counter() - start)
+
+        watcher = threading.Thread(target=watch, name=f"startup-{name}", daemon=True)
+        self._order.append(name)
+        self._threads[name] = watcher
+        watcher.start()
+        return watcher
+
+    def is_done(self, name: str) -> bool:
+        thread = self._threads.get(name)
+        return name in self.timings and (thread is None or not thread.is_alive())
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Wait for a background stage and return its result (None if it is still running)"""
+        thread = self._threads.get(name)
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                return None
+        if name in self._errors:
+            raise self._errors[name]
+        return self._results.get(name)
+
+    def mark_ui_ready(self):
+        """Record time-to-UI and log the stages finished so far"""
+        elapsed = time.perf_counter() - self.started_at
+        STARTUP_TIME_TO_UI.set(elapsed)
+        print(f"[STARTUP] UI built after {elapsed:.2f}s")
+        self.report()
+
+    def report(self):
+        """Log the per-stage breakdown, marking stages that are still running"""
+        with self._lock:
+            timings = dict(self.timings)
+        for name in self._order:
+            if name in timings:
+                status = "failed" if name in self._errors else "done"
+                print(f"[STARTUP] {name:<16} {timings[name]:8.2f}s ({status})")
+            else:
+                print(f"[STARTUP] {name:<16} {'...':>8}  (running)")
+
+    def report_when_done(self):
+        """Log the final breakdown once every background stage has finished"""
+        def wait_all():
+            for thread in list(self._threads.values()):
+                thread.join()
+            print(f"[STARTUP] All stages finished after {time.perf_counter() - self.started_at:.2f}s")
+            self.report()
+
+        threading.Thread(target=wait_all, name="startup-report", daemon=True).start()
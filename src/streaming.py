@@ -0,0 +1,153 @@
+import queue, threading, time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from prometheus_client import Counter
+
+# Counter for deltas (tokens/fragments) received from backends while streaming
+STREAM_DELTAS = Counter(
+    'app_stream_deltas_total',
+    'Total number of response deltas received from backends'
+)
+
+# Counter for UI updates sent while streaming (each carries one or more deltas)
+STREAM_FRAMES = Counter(
+    'app_stream_frames_total',
+    'Total number of streamed response frames sent to the UI'
+)
+
+class ResponseAssembler:
+    """Collects streamed deltas and coalesces them into UI frames.
+
+    Deltas are buffered in a list and joined once per frame rather than
+    concatenated one by one. A frame (the full text so far, which is what
+    Gradio's ChatInterface expects) is emitted for the first delta, and then
+    only once flush_interval seconds have passed or flush_chars characters
+    have accumulated since the last frame. stream() also flushes buffered
+    text once flush_interval has passed while the backend is still silent.
+    """
+
+    def __init__(self, flush_interval: float = 0.03, flush_chars: int = 32,
+                 clock: Callable[[], float] = time.monotonic):
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self._clock = clock
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._text = ""
+        self._last_flush: Optional[float] = None
+        self.deltas = 0
+        self.frames = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ResponseAssembler":
+        streaming = config.get("streaming", {})
+        return cls(flush_interval=streaming.get("flush_interval_ms", 30) / 1000.0,
+                   flush_chars=streaming.get("flush_chars", 32))
+
+    def add(self, delta: str) -> Optional[str]:
+        """Buffer a delta; returns the text to show if a frame is due, else None"""
+        if not delta:
+            return None
+        self._pending.append(delta)
+        self._pending_chars += len(delta)
+        self.deltas += 1
+        STREAM_DELTAS.inc()
+        if self._last_flush is None or self._pending_chars >= self.flush_chars or \
+                self._clock() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return None
+
+    def stream(self, deltas: Iterator[Any]) -> Iterator[str]:
+        """Yield the frames for a stream of deltas.
+
+        Deltas are pulled inline until text is first left buffered. From then
+        on a helper thread reads them ahead into a queue, so waiting for the
+        next one can end at the flush deadline and the buffered text be shown
+        while the backend is still silent. Closing this generator closes
+        deltas; a delta being read at that moment is finished first.
+        """
+        pump = None
+        try:
+            while True:
+                try:
+                    if pump is None and not self._pending:
+                        delta = next(deltas)
+                    else:
+                        if pump is None:
+                            pump = _DeltaPump(deltas)
+                        timeout = self._last_flush + self.flush_interval - self._clock() if self._pending else None
+                        delta = pump.get(timeout)
+                except StopIteration:
+                    break
+                except queue.Empty:
+                    yield self.flush()
+                    continue
+                frame = self.add(delta if isinstance(delta, str) else str(delta))
+                if frame is not None:
+                    yield frame
+            frame = self.finish()
+            if frame is not None:
+                yield frame
+        finally:
+            if pump is not None:
+                pump.stop()
+            elif hasattr(deltas, "close"):
+                deltas.close()
+
+    def flush(self) -> str:
+        """Fold pending deltas into the text and emit a frame"""
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending.clear()
+            self._pending_chars = 0
+        self._last_flush = self._clock()
+        self.frames += 1
+        STREAM_FRAMES.inc()
+        return self._text
+
+    def finish(self) -> Optional[str]:
+        """Flush whatever is still buffered; returns the final frame, or None if nothing was pending"""
+        return self.flush() if self._pending else None
+
+    @property
+    def text(self) -> str:
+        """Everything received so far, including deltas not yet flushed"""
+        if self._pending:
+            return self._text + "".join(self._pending)
+        return self._text
+
+
+class _DeltaPump:
+    """Reads an iterator on its own thread into a queue"""
+
+    def __init__(self, deltas: Iterator[Any]):
+        self._deltas = deltas
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, name="stream-pump", daemon=True).start()
+
+    def _run(self):
+        try:
+            for delta in self._deltas:
+                if self._stopped.is_set():
+                    break
+                self._queue.put((delta, None))
+            self._queue.put((None, StopIteration()))
+        except BaseException as e:
+            self._queue.put((None, e))
+        finally:
+            if hasattr(self._deltas, "close"):
+                try:
+                    self._deltas.close()
+                except Exception as e:
+                    print(f"[STREAM] Error closing the backend stream: {e}")
+
+    def get(self, timeout: Optional[float]) -> Any:
+        """The next delta. Raises queue.Empty after timeout seconds, or what the iterator raised"""
+        delta, error = self._queue.get(timeout=None if timeout is None else max(0.0, timeout))
+        if error is not None:
+            raise error
+        return delta
+
+    def stop(self):
+        """Stop reading, and close the iterator once the delta being read arrives"""
+        self._stopped.set()
@@ -1,27 +1,91 @@
 import gradio as gr
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Callable
 import os
 
-from chat_handler import ChatHandler
+from chat_handler import ChatHandler, bind_gradio_annotations
 from ui_image_scraper import UIImageScraper
 
 class UIFactory:
-    theme = gr.themes.Default()
-
     """Factory for creating UI components"""
+
+    _theme = None
+
     @staticmethod
-    def create_chatbot_interface(chat_handler: ChatHandler, config: Dict[str, Any]) -> gr.Blocks:
-        """Create the main chatbot interface using Blocks context"""
-        image_paths = UIImageScraper().download_images_to_local()
-        gallery_items = [(img_path, os.path.basename(img_path).rsplit('.', 1)[0]) for img_path in image_paths]
+    def theme() -> gr.themes.Base:
+        """Shared theme, built on first use rather than at import"""
+        if UIFactory._theme is None:
+            UIFactory._theme = gr.themes.Default()
+        return UIFactory._theme
+
+    @staticmethod
+    def create_chatbot_interface(chat_handler: ChatHandler, config: Dict[str, Any],
+                                 image_paths: Optional[List[str]] = None,
+                                 pending_images: Optional[Callable[[], Optional[List[str]]]] = None,
+                                 scraper: Optional[UIImageScraper] = None) -> gr.Blocks:
+        """Create the main chatbot interface using Blocks context
+
+        Images come from image_paths if given; otherwise from pending_images, a
+        callable returning the processed paths once the asset stage is done (or
+        None while it is still running), in which case the gallery starts with
+        placeholders and swaps in the real images when they are ready. With
+        neither, images are downloaded before building the interface.
+        """
+        bind_gradio_annotations()
+        scraper = scraper or UIImageScraper()
+        if image_paths is None and pending_images is None:
+            image_paths = scraper.download_images_to_local()
+        ui_config = config["ui"]
 
-        with gr.Blocks(theme=UIFactory.theme) as demo:
+        def build_assets(paths):
+            # Serve the smallest variant that still fills a gallery cell, and a
+            # larger one only for the selected philosopher
+            items = [
+                (scraper.select_variant(img_path, ui_config.get("gallery_image_width", 240)),
+                 os.path.basename(img_path).rsplit('.', 1)[0])
+                for img_path in paths
+            ]
+            previews = {
+                os.path.basename(img_path).rsplit('.', 1)[0]:
+                    scraper.select_variant(img_path, ui_config.get("preview_image_width", 640))
+                for img_path in paths
+            }
+            return items, previews
+
+        assets = {"ready": image_paths is not None}
+        if image_paths is not None:
+            assets["items"], assets["previews"] = build_assets(image_paths)
+        else:
+            placeholder = scraper.placeholder_path()
+            assets["items"] = [(placeholder, key) for key in scraper.image_keys()]
+            assets["previews"] = {}
+
+        def current_assets():
+            """Swap in the real images the first time they are available"""
+            if not assets["ready"]:
+                paths = pending_images()
+                if paths is not None:
+                    assets["items"], assets["previews"] = build_assets(paths)
+                    assets["ready"] = True
+            return assets["items"], assets["previews"]
+
+        gallery_items, preview_paths = current_assets()
+        first_key = gallery_items[0][1] if gallery_items else None
+        if assets["ready"]:
+            gallery_value, selected_value = gallery_items, preview_paths.get(first_key)
+        else:
+            # Evaluated on every page load, so visitors arriving after the asset
+            # stage finished never see the placeholders
+            gallery_value = lambda: current_assets()[0]
+            selected_value = lambda: current_assets()[1].get(first_key)
+
+        with gr.Blocks(theme=UIFactory.theme()) as demo:
             # State to hold the selected philosopher key
-            selected_philosopher_key = gr.State(value=gallery_items[0][1] if gallery_items else None)
+            selected_philosopher_key = gr.State(value=first_key)
 
             def on_gallery_select(evt: gr.SelectData):
                 print(f"Gallery selected: {evt.value['caption']}")
-                return str(evt.value['caption'])
+                caption = str(evt.value['caption'])
+                return caption, current_assets()[1].get(caption)
 
             gr.Markdown(
                 value=config["ui"]["value"]
@@ -29,16 +93,40 @@ class UIFactory:
 
             # Gallery at the top
             gallery = gr.Gallery(
-                value=gallery_items,
+                value=gallery_value,
                 label="Philosopher Images",
                 object_fit="contain",
                 elem_id="image-gallery",
                 columns=3,
                 height="auto",
                 selected_index=0,
+                allow_preview=False,
                 show_label=True
             )
-            gallery.select(on_gallery_select, outputs=selected_philosopher_key)
+            selected_image = gr.Image(
+                value=selected_value,
+                label="Selected Philosopher",
+                elem_id="selected-image",
+                interactive=False,
+                show_label=False
+            )
+            gallery.select(on_gallery_select, outputs=[selected_philosopher_key, selected_image])
+
+            if not assets["ready"]:
+                # Poll until the asset stage finishes, then replace the placeholders
+                asset_timer = gr.Timer(value=ui_config.get("asset_poll_seconds", 1.0))
+
+                def refresh_assets(selected_key):
+                    items, previews = current_assets()
+                    if not assets["ready"]:
+                        return gr.skip(), gr.skip(), gr.Timer(active=True)
+                    return items, previews.get(selected_key), gr.Timer(active=False)
+
+                asset_timer.tick(
+                    refresh_assets,
+                    inputs=selected_philosopher_key,
+                    outputs=[gallery, selected_image, asset_timer]
+                )
 
             # Create all the control components first (but don't render them yet)
             max_tokens_slider = gr.Slider(
@@ -65,32 +153,86 @@ class UIFactory:
                 label="Top-p (nucleus sampling)",
                 render=False  # Don't render yet
             )
-            use_local_checkbox = gr.Checkbox(
-                label="Use Local Model", 
-                value=config["defaults"]["use_local_model"],
+            backend_dropdown = gr.Dropdown(
+                choices=chat_handler.model_manager.backend_names(),
+                value=chat_handler.resolve_backend(None),
+                label="Backend",
                 render=False  # Don't render yet
             )
 
-            # Create the chat interface with all additional inputs
-            chat = gr.ChatInterface(
-                fn=chat_handler.respond,
-                additional_inputs=[
-                    selected_philosopher_key,
-                    max_tokens_slider,
-                    temperature_slider,
-                    top_p_slider,
-                    use_local_checkbox
-                ],
-                type="messages",
-            )
+            additional_inputs = [
+                selected_philosopher_key,
+                max_tokens_slider,
+                temperature_slider,
+                top_p_slider,
+                backend_dropdown
+            ]
+            local_model_names = chat_handler.model_manager.local_model_names()
+            if len(local_model_names) > 1:
+                # Only offered when several local models are configured
+                additional_inputs.append(gr.Dropdown(
+                    choices=local_model_names,
+                    value=local_model_names[0],
+                    label="Local model",
+                    render=False  # Don't render yet
+                ))
+
+            if chat_handler.conversations is not None:
+                # The server keeps the history, so the client doesn't send it
+                UIFactory.create_stored_chat(chat_handler, additional_inputs)
+            else:
+                # Create the chat interface with all additional inputs
+                chat = gr.ChatInterface(
+                    fn=chat_handler.respond,
+                    additional_inputs=additional_inputs,
+                    type="messages",
+                )
 
         return demo
 
+    @staticmethod
+    def create_stored_chat(chat_handler: ChatHandler, additional_inputs: List[gr.components.Component]):
+        """Chat whose history lives in the conversation store.
+
+        Unlike gr.ChatInterface, the chatbot is only an output: each turn sends
+        the message and the settings, and the displayed history comes back
+        from the server's copy. Stop cancels the session's reply in progress,
+        as ChatInterface's stop button does.
+        """
+        chatbot = gr.Chatbot(type="messages", label="Chatbot")
+        with gr.Row():
+            textbox = gr.Textbox(placeholder="Type a message...", show_label=False, submit_btn=True, scale=8)
+            stop_button = gr.Button("Stop", variant="stop", scale=1, min_width=80)
+        with gr.Accordion("Additional Inputs", open=False):
+            for component in additional_inputs:
+                if not component.is_rendered:
+                    component.render()
+
+        def respond(message: str, philosopher, max_tokens, temperature, top_p, backend,
+                    hf_token: Optional[gr.OAuthToken] = None, request: gr.Request = None,
+                    local_model_name: Optional[str] = None):
+            shown = chat_handler.stored_history(request) + [{"role": "user", "content": message}]
+            yield "", shown
+            for text in chat_handler.respond(message, None, philosopher, max_tokens, temperature, top_p,
+                                             backend, hf_token, request, local_model_name):
+                yield "", shown + [{"role": "assistant", "content": text}]
+
+        def stop(request: gr.Request):
+            chat_handler.cancel(request)
+
+        def clear(request: gr.Request):
+            chat_handler.clear_conversation(request)
+
+        textbox.submit(respond, inputs=[textbox] + additional_inputs, outputs=[textbox, chatbot])
+        stop_button.click(stop)
+        chatbot.clear(clear)
+        return chatbot
+
     @staticmethod
     def create_main_interface(chatbot: gr.ChatInterface, config: Dict[str, Any], 
                             css: str) -> gr.Blocks:
         """Create the main application interface"""
-        with gr.Blocks(css=css, theme=UIFactory.theme) as demo:
+        with gr.Blocks(css=css, theme=UIFactory.theme()) as demo:
             # We no longer require interactive login. The app reads HF token from HF_TOKEN environment variable.
             with gr.Row():
                 gr.Markdown("""
@@ -1,5 +1,157 @@
-import os, json, requests, io
-from PIL import Image
+import os, sys, json, requests, io, time, hashlib, tempfile, threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from PIL import Image, features
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _target_dimensions(transform_params):
+    """Output (width, height) when resizing is enabled, else None."""
+    resize_config = transform_params.get('resize', {})
+    if not resize_config.get('enabled', False):
+        return None
+    base_size = resize_config.get('base_size', 280)
+    aspect_ratio = resize_config.get('aspect_ratio', {})
+    width_mult = aspect_ratio.get('width_multiplier', 4)
+    height_mult = aspect_ratio.get('height_multiplier', 3)
+    return (base_size * width_mult, base_size * height_mult)
+
+
+_FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+def variant_outputs(filepath, settings):
+    """List the variant files produced alongside a processed image.
+
+    Each variant is written to <output dir>/<variant name>/<stem><ext>, one file
+    per format, so the stem (used as the persona key) is preserved.
+
+    Returns a list of dicts with "name", "format", "quality", "size" and "path".
+    Formats this Pillow build cannot encode are skipped.
+    """
+    transform_params = settings.get('transform_parameters', {})
+    aspect_ratio = transform_params.get('resize', {}).get('aspect_ratio', {})
+    width_mult = aspect_ratio.get('width_multiplier', 4)
+    height_mult = aspect_ratio.get('height_multiplier', 3)
+    directory, filename = os.path.split(filepath)
+    stem = os.path.splitext(filename)[0]
+
+    outputs = []
+    for variant in settings.get('variants', []):
+        base_size = variant.get('base_size', 80)
+        for output_format, quality in variant.get('formats', {'JPEG': 85}).items():
+            output_format = output_format.upper()
+            if output_format == 'WEBP' and not features.check('webp'):
+                continue
+            extension = _FORMAT_EXTENSIONS.get(output_format, '.' + output_format.lower())
+            outputs.append({
+                "name": variant['name'],
+                "format": output_format,
+                "quality": quality,
+                "size": (base_size * width_mult, base_size * height_mult),
+                "path": os.path.join(directory, variant['name'], stem + extension),
+            })
+    return outputs
+
+
+def transform_image(source, filepath, settings):
+    """Decode, transform and encode one image. Returns the (width, height) it was decoded at.
+
+    Kept at module level (and free of scraper state) so it can run in a
+    ProcessPoolExecutor worker.
+
+    Args:
+        source: Path, file object or raw bytes of the original image.
+        filepath (str): Where to write the processed image.
+        settings (dict): "transform_parameters", "image_quality", "draft_decode"
+                         and "variants", as produced by the scraper config.
+    """
+    transform_params = settings.get('transform_parameters', {})
+    image_quality = settings.get('image_quality', 95)
+    draft_decode = settings.get('draft_decode', True)
+    grayscale = transform_params.get('convert_to_grayscale', False)
+    dimensions = _target_dimensions(transform_params)
+    variants = variant_outputs(filepath, settings)
+    resampling = getattr(Image.Resampling, transform_params.get('resize', {}).get('resampling', 'LANCZOS'))
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    with Image.open(source) as image:
+        if draft_decode and dimensions:
+            if image.format == 'JPEG':
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale (and straight to
+                # grayscale) while staying at least as large as the target
+                image.draft('L' if grayscale else 'RGB', dimensions)
+            else:
+                factor = min(image.width // dimensions[0], image.height // dimensions[1])
+                if factor > 1:
+                    image = image.reduce(factor)
+        image.load()
+        decoded_size = image.size
+
+        # Convert to grayscale if specified
+        if grayscale:
+            image = image.convert('L')
+
+        # Resize if enabled
+        if dimensions:
+            image = image.resize(dimensions, resampling)
+
+        # Save image
+        output_format = transform_params.get('output_format', 'JPEG')
+        if output_format.upper() == 'JPEG':
+            image.save(filepath, output_format, quality=image_quality)
+        else:
+            image.save(filepath, output_format)
+
+        # Smaller variants are resampled from the already-resized image
+        resized = {}
+        for variant in variants:
+            if variant["size"] not in resized:
+                resized[variant["size"]] = image.resize(variant["size"], resampling)
+            os.makedirs(os.path.dirname(variant["path"]), exist_ok=True)
+            resized[variant["size"]].save(variant["path"], variant["format"], quality=variant["quality"])
+
+    return decoded_size
+
+
+def create_transform_pool(workers, start_method=None):
+    """Create a process pool for transform_image and start all workers immediately.
+
+    Workers are started up front, from the calling thread, so that with the
+    "fork" start method they are never forked while fetch threads are running.
+    """
+    context = multiprocessing.get_context(start_method)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    list(pool.map(int, range(workers)))
+    return pool
+
+
+def transform_images(jobs, settings, workers=0):
+    """Run transform_image over (source, filepath) jobs, serially or on a process pool.
+
+    Returns the decoded sizes in job order.
+    """
+    if workers <= 1:
+        return [transform_image(source, filepath, settings) for source, filepath in jobs]
+    with create_transform_pool(workers) as pool:
+        futures = [pool.submit(transform_image, source, filepath, settings) for source, filepath in jobs]
+        return [future.result() for future in futures]
 
 
 class UIImageScraper:
@@ -24,6 +176,10 @@ class UIImageScraper:
         self.config_path = config_path
         self.output_dir_override = output_dir
         self.config = self._load_config()
+        self.timings = []
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.memory_report = {}
+        self._decode_lock = threading.Lock()
     
     def _load_config(self):
         """Load configuration from JSON file."""
@@ -35,63 +191,373 @@ class UIImageScraper:
         with open(self.config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     
-    def download_images_to_local(self):
-        """Download and process images according to configuration. Returns a list of successfully downloaded file paths."""
+    def _create_session(self, pool_size):
+        """Create a pooled HTTP session shared by all fetches."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(self.config.get('request_headers', {}))
+        return session
+
+    def _transform_settings(self):
+        """Every parameter that affects the processed output file."""
+        return {
+            "transform_parameters": self.config.get('transform_parameters', {}),
+            "image_quality": self.config.get('image_quality', 95),
+            "draft_decode": self.config.get('memory', {}).get('draft_decode', True),
+            "variants": self.config.get('variants', []),
+        }
+
+    def _process_image(self, source, filepath):
+        """Apply the configured transforms to an image file object (or raw bytes) and save the result."""
+        return transform_image(source, filepath, self._transform_settings())
+
+    def output_dir(self):
+        return self.output_dir_override or self.config.get('output_directory', 'images')
+
+    def image_keys(self):
+        """Persona keys (file stems) of the configured images, in config order."""
+        return [os.path.splitext(item.get("filename"))[0] for item in self.config.get('image_data', [])]
+
+    def placeholder_path(self):
+        """Path to a neutral placeholder image shown while the real images are prepared."""
+        path = os.path.join(self.output_dir(), '.cache', 'placeholder.png')
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            variants = variant_outputs(path, self._transform_settings())
+            size = min((v["size"] for v in variants), default=(320, 240))
+            Image.new('L', size, color=64).save(path, 'PNG')
+        return path
+
+    def variants_for(self, filepath):
+        """Variant files configured for a processed image, smallest first."""
+        outputs = variant_outputs(filepath, self._transform_settings())
+        return sorted(outputs, key=lambda v: (v["size"][0], v["format"] != 'WEBP'))
+
+    def select_variant(self, filepath, min_width, prefer_webp=True):
+        """Pick the smallest existing file for a processed image that is at least min_width wide.
+
+        Falls back to the processed image itself, which is the largest output.
+        """
+        for variant in self.variants_for(filepath):
+            if variant["format"] == 'WEBP' and not prefer_webp:
+                continue
+            if variant["size"][0] >= min_width and os.path.isfile(variant["path"]):
+                return variant["path"]
+        return filepath
+
+    def _read_body(self, response, filename, to_disk=False):
+        """Stream a response body into a spooled temp file, enforcing the size cap.
+
+        Small bodies stay in memory; larger ones spill to disk so a big original
+        never has to be held as one bytes object. With to_disk the body always
+        goes to a named file (which the caller deletes), so a transform pool
+        worker can open it by path.
+        """
+        memory_config = self.config.get('memory', {})
+        max_bytes = memory_config.get('max_download_bytes', 50 * 1024 * 1024)
+        spool_bytes = memory_config.get('spool_max_memory_bytes', 8 * 1024 * 1024)
+
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ValueError(f"{filename} is {content_length} bytes, over the {max_bytes} byte limit")
+
+        if to_disk:
+            body = tempfile.NamedTemporaryFile(prefix='scraper-', delete=False)
+        else:
+            body = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"{filename} exceeded the {max_bytes} byte limit while streaming")
+                body.write(chunk)
+        except Exception:
+            body.close()
+            if to_disk:
+                os.unlink(body.name)
+            raise
+        body.seek(0)
+        return body
+
+    def _transform_hash(self):
+        """Hash of the transform settings, used in cache keys."""
+        encoded = json.dumps(self._transform_settings(), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+    @staticmethod
+    def _file_sha256(filepath):
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _manifest_path(self, output_dir):
+        cache_config = self.config.get('cache', {})
+        # Kept in a subdirectory so the output directory itself only holds images
+        return os.path.join(output_dir, cache_config.get('manifest_path', os.path.join('.cache', 'manifest.json')))
+
+    def _load_manifest(self, output_dir):
+        """Load the cache manifest, treating a missing or corrupt file as empty."""
+        manifest_path = self._manifest_path(output_dir)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, output_dir, manifest):
+        """Write the manifest atomically so a crash never leaves it half written."""
+        manifest_path = self._manifest_path(output_dir)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    def _valid_cache_entry(self, entry, filename, filepath):
+        """Return the manifest entry if its processed file is still on disk and intact."""
+        if not entry or entry.get("filename") != filename or not os.path.isfile(filepath):
+            return None
+        if not all(os.path.isfile(v["path"]) for v in variant_outputs(filepath, self._transform_settings())):
+            return None
+        try:
+            if self._file_sha256(filepath) != entry.get("sha256"):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def _download_one(self, session, item, output_dir, request_timeout, deadline=None,
+                      cache_entry=None, cache_mode="off", transform_pool=None, stop=None):
+        """Fetch and process a single image. Returns a timing record.
+
+        cache_mode is "off", "revalidate" (conditional GET against cache_entry),
+        "trust" (use a valid cache_entry as-is, fetch only when it is missing) or
+        "offline" (serve cache_entry without touching the network). Once the
+        stop event is set the batch has given up and is closing the session
+        and transform pool, so neither is touched again.
+        """
+        url = item.get("url")
+        filename = item.get("filename")
+        filepath = os.path.join(output_dir, filename)
+        record = {"filename": filename, "path": None, "fetch_seconds": None,
+                  "process_seconds": None, "decoded_size": None, "status": "error",
+                  "cache": None, "manifest_entry": None}
+
+        cached = None
+        if cache_mode != "off":
+            cached = self._valid_cache_entry(cache_entry, filename, filepath)
+            record["cache"] = "hit" if cached else "miss"
+            if cached and cache_mode in ("trust", "offline"):
+                record.update(path=filepath, status="cached", manifest_entry=cached)
+                return record
+            if cache_mode == "offline":
+                record["status"] = "offline_miss"
+                print(f"✗ No cached copy of {filename} available offline")
+                return record
+
+        request_headers = {}
+        if cached:
+            if cached.get("etag"):
+                request_headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                request_headers["If-Modified-Since"] = cached["last_modified"]
+
+        if stop is not None and stop.is_set():
+            record["status"] = "timeout"
+            return record
+
+        body = None
+        try:
+            start = time.perf_counter()
+            with session.get(url, timeout=request_timeout, headers=request_headers,
+                             stream=True) as response:
+                if response.status_code == 200:
+                    body = self._read_body(response, filename, to_disk=transform_pool is not None)
+            record["fetch_seconds"] = time.perf_counter() - start
+
+            if (stop is not None and stop.is_set()) or (deadline is not None and time.perf_counter() > deadline):
+                # The batch already gave up on this image; don't write a late file
+                record["status"] = "timeout"
+            elif response.status_code == 304 and cached:
+                record.update(path=filepath, status="not_modified", manifest_entry=cached)
+                print(f"✓ Cache still valid: {filepath}")
+            elif response.status_code == 200:
+                record["cache"] = "miss" if cache_mode != "off" else None
+                if transform_pool is not None:
+                    # Hand the transform to the process pool; this fetch thread
+                    # just waits, so fetching and transforming overlap across images.
+                    # The worker reads the original from the temp file, so it is
+                    # never held in memory here.
+                    body.close()
+                    start = time.perf_counter()
+                    record["decoded_size"] = tuple(transform_pool.submit(
+                        transform_image, body.name, filepath, self._transform_settings()).result())
+                    record["process_seconds"] = time.perf_counter() - start
+                else:
+                    # Decode one image at a time so concurrent fetches never hold
+                    # several full-size bitmaps at once
+                    with self._decode_lock, body:
+                        start = time.perf_counter()
+                        record["decoded_size"] = self._process_image(body, filepath)
+                        record["process_seconds"] = time.perf_counter() - start
+                record["path"] = filepath
+                record["status"] = "ok"
+                if cache_mode != "off":
+                    record["manifest_entry"] = {
+                        "url": url,
+                        "filename": filename,
+                        "transform_hash": self._transform_hash(),
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "sha256": self._file_sha256(filepath),
+                    }
+                print(f"✓ Downloaded and processed: {filepath}")
+            else:
+                record["status"] = f"http_{response.status_code}"
+                print(f"✗ Failed to fetch {filename}. Status code: {response.status_code}")
+
+        except Exception as e:
+            print(f"✗ Error processing {filename}: {str(e)}")
+        finally:
+            if body is not None:
+                body.close()
+                if transform_pool is not None:
+                    os.unlink(body.name)
+
+        if record["path"] is None and cached:
+            # Upstream unreachable or erroring: keep serving the cached copy
+            print(f"✓ Using cached copy of {filename} ({record['status']})")
+            record.update(path=filepath, status="cached", manifest_entry=cached)
+
+        return record
+
+    def download_images_to_local(self, concurrent=None, offline=None):
+        """Download and process images according to configuration. Returns a list of successfully downloaded file paths.
+
+        Args:
+            concurrent (bool): Fetch images in parallel on a thread pool. If None,
+                               uses the "concurrent" setting from the "fetch" config.
+            offline (bool): Serve only from the on-disk cache without any network
+                            access. If None, uses the "offline" cache setting or the
+                            UI_SCRAPER_OFFLINE environment variable.
+        """
         # Use override directory or config directory
-        output_dir = self.output_dir_override or self.config.get('output_directory', 'images')
+        output_dir = self.output_dir()
         os.makedirs(output_dir, exist_ok=True)
 
         image_data = self.config.get('image_data', [])
-        headers = self.config.get('request_headers', {})
-        transform_params = self.config.get('transform_parameters', {})
-        image_quality = self.config.get('image_quality', 95)
+        fetch_config = self.config.get('fetch', {})
+        request_timeout = fetch_config.get('request_timeout', 10)
+        overall_timeout = fetch_config.get('overall_timeout', 60)
+        if concurrent is None:
+            concurrent = fetch_config.get('concurrent', True)
+        max_concurrency = max(1, fetch_config.get('max_concurrency', 4)) if concurrent else 1
 
-        successful_files = []
+        cache_config = self.config.get('cache', {})
+        if offline is None:
+            offline = cache_config.get('offline', False) or os.environ.get('UI_SCRAPER_OFFLINE') == '1'
+        if not cache_config.get('enabled', False):
+            cache_mode = "off"
+        elif offline:
+            cache_mode = "offline"
+        elif cache_config.get('revalidate', True):
+            cache_mode = "revalidate"
+        else:
+            cache_mode = "trust"
+        manifest = self._load_manifest(output_dir) if cache_mode != "off" else {}
+        transform_hash = self._transform_hash()
 
-        for item in image_data:
-            url = item.get("url")
-            filename = item.get("filename")
-            filepath = os.path.join(output_dir, filename)
+        def cache_key(item):
+            return f"{item.get('url')}#{transform_hash}"
 
-            try:
-                response = requests.get(url, stream=True, headers=headers)
+        # Transforms run inline in the fetch threads unless a process pool is configured
+        transform_config = self.config.get('transform', {})
+        transform_workers = transform_config.get('workers', 0)
+        transform_pool = None
+        if transform_workers > 1 and cache_mode != "offline":
+            transform_pool = create_transform_pool(transform_workers, transform_config.get('start_method'))
 
-                if response.status_code == 200:
-                    image = Image.open(io.BytesIO(response.content))
-
-                    # Convert to grayscale if specified
-                    if transform_params.get('convert_to_grayscale', False):
-                        image = image.convert('L')
-
-                    # Resize if enabled
-                    resize_config = transform_params.get('resize', {})
-                    if resize_config.get('enabled', False):
-                        base_size = resize_config.get('base_size', 280)
-                        aspect_ratio = resize_config.get('aspect_ratio', {})
-                        width_mult = aspect_ratio.get('width_multiplier', 4)
-                        height_mult = aspect_ratio.get('height_multiplier', 3)
-
-                        dimensions = (base_size * width_mult, base_size * height_mult)
-                        resampling = getattr(Image.Resampling, resize_config.get('resampling', 'LANCZOS'))
-                        image = image.resize(dimensions, resampling)
-
-                    # Save image
-                    output_format = transform_params.get('output_format', 'JPEG')
-                    if output_format.upper() == 'JPEG':
-                        image.save(filepath, output_format, quality=image_quality)
-                    else:
-                        image.save(filepath, output_format)
-
-                    print(f"✓ Downloaded and processed: {filepath}")
-                    successful_files.append(filepath)
+        stop = threading.Event()
 
+        def download(session, item, deadline=None):
+            return self._download_one(session, item, output_dir, request_timeout, deadline,
+                                      cache_entry=manifest.get(cache_key(item)),
+                                      cache_mode=cache_mode, transform_pool=transform_pool, stop=stop)
+
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        records = []
+        try:
+            with self._create_session(max_concurrency) as session:
+                if max_concurrency == 1:
+                    for item in image_data:
+                        records.append(download(session, item))
                 else:
-                    print(f"✗ Failed to fetch {filename}. Status code: {response.status_code}")
+                    deadline = start + overall_timeout
+                    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+                    futures = [executor.submit(download, session, item, deadline) for item in image_data]
+                    wait(futures, timeout=overall_timeout)
+                    # Don't block on stragglers past the overall deadline; their
+                    # per-request timeout still bounds how long the workers live.
+                    # The stop event keeps them off the session and transform
+                    # pool, which are closed below.
+                    stop.set()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    for item, future in zip(image_data, futures):
+                        if future.done() and not future.cancelled():
+                            records.append(future.result())
+                        else:
+                            print(f"✗ Timed out fetching {item.get('filename')}")
+                            records.append({"filename": item.get("filename"), "path": None,
+                                            "fetch_seconds": None, "process_seconds": None,
+                                            "decoded_size": None, "status": "timeout",
+                                            "cache": None, "manifest_entry": None})
+        finally:
+            stop.set()
+            if transform_pool is not None:
+                transform_pool.shutdown(wait=False, cancel_futures=True)
+
+        if cache_mode != "off":
+            for item, record in zip(image_data, records):
+                if record["manifest_entry"]:
+                    manifest[cache_key(item)] = record["manifest_entry"]
+            self._save_manifest(output_dir, manifest)
+        self.cache_stats = {
+            "hits": sum(1 for record in records if record["cache"] == "hit"),
+            "misses": sum(1 for record in records if record["cache"] == "miss"),
+        }
 
-            except Exception as e:
-                print(f"✗ Error processing {filename}: {str(e)}")
+        self.timings = records
+        elapsed = time.perf_counter() - start
+        print(f"[TIMING] Fetched {len(image_data)} images in {elapsed:.2f}s "
+              f"(concurrency={max_concurrency}, transform_workers={transform_workers})")
+        for record in records:
+            fetch_s = record['fetch_seconds']
+            process_s = record['process_seconds']
+            print(f"[TIMING] {record['filename']}: status={record['status']} "
+                  f"fetch={'-' if fetch_s is None else f'{fetch_s:.3f}s'} "
+                  f"process={'-' if process_s is None else f'{process_s:.3f}s'}")
+        decoded = [record["decoded_size"] for record in records if record["decoded_size"]]
+        self.memory_report = {
+            "peak_rss_mb_before": rss_before,
+            "peak_rss_mb_after": peak_rss_mb(),
+            "max_decoded_pixels": max((w * h for w, h in decoded), default=0),
+        }
+        if rss_before is not None:
+            print(f"[MEMORY] Peak RSS {self.memory_report['peak_rss_mb_before']:.1f} MB -> "
+                  f"{self.memory_report['peak_rss_mb_after']:.1f} MB, largest decode "
+                  f"{self.memory_report['max_decoded_pixels'] / 1e6:.2f} MP")
+        if cache_mode != "off":
+            print(f"[CACHE] mode={cache_mode} hits={self.cache_stats['hits']} "
+                  f"misses={self.cache_stats['misses']}")
 
-        return successful_files
+        return [record["path"] for record in records if record["path"]]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+import copy, importlib, importlib.abc, importlib.util, os, sys
+import pytest
+
+# The modules in src/ import each other by bare name (that is how src/app.py
+# runs on HuggingFace), while the tests import them as src.<module>. Alias
+# src.<module> to the bare module so each one is loaded only once; otherwise
+# module-level Prometheus metrics would be registered twice.
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+class _SrcAliasFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def find_spec(self, fullname, path, target=None):
+        prefix, _, name = fullname.partition('.')
+        if prefix == 'src' and name and '.' not in name and \
+                os.path.isfile(os.path.join(SRC_DIR, name + '.py')):
+            return importlib.util.spec_from_loader(fullname, self)
+        return None
+
+    def create_module(self, spec):
+        return importlib.import_module(spec.name.partition('.')[2])
+
+    def exec_module(self, module):
+        pass
+
+
+if not any(isinstance(finder, _SrcAliasFinder) for finder in sys.meta_path):
+    sys.meta_path.insert(0, _SrcAliasFinder())
+
+
+# Only importable once the alias finder is installed
+from src.config_manager import ConfigManager
+
+
+@pytest.fixture
+def config():
+    """A copy of the app config that a test can change freely"""
+    return copy.deepcopy(ConfigManager().load_config())
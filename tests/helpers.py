@@ -0,0 +1,20 @@
+from src.model_manager import ModelInterface
+
+class StubModel(ModelInterface):
+    """A backend that is always ready and streams chunks instantly.
+
+    chunks is a list of strings, or a function of the messages returning them.
+    The messages of the latest call are kept in self.messages.
+    """
+    model_name = "stub"
+
+    def __init__(self, chunks=("ok",)):
+        self.chunks = chunks
+        self.messages = None
+
+    def is_ready(self): return True
+    def is_loading(self): return False
+
+    def generate(self, messages, **kwargs):
+        self.messages = messages
+        yield from self.chunks(messages) if callable(self.chunks) else self.chunks
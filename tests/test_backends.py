@@ -0,0 +1,96 @@
+import pytest
+from src.config_manager import ConfigManager
+from src.model_manager import (BACKEND_TYPES, ModelInterface, ModelManager, LocalModel,
+                               create_backend, register_backend)
+from src.chat_handler import ChatHandler
+
+class EchoBackend(ModelInterface):
+    def __init__(self, reply="echo"):
+        self.reply = reply
+        self.loads = 0
+        self.ready = False
+
+    def load_model(self):
+        self.loads += 1
+        self.ready = True
+
+    def is_ready(self): return self.ready
+    def is_loading(self): return False
+    def generate(self, messages, **kwargs):
+        yield self.reply
+
+@pytest.fixture
+def echo_type():
+    register_backend("echo", EchoBackend)
+    yield "echo"
+    BACKEND_TYPES.pop("echo", None)
+
+@pytest.fixture
+def config(echo_type, config):
+    config["backends"]["echo"] = {"type": "echo", "reply": "from echo", "preload": True}
+    return config
+
+def make_handler(config):
+    return ChatHandler(ModelManager(config), config, ConfigManager().load_prompts())
+
+def test_declared_backends_are_built(config):
+    manager = ModelManager(config)
+    assert manager.backend_names()[:2] == ["local", "api"]
+    assert isinstance(manager.backends["echo"], EchoBackend)
+    assert manager.backends["echo"].reply == "from echo"
+    assert "onnx" not in manager.backends  # disabled in the shipped config
+
+def test_respond_routes_by_backend_name(config):
+    handler = make_handler(config)
+    reply = list(handler.respond("Hi", [], None, 8, 0.7, 0.9, "echo"))[-1]
+    assert reply == "from echo"
+    assert handler.model_manager.backends["echo"].loads == 1
+    list(handler.respond("Hi", [], None, 8, 0.7, 0.9, "echo"))
+    assert handler.model_manager.backends["echo"].loads == 1
+
+def test_preloaded_with_the_local_model(config):
+    manager = ModelManager(config)
+    manager._load_local_model()
+    assert manager.backends["echo"].is_ready()
+
+def test_use_local_model_still_selects_local_or_api(config):
+    handler = make_handler(config)
+    assert handler.resolve_backend(True) == "local"
+    assert handler.resolve_backend(False) == "api"
+    assert handler.resolve_backend("missing") == handler.resolve_backend(None)
+    config["defaults"]["backend"] = "echo"
+    assert handler.resolve_backend(None) == "echo"
+
+def test_unknown_backend_type():
+    with pytest.raises(ValueError):
+        create_backend({"type": "nope"})
+
+def test_onnx_backend_resolved_lazily():
+    backend = create_backend({"type": "onnx", "model": "tiny-model", "path": "/tmp/missing-onnx",
+                              "export": False, "enabled": True, "preload": False})
+    assert isinstance(backend, LocalModel)
+    assert backend.model_name == "tiny-model"
+    assert not backend.is_ready()
+
+class RemoteEcho(ModelInterface):
+    is_local = False
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def is_ready(self): return True
+    def generate(self, messages, hf_token=None, **kwargs):
+        self.calls += 1
+        yield self.reply
+
+def test_each_remote_backend_serves_its_own_requests(config, monkeypatch):
+    monkeypatch.setitem(BACKEND_TYPES, "remote_echo", RemoteEcho)
+    monkeypatch.setenv("HF_TOKEN", "test-token")
+    config["backends"]["remote_a"] = {"type": "remote_echo", "reply": "from a"}
+    config["backends"]["remote_b"] = {"type": "remote_echo", "reply": "from b"}
+    handler = make_handler(config)
+    backends = handler.model_manager.backends
+    assert list(handler.respond("Hi", [], None, 8, 0.7, 0.9, "remote_a"))[-1] == "from a"
+    assert list(handler.respond("Hi", [], None, 8, 0.7, 0.9, "remote_b"))[-1] == "from b"
+    assert backends["remote_a"].calls == 1 and backends["remote_b"].calls == 1
@@ -0,0 +1,133 @@
+import pytest
+import huggingface_hub
+from types import SimpleNamespace
+from src.config_manager import ConfigManager
+from src.model_manager import CancellationToken, ModelManager
+from src.chat_handler import ChatHandler, CANCELLED_REQUESTS, CANCELLED_TOKENS_SAVED
+from helpers import StubModel
+
+class StreamingModel(StubModel):
+    def __init__(self, tokens=20):
+        self.tokens = tokens
+        self.produced = 0
+        self.cancel_token = None
+
+    def generate(self, messages, max_tokens=512, cancel_token=None, **kwargs):
+        self.cancel_token = cancel_token
+        for i in range(min(self.tokens, max_tokens)):
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            self.produced += 1
+            cancel_token.generated_tokens += 1
+            yield f"t{i} "
+
+class FakeInferenceClient:
+    instances = []
+
+    def __init__(self, token=None, model=None):
+        self.closed = False
+        self.streamed = 0
+        FakeInferenceClient.instances.append(self)
+
+    def chat_completion(self, messages, **kwargs):
+        for i in range(kwargs["max_tokens"]):
+            self.streamed += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"w{i} "))])
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def config(config):
+    # One frame per token, so the tests control exactly how far generation gets
+    config["streaming"] = {"flush_interval_ms": 0, "flush_chars": 1}
+    return config
+
+def make_handler(config, local_model=None):
+    return ChatHandler(ModelManager(config, local_model=local_model), config, ConfigManager().load_prompts())
+
+def test_respond_streams_cumulative_text(config):
+    handler = make_handler(config, StreamingModel(tokens=3))
+    chunks = list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None))
+    assert chunks == ["t0 ", "t0 t1 ", "t0 t1 t2 "]
+    assert handler.in_flight == 0
+
+def test_closing_respond_cancels_local_generation(config):
+    model = StreamingModel(tokens=100)
+    handler = make_handler(config, model)
+    cancelled_before = CANCELLED_REQUESTS._value.get()
+    saved_before = CANCELLED_TOKENS_SAVED._value.get()
+
+    gen = handler.respond("Hi", [], None, 64, 0.7, 0.9, True, None)
+    next(gen)
+    next(gen)
+    # What Gradio does when the tab is closed or stop is pressed
+    gen.close()
+
+    assert model.cancel_token.cancelled
+    assert model.produced == 2
+    assert handler.in_flight == 0
+    assert CANCELLED_REQUESTS._value.get() == cancelled_before + 1
+    assert CANCELLED_TOKENS_SAVED._value.get() == saved_before + 62
+    # The generation slot was released
+    assert handler.model_manager.scheduler.acquire("other", cost=1, timeout=1)
+    handler.model_manager.scheduler.release("other")
+
+def test_closing_respond_closes_api_stream(config, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FakeInferenceClient)
+    monkeypatch.setenv("HF_TOKEN", "test-token")
+    FakeInferenceClient.instances.clear()
+    handler = make_handler(config)
+
+    gen = handler.respond("Hi", [], None, 50, 0.7, 0.9, False, None)
+    assert next(gen) == "w0 "
+    gen.close()
+
+    client = FakeInferenceClient.instances[0]
+    assert client.closed
+    assert client.streamed == 1
+    assert handler.model_manager.api_model.consecutive_failures == 0
+
+class ClientWithoutClose:
+    """InferenceClient as in huggingface_hub releases that have no close()"""
+    released = []
+
+    def __init__(self, token=None, model=None):
+        pass
+
+    def chat_completion(self, messages, **kwargs):
+        try:
+            for i in range(kwargs["max_tokens"]):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"w{i} "))])
+        finally:
+            ClientWithoutClose.released.append(True)
+
+def test_api_stream_released_without_client_close(config, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", ClientWithoutClose)
+    ClientWithoutClose.released.clear()
+    handler = make_handler(config)
+    gen = handler.model_manager.api_model.generate([], hf_token="t", max_tokens=10)
+    assert next(gen) == "w0 "
+    gen.close()
+    assert ClientWithoutClose.released == [True]
+
+def test_api_stream_closed_on_completion(config, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FakeInferenceClient)
+    FakeInferenceClient.instances.clear()
+    handler = make_handler(config)
+    tokens = list(handler.model_manager.api_model.generate([], hf_token="t", max_tokens=3))
+    assert tokens == ["w0 ", "w1 ", "w2 "]
+    assert FakeInferenceClient.instances[0].closed
+
+def test_cancel_token_stops_api_stream(config, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FakeInferenceClient)
+    FakeInferenceClient.instances.clear()
+    handler = make_handler(config)
+    token = CancellationToken()
+    tokens = []
+    for piece in handler.model_manager.api_model.generate([], hf_token="t", max_tokens=10, cancel_token=token):
+        tokens.append(piece)
+        token.cancel()
+    assert tokens == ["w0 "]
+    assert token.generated_tokens == 1
+    assert FakeInferenceClient.instances[0].closed
@@ -0,0 +1,119 @@
+import copy, json, os, threading, pytest
+from src.config_manager import CONFIG_RELOADS, ConfigManager, ConfigWatcher
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from helpers import StubModel
+
+def echo_model():
+    """Streams the system prompt back so tests can see which persona text was used"""
+    return StubModel(lambda messages: [word + " " for word in messages[0]["content"].split()])
+
+@pytest.fixture
+def project(tmp_path, config):
+    (tmp_path / "cm").mkdir()
+    (tmp_path / "src").mkdir()
+    config["streaming"] = {"flush_interval_ms": 0, "flush_chars": 1}
+    prompts = {"Diogenes": {"introduction": "old intro"}}
+    (tmp_path / "cm" / "app_config.json").write_text(json.dumps(config))
+    (tmp_path / "cm" / "app_prompts.json").write_text(json.dumps(prompts))
+    return tmp_path
+
+def write(project, filename, data, bump=1):
+    path = project / "cm" / filename
+    path.write_text(data if isinstance(data, str) else json.dumps(data))
+    # Filesystem timestamps can be coarse; move mtime forward explicitly
+    mtime = os.stat(path).st_mtime_ns + bump * 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+def reloads(result):
+    return CONFIG_RELOADS.labels(result=result)._value.get()
+
+def test_watcher_applies_valid_change(project):
+    manager = ConfigManager(str(project / "src"))
+    config = manager.load_config()
+    watcher = ConfigWatcher(manager)
+    received = []
+    watcher.subscribe(lambda config, prompts: received.append((config, prompts)))
+    assert watcher.check() is False
+
+    applied = reloads("applied")
+    updated = dict(config, history_limit=2)
+    write(project, "app_config.json", updated)
+    assert watcher.check() is True
+    assert received[-1][0]["history_limit"] == 2
+    assert manager.load_config()["history_limit"] == 2
+    assert reloads("applied") == applied + 1
+    # No further change, nothing to do
+    assert watcher.check() is False
+
+def test_watcher_ignores_invalid_change(project):
+    manager = ConfigManager(str(project / "src"))
+    config = manager.load_config()
+    watcher = ConfigWatcher(manager)
+    received = []
+    watcher.subscribe(lambda config, prompts: received.append(config))
+    invalid = reloads("invalid")
+
+    write(project, "app_config.json", "{ not json")
+    assert watcher.check() is False
+    broken = dict(config)
+    del broken["messages"]
+    write(project, "app_config.json", broken, bump=2)
+    assert watcher.check() is False
+    write(project, "app_prompts.json", {"Diogenes": {"introduction": 42}})
+    assert watcher.check() is False
+
+    assert received == []
+    assert manager.load_config() is config
+    assert reloads("invalid") == invalid + 3
+
+def test_handler_swaps_prompts_for_new_requests_only(project):
+    manager = ConfigManager(str(project / "src"))
+    config, prompts = manager.load_config(), manager.load_prompts()
+    handler = ChatHandler(ModelManager(config, local_model=echo_model()), config, prompts)
+    watcher = ConfigWatcher(manager)
+    watcher.subscribe(handler.apply_config)
+
+    in_flight = handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None)
+    assert next(in_flight) == "old "
+    write(project, "app_prompts.json", {"Diogenes": {"introduction": "new intro"}})
+    assert watcher.check() is True
+
+    # The request that was already streaming finishes with the old prompt
+    assert list(in_flight)[-1] == "old intro "
+    # The cached persona prompt was dropped, so new requests see the edit
+    assert list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None))[-1] == "new intro "
+    assert handler.system_prompt("Diogenes") == "new intro"
+
+def test_model_manager_applies_scheduler_limits(project):
+    manager = ConfigManager(str(project / "src"))
+    config = manager.load_config()
+    model_manager = ModelManager(config, local_model=echo_model())
+    model_manager.apply_config(dict(config, scheduler={"tokens_per_second": 5, "burst_tokens": 10}))
+    assert model_manager.scheduler.tokens_per_second == 5
+    assert model_manager.scheduler.burst_tokens == 10
+    assert model_manager.config["scheduler"]["tokens_per_second"] == 5
+
+def test_restart_only_changes_keep_warning(project, capsys):
+    manager = ConfigManager(str(project / "src"))
+    config = manager.load_config()
+    model_manager = ModelManager(config, local_model=echo_model())
+    changed = copy.deepcopy(config)
+    changed["model"]["api_model_name"] = "other/model"
+    for _ in range(2):
+        model_manager.apply_config(changed)
+        assert "Changes to 'model' take effect after a restart" in capsys.readouterr().out
+    assert model_manager.config["model"] == config["model"]
+
+def test_pool_reaper_follows_idle_timeout(project):
+    manager = ConfigManager(str(project / "src"))
+    config = copy.deepcopy(manager.load_config())
+    config["model_pool"] = {"idle_unload_seconds": 3600}
+    model_manager = ModelManager(config)
+    pool = model_manager.model_pool
+    unloaded = threading.Event()
+    pool.unload_idle = lambda now=None: unloaded.set() or []
+    # The reaper was sleeping for 360s; the new timeout wakes it
+    model_manager.apply_config(dict(config, model_pool={"idle_unload_seconds": 0.5}))
+    assert pool.idle_unload_seconds == 0.5
+    assert unloaded.wait(3)
@@ -0,0 +1,108 @@
+from src.config_manager import ConfigManager
+from src.conversation_store import ConversationStore, CONVERSATION_STORE_EVICTIONS, history_payload_size
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from helpers import StubModel
+
+def evictions(reason):
+    return CONVERSATION_STORE_EVICTIONS.labels(reason=reason)._value.get()
+
+def test_round_trip():
+    store = ConversationStore()
+    store.append("s1", "user", "Hello")
+    store.append("s1", "assistant", "Bonjour, ça va?")
+    assert store.history("s1") == [
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "Bonjour, ça va?"},
+    ]
+    assert store.history("unknown") == []
+
+def test_session_cap_drops_oldest_turns():
+    store = ConversationStore({"max_session_bytes": 300})
+    before = evictions("session_cap")
+    for i in range(10):
+        store.append("s1", "user", f"message {i} " + "x" * 50)
+    history = store.history("s1")
+    assert 1 <= len(history) < 10
+    assert history[-1]["content"].startswith("message 9")
+    assert evictions("session_cap") == before + 10 - len(history)
+
+def test_global_cap_drops_least_recently_used():
+    store = ConversationStore({"max_total_bytes": 600})
+    store.append("old", "user", "a" * 200)
+    store.append("recent", "user", "b" * 200)
+    store.history("old")  # touch: "recent" is now least recently used
+    store.append("new", "user", "c" * 200)
+    assert "old" in store and "new" in store
+    assert "recent" not in store
+    assert store.total_bytes <= 600
+
+def test_spill_tier_restores_evicted_sessions(tmp_path):
+    store = ConversationStore({"max_total_bytes": 500, "spill_path": str(tmp_path / "spill.sqlite")})
+    before = evictions("spilled")
+    store.append("first", "user", "a" * 300)
+    store.append("second", "user", "b" * 300)
+    assert "first" not in store
+    assert evictions("spilled") == before + 1
+    # Reading it back brings it into memory and spills the other one
+    assert store.history("first") == [{"role": "user", "content": "a" * 300}]
+    assert "first" in store and "second" not in store
+    store.close()
+
+def test_clear_removes_spilled_copy(tmp_path):
+    store = ConversationStore({"max_total_bytes": 100, "spill_path": str(tmp_path / "spill.sqlite")})
+    store.append("s1", "user", "a" * 80)
+    store.append("s2", "user", "b" * 80)
+    store.clear("s1")
+    assert store.history("s1") == []
+    store.close()
+
+def test_history_payload_size():
+    assert history_payload_size([]) == 2
+    assert history_payload_size([{"role": "user", "content": "é"}]) == len('[{"role": "user", "content": "é"}]'.encode())
+
+def echo_model():
+    return StubModel(lambda messages: [f"reply {len(messages)}"])
+
+class FakeRequest:
+    username = None
+    def __init__(self, session_hash): self.session_hash = session_hash
+
+def test_chat_handler_uses_server_side_history(config):
+    config["conversation_store"] = {"enabled": True}
+    config["history_limit"] = 10
+    model = echo_model()
+    handler = ChatHandler(ModelManager(config, local_model=model), config, ConfigManager().load_prompts())
+    request = FakeRequest("s1")
+
+    list(handler.respond("first", [], None, 8, 0.7, 0.9, True, None, request))
+    # The client's copy of the history is not what the model sees
+    list(handler.respond("second", [{"role": "user", "content": "tampered"}], None, 8, 0.7, 0.9, True, None, request))
+    contents = [m["content"] for m in model.messages]
+    assert contents[1:] == ["first", "reply 2", "second"]
+
+    # An empty client history means the chat was cleared
+    list(handler.respond("again", [], None, 8, 0.7, 0.9, True, None, request))
+    assert [m["content"] for m in model.messages][1:] == ["again"]
+
+class FailingModel(StubModel):
+    def generate(self, messages, **kwargs):
+        raise RuntimeError("backend down")
+        yield
+
+def test_chat_handler_stores_only_completed_turns_with_a_session(config):
+    config["conversation_store"] = {"enabled": True}
+    handler = ChatHandler(ModelManager(config, local_model=FailingModel()), config, ConfigManager().load_prompts())
+    request = FakeRequest("s1")
+
+    reply = list(handler.respond("first", [], None, 8, 0.7, 0.9, True, None, request))[-1]
+    assert reply.startswith("Error generating response")
+    assert handler.stored_history(request) == []
+
+    handler.model_manager.backends["local"] = handler.model_manager.local_model = echo_model()
+    # API and batch callers have no session; they must not share one stored conversation
+    list(handler.respond("no session", [], None, 8, 0.7, 0.9, True, None, None))
+    assert len(handler.conversations._sessions) == 0
+    list(handler.respond("second", None, None, 8, 0.7, 0.9, True, None, request))
+    assert handler.stored_history(request) == [{"role": "user", "content": "second"},
+                                               {"role": "assistant", "content": "reply 2"}]
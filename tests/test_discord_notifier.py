@@ -1,12 +1,18 @@
-import json, os, tempfile, pytest, sys
+import io, json, os, tempfile, threading, pytest, sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '.github', 'scripts'))
 
 from discord_notifier import (
+    MESSAGE_LIMIT,
+    _JSONStream,
+    DiscordWebhook,
     load_test_results,
+    load_test_summary,
     format_failure_message,
     send_discord_notification,
+    split_message,
     main
 )
 
@@ -141,13 +147,15 @@ class TestIntegration:
         
         assert result == "\n".join(expected_lines)
     
-    @patch('discord_notifier.requests.post')
-    def test_complete_success_flow(self, mock_post):
+    @patch('discord_notifier.requests.Session')
+    def test_complete_success_flow(self, mock_session):
         """Test the complete flow for a success scenario."""
         # Setup successful HTTP response
         mock_response = MagicMock()
+        mock_response.status_code = 204
+        mock_response.headers = {}
         mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
+        mock_session.return_value.post.return_value = mock_response
         
         # Create test data for all passing tests
         test_data = {
@@ -167,8 +175,127 @@ class TestIntegration:
         
         assert result is True
         assert "ALL 3 tests succeeded" in message
-        mock_post.assert_called_once_with(
+        mock_session.return_value.post.assert_called_once_with(
             "https://discord.com/webhook",
             json={"content": message},
-            headers={"Content-Type": "application/json"}
+            timeout=10.0
         )
+        mock_session.return_value.close.assert_called_once()
+
+
+class TestStreamingReport:
+    """Reports are read incrementally, keeping only failures."""
+
+    def test_summary_matches_full_load(self, tmp_path):
+        tests = [{"nodeid": f"tests/test_big.py::test_{i}", "outcome": "failed" if i % 7 == 0 else "passed",
+                  "call": {"longrepr": "x" * 500}} for i in range(3000)]
+        data = {"created": 1.5, "summary": {"total": 3000, "failed": 429, "passed": 2571},
+                "collectors": [], "tests": tests, "warnings": []}
+        path = tmp_path / "report.json"
+        path.write_text(json.dumps(data, indent=1))
+
+        summary = load_test_summary(str(path))
+        assert summary["summary"] == data["summary"]
+        assert len(summary["tests"]) == 429
+        assert "longrepr" not in json.dumps(summary)
+        assert format_failure_message(summary, "repo") == format_failure_message(data, "repo")
+
+    def test_truncated_report_raises(self, tmp_path):
+        path = tmp_path / "report.json"
+        path.write_text('{"summary": {"total": 1}, "tests": [{"nodeid": "a"')
+        with pytest.raises(json.JSONDecodeError):
+            load_test_summary(str(path))
+
+    def test_large_value_is_decoded_a_logarithmic_number_of_times(self):
+        text = json.dumps({"longrepr": "x" * (1 << 20)})
+        stream = _JSONStream(io.StringIO(text), chunk_size=1024)
+        decoder, calls = stream.decoder, []
+        stream.decoder = MagicMock(raw_decode=lambda s, pos: calls.append(pos) or decoder.raw_decode(s, pos))
+        assert stream.value() == json.loads(text)
+        # about log2(1 MB / 1 KB) retries, where re-decoding every chunk would take over 1000
+        assert len(calls) <= 16
+
+
+class TestSplitMessage:
+    def test_splits_on_lines_under_limit(self):
+        message = "\n".join(f"{i}. tests/test_module.py::test_case_{i}" for i in range(500))
+        chunks = split_message(message)
+        assert len(chunks) > 1
+        assert all(len(chunk) <= MESSAGE_LIMIT for chunk in chunks)
+        assert "\n".join(chunks) == message
+
+    def test_hard_splits_long_lines(self):
+        chunks = split_message("y" * 4500, limit=2000)
+        assert [len(chunk) for chunk in chunks] == [2000, 2000, 500]
+
+
+class FakeWebhook(BaseHTTPRequestHandler):
+    """Rate limits the first post, then accepts everything"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.attempts += 1
+        if server.attempts == 1:
+            payload = json.dumps({"message": "You are being rate limited.", "retry_after": 0.05}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        server.messages.append(body["content"])
+        self.send_response(204)
+        self.send_header("X-RateLimit-Remaining", "0")
+        self.send_header("X-RateLimit-Reset-After", "0.01")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_webhook():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeWebhook)
+    server.attempts = 0
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/api/webhooks/1/token"
+    server.shutdown()
+    server.server_close()
+
+
+class TestDiscordWebhook:
+    def test_large_failure_list_is_chunked_and_retried(self, fake_webhook):
+        server, url = fake_webhook
+        data = {"summary": {"total": 400, "failed": 300},
+                "tests": [{"nodeid": f"tests/test_x.py::test_{i}", "outcome": "failed"} for i in range(300)]}
+        message = format_failure_message(data, "repo")
+
+        assert send_discord_notification(message, url) is True
+        assert server.attempts == len(server.messages) + 1
+        assert all(len(content) <= MESSAGE_LIMIT for content in server.messages)
+        assert "\n".join(server.messages) == message
+
+    def test_notifications_within_window_are_coalesced(self, fake_webhook):
+        server, url = fake_webhook
+        webhook = DiscordWebhook(url, coalesce_seconds=0.2)
+        webhook.notify("first")
+        webhook.notify("second")
+        assert server.messages == []
+        assert webhook.close() is True
+        assert server.messages == ["first\n\nsecond"]
+
+    def test_main_coalesces_the_reports_it_is_given(self, fake_webhook, tmp_path, monkeypatch):
+        server, url = fake_webhook
+        paths = []
+        for name, failed in (("unit", 1), ("integration", 0)):
+            path = tmp_path / f"{name}.json"
+            path.write_text(json.dumps({"summary": {"total": 2, "failed": failed, "passed": 2 - failed},
+                                        "tests": [{"nodeid": f"{name}::test_a", "outcome": "failed"}] * failed}))
+            paths.append(str(path))
+        monkeypatch.setenv("DISCORD_WEBHOOK_URL", url)
+        monkeypatch.setattr(sys, "argv", ["discord_notifier.py", *paths, "repo"])
+        main()
+        assert server.messages == ["1 out of 2 tests failed for repo: \n1. unit::test_a\n\nAborted pushing changes to HuggingFace"
+                                   "\n\nALL 2 tests succeeded for repo. Changes pushed to HuggingFace."]
@@ -0,0 +1,106 @@
+import threading, time, pytest, requests
+from src.config_manager import ConfigManager
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from src.drain import DrainController
+from src.health import HealthServer
+from helpers import StubModel
+
+class SlowModel(StubModel):
+    """Streams tokens every delay seconds until it has produced tokens (None: until cancelled)"""
+    def __init__(self, tokens=None, delay=0.02):
+        self.tokens = tokens
+        self.delay = delay
+        self.cancel_token = None
+        self.started = threading.Event()
+
+    def generate(self, messages, cancel_token=None, **kwargs):
+        self.cancel_token = cancel_token
+        self.started.set()
+        produced = 0
+        while self.tokens is None or produced < self.tokens:
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            time.sleep(self.delay)
+            produced += 1
+            yield "t "
+
+@pytest.fixture
+def config(config):
+    config["drain"] = {"deadline_seconds": 5, "admin_token": "secret"}
+    return config
+
+def start_request(handler):
+    result = {}
+
+    def run():
+        result["chunks"] = list(handler.respond("Hi", [], None, 512, 0.7, 0.9, True, None))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, result
+
+def test_drain_lets_in_flight_requests_finish(config):
+    model = SlowModel(tokens=10)
+    handler = ChatHandler(ModelManager(config, local_model=model), config, ConfigManager().load_prompts())
+    exited = threading.Event()
+    drain = DrainController(handler, deadline_seconds=5, on_exit=exited.set, poll_seconds=0.01)
+
+    thread, result = start_request(handler)
+    assert model.started.wait(2)
+    assert drain.start("test") is True
+    assert drain.start("again") is False
+
+    # New requests are turned away while the old one keeps streaming
+    assert list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None)) == [config["messages"]["draining"]]
+    assert exited.wait(5)
+    thread.join(2)
+    assert result["chunks"][-1] == "t " * 10
+    assert (drain.drained, drain.aborted) == (1, 0)
+
+def test_drain_cancels_requests_at_deadline(config):
+    model = SlowModel(tokens=None)
+    handler = ChatHandler(ModelManager(config, local_model=model), config, ConfigManager().load_prompts())
+    exited = threading.Event()
+    drain = DrainController(handler, deadline_seconds=0.2, on_exit=exited.set, poll_seconds=0.01)
+
+    thread, _ = start_request(handler)
+    assert model.started.wait(2)
+    drain.start("test")
+    assert exited.wait(5)
+    thread.join(2)
+    assert model.cancel_token.cancelled
+    assert (drain.drained, drain.aborted) == (0, 1)
+    assert handler.in_flight == 0
+
+def test_drain_endpoint_and_readiness(config):
+    handler = ChatHandler(ModelManager(config, local_model=SlowModel(tokens=1)), config,
+                          ConfigManager().load_prompts())
+    exited = threading.Event()
+    drain = DrainController(handler, deadline_seconds=1, on_exit=exited.set, poll_seconds=0.01)
+    health = HealthServer(port=0, addr='127.0.0.1').start()
+    health.attach(handler.model_manager, handler, config, drain_controller=drain)
+    url = f"http://127.0.0.1:{health.port}"
+    try:
+        assert requests.get(url + "/readyz", timeout=5).status_code == 200
+        assert requests.post(url + "/drain", timeout=5).status_code == 403
+        response = requests.post(url + "/drain", headers={"Authorization": "Bearer secret"}, timeout=5)
+        assert response.status_code == 202
+        assert response.json()["status"] == "draining"
+
+        response = requests.get(url + "/readyz", timeout=5)
+        assert response.status_code == 503
+        assert response.json()["reasons"] == ["draining"]
+        assert exited.wait(5)
+    finally:
+        health.stop()
+
+def test_admission_and_drain_do_not_race(config):
+    handler = ChatHandler(ModelManager(config, local_model=SlowModel(tokens=1)), config,
+                          ConfigManager().load_prompts())
+    # A request admitted just before the drain starts is one the drain waits for
+    assert handler.try_admit()
+    assert handler.begin_drain() == 1
+    assert not handler.try_admit()
+    assert handler.in_flight == 1
+    handler._track_in_flight(-1)
@@ -0,0 +1,91 @@
+import pytest, requests
+from src.config_manager import ConfigManager
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from src.health import HealthServer
+
+@pytest.fixture
+def config(config):
+    config["health"] = {"max_in_flight": 2, "max_queue_depth": 2,
+                        "require_local_model": False, "api_failure_threshold": 2}
+    return config
+
+@pytest.fixture
+def server(config):
+    model_manager = ModelManager(config)
+    handler = ChatHandler(model_manager, config, ConfigManager().load_prompts())
+    health = HealthServer(port=0, addr='127.0.0.1').start()
+    health.attach(model_manager, handler, config)
+    yield health
+    health.stop()
+
+def get(server, path):
+    return requests.get(f"http://127.0.0.1:{server.port}{path}", timeout=5)
+
+def test_not_ready_before_attach():
+    health = HealthServer(port=0, addr='127.0.0.1').start()
+    try:
+        assert get(health, "/healthz").status_code == 200
+        response = get(health, "/readyz")
+        assert response.status_code == 503
+        assert response.json()["reasons"] == ["starting"]
+    finally:
+        health.stop()
+
+def test_ready_reports_load_indicators(server):
+    response = get(server, "/readyz")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["in_flight"] == 0 and body["queue_depth"] == 0
+    assert body["local_model"] == {"ready": False, "loading": False}
+    assert body["api_model"]["healthy"] is True
+
+def test_not_ready_when_saturated(server):
+    server.chat_handler._track_in_flight(2)
+    try:
+        response = get(server, "/readyz")
+        assert response.status_code == 503
+        assert "saturated: in-flight requests" in response.json()["reasons"]
+        # Liveness never depends on load
+        assert get(server, "/healthz").status_code == 200
+    finally:
+        server.chat_handler._track_in_flight(-2)
+
+def test_not_ready_when_queue_backs_up(server):
+    server.model_manager.queue_message({})
+    server.model_manager.queue_message({})
+    response = get(server, "/readyz")
+    assert response.status_code == 503
+    assert "saturated: queue depth" in response.json()["reasons"]
+
+def test_local_model_and_api_requirements(server, config):
+    config["health"]["require_local_model"] = True
+    config["health"]["require_api_model"] = True
+    server.model_manager.local_model._loading = True
+    server.model_manager.api_model.consecutive_failures = 2
+    reasons = get(server, "/readyz").json()["reasons"]
+    assert reasons == ["local model loading", "api backend failing"]
+
+def test_metrics_served_alongside(server):
+    response = get(server, "/metrics")
+    assert response.status_code == 200
+    assert "app_in_flight_requests" in response.text
+    assert get(server, "/nope").status_code == 404
+
+def test_api_model_tracks_failures(monkeypatch, server):
+    import huggingface_hub
+
+    class FailingClient:
+        def __init__(self, **kwargs): pass
+        def chat_completion(self, *args, **kwargs):
+            raise ConnectionError("upstream down")
+
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FailingClient)
+    api_model = server.model_manager.api_model
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            list(api_model.generate([], hf_token="x"))
+    assert not api_model.is_healthy(2)
+    body = get(server, "/healthz").json()
+    assert body["api_model"] == {"healthy": False, "consecutive_failures": 2, "last_error": "upstream down"}
@@ -0,0 +1,22 @@
+import os, subprocess, sys
+
+# The module list lives with the import-time benchmark, which checks the same thing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+from bench_import_time import HEAVY, LIGHTWEIGHT, SRC
+
+def test_lightweight_modules_do_not_import_heavy_packages():
+    """Entry points other than the UI must not pay for gradio, torch or transformers at import"""
+    code = (f"import sys\nimport {', '.join(LIGHTWEIGHT)}\n"
+            f"print(sorted(m for m in {HEAVY!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+def test_gradio_annotations_resolve_once_bound():
+    code = ("import typing, chat_handler\n"
+            "chat_handler.bind_gradio_annotations()\n"
+            "hints = typing.get_type_hints(chat_handler.ChatHandler.respond)\n"
+            "print(hints['request'], hints['hf_token'])")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert "Request" in result.stdout and "OAuthToken" in result.stdout
@@ -0,0 +1,173 @@
+import threading, time
+from src.config_manager import ConfigManager
+from src.model_manager import ModelInterface, ModelManager, ModelPool, LOCAL_MODEL_UNLOADS
+from src.chat_handler import ChatHandler
+
+MB = 1024 * 1024
+
+class FakeLocalModel(ModelInterface):
+    def __init__(self, entry, load_seconds=0.0):
+        self.model_name = entry["name"]
+        self.size = entry.get("actual_mb", entry.get("memory_mb", 100)) * MB
+        self.load_seconds = load_seconds
+        self._ready = False
+        self._loading = False
+        self.fail = entry.get("fail", False)
+        self.loads = 0
+
+    def begin_load(self):
+        if self._loading or self._ready:
+            return False
+        self._loading = True
+        return True
+
+    def complete_load(self):
+        time.sleep(self.load_seconds)
+        self.loads += 1
+        self._ready = not self.fail
+        self._loading = False
+
+    def load_model(self):
+        if self.begin_load():
+            self.complete_load()
+
+    def is_ready(self): return self._ready
+    def is_loading(self): return self._loading
+    def memory_bytes(self): return self.size if self._ready else 0
+    def unload(self): self._ready = False
+    def generate(self, messages, **kwargs):
+        yield self.model_name
+
+def make_pool(entries, **kwargs):
+    return ModelPool(entries, model_factory=FakeLocalModel, **kwargs)
+
+def test_models_load_on_demand():
+    pool = make_pool([{"name": "a"}, {"name": "b"}])
+    assert pool.resident() == []
+    pool.load("b")
+    assert pool.resident() == ["b"]
+    assert pool.get("b").loads == 1
+    pool.load("b")
+    assert pool.get("b").loads == 1
+
+def test_background_acquire_reports_loading_immediately():
+    pool = ModelPool([{"name": "a"}, {"name": "b"}],
+                     model_factory=lambda entry: FakeLocalModel(entry, load_seconds=0.2))
+    model = pool.acquire("b")
+    assert model.is_loading() and not model.is_ready()
+    deadline = time.time() + 5
+    while not model.is_ready() and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.resident() == ["b"]
+
+def test_default_model_reloaded_only_after_pool_unload():
+    pool = make_pool([{"name": "a"}])
+    # Never loaded (startup loads the default): not retried per request
+    assert not pool.acquire("a").is_loading()
+    pool.load("a")
+    pool.unload("a")
+    assert pool.acquire("a").is_loading() or pool.get("a").is_ready()
+
+def test_idle_models_are_unloaded():
+    pool = make_pool([{"name": "a"}, {"name": "b"}], idle_unload_seconds=60)
+    before = LOCAL_MODEL_UNLOADS.labels(model="a", reason="idle")._value.get()
+    pool.load("a")
+    pool.load("b")
+    now = time.monotonic()
+    pool._last_used["a"] = now - 120
+    assert pool.unload_idle(now) == ["a"]
+    assert pool.resident() == ["b"]
+    assert LOCAL_MODEL_UNLOADS.labels(model="a", reason="idle")._value.get() == before + 1
+
+def test_models_in_use_are_not_unloaded():
+    pool = make_pool([{"name": "a"}], idle_unload_seconds=60)
+    pool.load("a")
+    with pool.use("a"):
+        assert pool.unload_idle(time.monotonic() + 3600) == []
+        assert pool.resident() == ["a"]
+
+def test_memory_budget_evicts_least_recently_used():
+    pool = make_pool([{"name": "a", "memory_mb": 400}, {"name": "b", "memory_mb": 400},
+                      {"name": "c", "memory_mb": 400}], memory_budget_mb=1000)
+    pool.load("a")
+    pool.load("b")
+    pool.acquire("a")  # a is now more recently used than b
+    pool.load("c")
+    assert sorted(pool.resident()) == ["a", "c"]
+
+def test_memory_budget_uses_measured_size():
+    # Configured too small; the real size is found after loading
+    pool = make_pool([{"name": "a", "memory_mb": 100, "actual_mb": 600},
+                      {"name": "b", "memory_mb": 100, "actual_mb": 600}], memory_budget_mb=1000)
+    pool.load("a")
+    pool.load("b")
+    assert pool.resident() == ["b"]
+
+def test_chat_handler_reloads_unloaded_model(config):
+    config["model"]["local_models"] = [{"name": "small"}, {"name": "large"}]
+    manager = ModelManager(config)
+    manager.model_pool = make_pool(config["model"]["local_models"])
+    manager.local_model = manager.model_pool.get()
+    handler = ChatHandler(manager, config, ConfigManager().load_prompts())
+
+    reply = list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None, None, "large"))[-1]
+    assert reply.endswith("large")
+    assert config["messages"]["loading_message"] in reply
+    manager.model_pool.unload("large")
+    reply = list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None, None, "large"))[-1]
+    assert reply.endswith("large")
+    assert manager.model_pool.get("large").loads == 2
+
+def test_failed_load_is_not_retried_until_backoff_expires():
+    pool = make_pool([{"name": "a"}, {"name": "b", "fail": True}], load_retry_seconds=60)
+    pool.acquire("b", background=False)
+    assert pool.get("b").loads == 1
+    model = pool.acquire("b")
+    assert not model.is_loading() and not model.is_ready()
+    assert pool.get("b").loads == 1
+    pool._load_failed_at["b"] -= 120
+    pool.acquire("b", background=False)
+    assert pool.get("b").loads == 2
+
+def test_model_stays_pinned_while_request_waits_for_its_turn(config):
+    config["model"]["local_models"] = [{"name": "small"}, {"name": "large"}]
+    manager = ModelManager(config)
+    manager.model_pool = make_pool(config["model"]["local_models"], idle_unload_seconds=60)
+    manager.local_model = manager.model_pool.get()
+    manager.model_pool.load("large")
+    handler = ChatHandler(manager, config, ConfigManager().load_prompts())
+
+    # Hold the only generation slot so the request queues behind it
+    slot = manager.governor.generation_slot()
+    slot.__enter__()
+    reply = handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None, None, "large")
+    waiting = threading.Thread(target=lambda: list(reply))
+    waiting.start()
+    time.sleep(0.2)
+    assert manager.model_pool.unload_idle(time.monotonic() + 3600) == []
+    assert manager.model_pool.get("large").is_ready()
+    slot.__exit__(None, None, None)
+    waiting.join(5)
+    assert not waiting.is_alive()
+
+def test_requests_waiting_for_a_reload_leave_the_queue_depth(config):
+    config["model"]["local_models"] = [{"name": "small"}, {"name": "large"}]
+    manager = ModelManager(config)
+    manager.model_pool = ModelPool(config["model"]["local_models"],
+                                   model_factory=lambda entry: FakeLocalModel(entry, load_seconds=0.5))
+    manager.local_model = manager.model_pool.get()
+    manager.model_pool.load("large")
+    manager.model_pool.unload("large")
+    handler = ChatHandler(manager, config, ConfigManager().load_prompts())
+
+    replies = []
+    threads = [threading.Thread(target=lambda: replies.append(
+        list(handler.respond("Hi", [], None, 8, 0.7, 0.9, True, None, None, "large"))[-1])) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    assert manager.queue_depth() == 2
+    for thread in threads:
+        thread.join(5)
+    assert [reply.endswith("large") for reply in replies] == [True, True]
+    assert manager.queue_depth() == 0
@@ -0,0 +1,160 @@
+import os, tempfile, threading, time, pytest
+from src.model_manager import ModelInterface, ModelManager
+from src.model_server import ModelServer, RemoteModel
+from src.resource_governor import ResourceGovernor
+from src.scheduler import FairScheduler, Throttled
+
+class FakeModel(ModelInterface):
+    def __init__(self, tokens=("Hello", ",", " world"), delay=0.0):
+        self.tokens = tokens
+        self.delay = delay
+        self.ready = True
+        self.loading = False
+        self.active = 0
+        self.max_active = 0
+        self.closed = 0
+        self.lock = threading.Lock()
+
+    def is_ready(self): return self.ready
+    def is_loading(self): return self.loading
+
+    def generate(self, messages, **kwargs):
+        if messages and messages[-1]["content"] == "fail":
+            raise ValueError("boom")
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            for token in self.tokens[:kwargs.get("max_tokens", len(self.tokens))]:
+                time.sleep(self.delay)
+                yield token
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.closed += 1
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX paths are length-limited, so avoid pytest's long tmp_path
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, "model.sock")
+
+def serve(model, address, max_concurrent=1, scheduler_config=None):
+    governor = ResourceGovernor({"max_concurrent_generations": max_concurrent, "intra_op_threads": 1})
+    return ModelServer(model, address, governor, FairScheduler(max_concurrent, scheduler_config)).start()
+
+def test_remote_model_streams_tokens(socket_path):
+    server = serve(FakeModel(), socket_path)
+    try:
+        remote = RemoteModel(socket_path)
+        messages = [{"role": "user", "content": "hi"}]
+        assert list(remote.generate(messages, max_tokens=2)) == ["Hello", ","]
+        assert "".join(remote.generate(messages)) == "Hello, world"
+        assert remote.is_ready() and not remote.is_loading()
+    finally:
+        server.stop()
+
+def test_errors_are_raised_on_the_client(socket_path):
+    server = serve(FakeModel(), socket_path)
+    try:
+        with pytest.raises(RuntimeError, match="boom"):
+            list(RemoteModel(socket_path).generate([{"role": "user", "content": "fail"}]))
+    finally:
+        server.stop()
+
+def test_server_unavailable(socket_path):
+    remote = RemoteModel(socket_path, connect_timeout=0.5)
+    assert not remote.is_ready() and not remote.is_loading()
+    with pytest.raises(RuntimeError, match="unavailable"):
+        list(remote.generate([]))
+
+def test_concurrent_clients_share_one_model(socket_path):
+    model = FakeModel(delay=0.05)
+    server = serve(model, socket_path, max_concurrent=2)
+    results = []
+    try:
+        def worker():
+            results.append("".join(RemoteModel(socket_path).generate([{"role": "user", "content": "hi"}])))
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert results == ["Hello, world"] * 5
+        assert model.max_active == 2
+    finally:
+        server.stop()
+
+def test_client_disconnect_stops_generation(socket_path):
+    model = FakeModel(tokens=tuple(str(i) for i in range(200)), delay=0.01)
+    server = serve(model, socket_path)
+    try:
+        gen = RemoteModel(socket_path).generate([{"role": "user", "content": "hi"}])
+        assert next(gen) == "0"
+        gen.close()
+        deadline = time.time() + 5
+        while model.closed == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        assert model.closed == 1
+    finally:
+        server.stop()
+
+def test_tcp_address():
+    server = serve(FakeModel(), "tcp://127.0.0.1:0")
+    try:
+        port = server._server.server_address[1]
+        assert list(RemoteModel(f"tcp://127.0.0.1:{port}").generate([])) == ["Hello", ",", " world"]
+    finally:
+        server.stop()
+
+def test_model_manager_uses_remote_model(socket_path, config):
+    config["model_server"] = {"enabled": True, "address": socket_path}
+    manager = ModelManager(config)
+    assert isinstance(manager.local_model, RemoteModel)
+    model = FakeModel()
+    model.ready, model.loading = False, True
+    server = serve(model, socket_path)
+    try:
+        loader = manager.start_model_loading()
+        time.sleep(0.2)
+        assert manager.local_model.is_loading()
+        model.ready, model.loading = True, False
+        loader.join(5)
+        assert not loader.is_alive() and manager.local_model.is_ready()
+    finally:
+        server.stop()
+
+def test_status_is_cached_briefly(socket_path):
+    server = serve(FakeModel(), socket_path)
+    calls = []
+    status = server.status
+    server.status = lambda: calls.append(1) or status()
+    try:
+        remote = RemoteModel(socket_path, status_cache_seconds=0.2)
+        for _ in range(5):
+            assert remote.is_ready() and not remote.is_loading()
+        assert len(calls) == 1
+        time.sleep(0.25)
+        remote.is_ready()
+        assert len(calls) == 2
+    finally:
+        server.stop()
+
+def test_server_rate_limits_sessions_across_clients(socket_path):
+    server = serve(FakeModel(), socket_path, scheduler_config={"tokens_per_second": 1, "burst_tokens": 10})
+    messages = [{"role": "user", "content": "hi"}]
+    try:
+        assert list(RemoteModel(socket_path).generate(messages, session_id="s1", max_tokens=10)) == ["Hello", ",", " world"]
+        # A second worker's request for the same session shares its budget
+        with pytest.raises(Throttled) as excinfo:
+            list(RemoteModel(socket_path).generate(messages, session_id="s1", max_tokens=10))
+        assert excinfo.value.retry_after > 0
+        assert list(RemoteModel(socket_path).generate(messages, session_id="s2", max_tokens=10))
+    finally:
+        server.stop()
+
+def test_remote_model_skips_the_workers_own_slots(socket_path, config):
+    config["model_server"] = {"enabled": True, "address": socket_path}
+    manager = ModelManager(config)
+    # The worker's own slot is taken, yet the server is the one that decides
+    with manager.governor.generation_slot():
+        with manager.generation_turn(manager.local_model, "s1", 8) as turn:
+            assert turn == {"session_id": "s1"}
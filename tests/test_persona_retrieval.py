@@ -0,0 +1,65 @@
+from src.model_manager import ModelManager
+from src.persona_retrieval import PersonaIndex, estimate_tokens
+from src.chat_handler import ChatHandler
+from helpers import StubModel
+
+PROMPTS = {
+    "Diogenes": {
+        "introduction": "I am Diogenes.",
+        "keywords": ["poverty", "honesty"],
+        "notable_attributes": ["brutally honest", "lives in extreme poverty by choice"],
+        "writing_samples": [
+            "I am looking for an honest man.",
+            "The mob is the mother of tyrants.",
+            "It is the privilege of the gods to want nothing.",
+        ],
+    },
+    "Suntzu": {
+        "introduction": "I am Sun Tzu.",
+        "keywords": ["strategy"],
+        "notable_attributes": ["thinks several moves ahead"],
+        "writing_samples": ["All warfare is based on deception."],
+    },
+}
+
+def test_rank_prefers_overlapping_sample():
+    index = PersonaIndex(PROMPTS)
+    score, kind, text = index.rank("Diogenes", "What do tyrants and the mob have in common?")[0]
+    assert (kind, text) == ("sample", "The mob is the mother of tyrants.")
+    assert score > 0
+    # Rows are scoped to the persona
+    assert all(text != "All warfare is based on deception." for _, _, text in index.rank("Diogenes", "warfare"))
+
+def test_unrelated_message_falls_back_to_keywords():
+    index = PersonaIndex(PROMPTS)
+    _, kind, text = index.rank("Diogenes", "hello there")[0]
+    assert (kind, text) == ("attribute", "lives in extreme poverty by choice")
+
+def test_select_respects_limits_and_budget():
+    index = PersonaIndex(PROMPTS)
+    selected = index.select("Diogenes", "honest man tyrants gods", max_samples=2, max_attributes=1)
+    assert len(selected["sample"]) == 2 and len(selected["attribute"]) == 1
+
+    budget = estimate_tokens("I am looking for an honest man.")
+    selected = index.select("Diogenes", "honest man", token_budget=budget)
+    assert selected == {"sample": ["I am looking for an honest man."], "attribute": []}
+
+def test_grounding_is_empty_for_unknown_persona():
+    index = PersonaIndex(PROMPTS)
+    assert index.grounding("Plato", "anything") == ""
+    assert index.grounding(None, "anything") == ""
+    assert "Things you have said" in index.grounding("Suntzu", "deception")
+
+def test_handler_appends_grounding_to_system_prompt(config):
+    config["persona_retrieval"] = {"enabled": True, "token_budget": 64, "max_samples": 1, "max_attributes": 1}
+    model = StubModel()
+    handler = ChatHandler(ModelManager(config, local_model=model), config, PROMPTS)
+    list(handler.respond("Where are the tyrants?", [], "images/Diogenes.jpg", 8, 0.7, 0.9, True, None))
+    system = model.messages[0]["content"]
+    assert system.startswith("I am Diogenes.")
+    assert '"The mob is the mother of tyrants."' in system
+
+    config = dict(config, persona_retrieval={"enabled": False})
+    handler = ChatHandler(ModelManager(config, local_model=model), config, PROMPTS)
+    list(handler.respond("Where are the tyrants?", [], "images/Diogenes.jpg", 8, 0.7, 0.9, True, None))
+    assert model.messages[0]["content"] == "I am Diogenes."
@@ -0,0 +1,110 @@
+import gc, os, signal, threading, time, pytest
+from src.prefork import PreforkSupervisor, parse_smaps_rollup, memory_usage, format_memory_report
+
+SMAPS_ROLLUP = """55d0c0a00000-7ffd3b5fe000 ---p 00000000 00:00 0                          [rollup]
+Rss:              204800 kB
+Pss:              112640 kB
+Shared_Clean:     163840 kB
+Shared_Dirty:       8192 kB
+Private_Clean:      4096 kB
+Private_Dirty:     28672 kB
+Referenced:       200000 kB
+Anonymous:         40960 kB
+Swap:                  0 kB
+"""
+
+@pytest.fixture(autouse=True)
+def unfreeze_gc():
+    # PreforkSupervisor.start() freezes this (the pytest) process's heap; undo
+    # that so the rest of the session is collected normally
+    yield
+    gc.unfreeze()
+
+linux_only = pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"),
+                                reason="requires /proc/<pid>/smaps_rollup")
+
+def test_parse_smaps_rollup():
+    usage = parse_smaps_rollup(SMAPS_ROLLUP)
+    assert usage == {
+        "rss": 204800 * 1024,
+        "pss": 112640 * 1024,
+        "shared": (163840 + 8192) * 1024,
+        "private": (4096 + 28672) * 1024,
+    }
+
+def test_format_memory_report_handles_missing_process():
+    lines = format_memory_report({"master": parse_smaps_rollup(SMAPS_ROLLUP), "worker-0": None})
+    assert "200.0" in lines[1]
+    assert "n/a" in lines[2]
+
+def test_memory_usage_missing_process():
+    assert memory_usage(2 ** 22 + 12345) is None
+
+@linux_only
+def test_forked_workers_share_parent_pages(tmp_path):
+    # Stands in for the model weights: written once before forking, only read afterwards
+    weights = bytearray(os.urandom(32 * 1024 * 1024))
+    ready_dir = tmp_path
+
+    def worker_main(index):
+        checksum = sum(weights[::4096])
+        (ready_dir / f"worker-{index}").write_text(str(checksum))
+        time.sleep(30)
+
+    supervisor = PreforkSupervisor(2, worker_main, memory_report_seconds=0, restart=False).start()
+    try:
+        deadline = time.time() + 10
+        while len(list(ready_dir.iterdir())) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        report = supervisor.memory_report()
+        for index in range(2):
+            usage = report[f"worker-{index}"]
+            assert usage["shared"] >= len(weights)
+            assert usage["private"] < len(weights)
+    finally:
+        supervisor.stop()
+    assert supervisor.pids == {}
+
+@linux_only
+def test_supervisor_restarts_exited_worker(tmp_path):
+    def worker_main(index):
+        starts = tmp_path / f"worker-{index}"
+        count = int(starts.read_text()) + 1 if starts.exists() else 1
+        starts.write_text(str(count))
+        if count == 1:
+            os._exit(3)
+        time.sleep(30)
+
+    supervisor = PreforkSupervisor(1, worker_main, memory_report_seconds=0).start()
+    supervising = threading.Thread(target=supervisor.wait, daemon=True)
+    supervising.start()
+    try:
+        deadline = time.time() + 10
+        starts = tmp_path / "worker-0"
+        while not (starts.exists() and starts.read_text() == "2") and time.time() < deadline:
+            time.sleep(0.05)
+        assert starts.read_text() == "2"
+    finally:
+        supervisor.stop()
+        supervising.join(5)
+    assert not supervising.is_alive()
+
+@linux_only
+def test_workers_start_without_supervisor_signal_handlers(tmp_path):
+    def worker_main(index):
+        handler = signal.getsignal(signal.SIGTERM)
+        blocked = signal.SIGTERM in signal.pthread_sigmask(signal.SIG_BLOCK, set())
+        (tmp_path / "worker-0").write_text(f"{handler == signal.SIG_DFL} {blocked}")
+
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: None)
+    try:
+        supervisor = PreforkSupervisor(1, worker_main, memory_report_seconds=0, restart=False).start()
+        deadline = time.time() + 10
+        while not (tmp_path / "worker-0").exists() and time.time() < deadline:
+            time.sleep(0.05)
+        supervisor.stop()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    assert (tmp_path / "worker-0").read_text() == "True False"
+    # The supervisor's own signals are not left blocked
+    assert signal.SIGTERM not in signal.pthread_sigmask(signal.SIG_BLOCK, set())
@@ -0,0 +1,119 @@
+import os, threading, time, pytest
+import huggingface_hub
+from types import SimpleNamespace
+from src.config_manager import ConfigManager
+from src.model_manager import APIModel, CancellationToken, ModelManager, create_backend
+from src.replay_backend import ReplayModel, conversation_key, load_recordings
+from src.chat_handler import ChatHandler
+
+MESSAGES = [{"role": "system", "content": "You are Diogenes."}, {"role": "user", "content": "Hi"}]
+
+class FakeInferenceClient:
+    def __init__(self, token=None, model=None):
+        pass
+
+    def chat_completion(self, messages, **kwargs):
+        for word in ("Get ", "out ", "of ", "my ", "sun."):
+            time.sleep(0.02)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FakeInferenceClient)
+    path = str(tmp_path / "streams.jsonl.gz")
+    model = APIModel("fake/model", record_path=path)
+    assert "".join(model.generate(MESSAGES, hf_token="x", max_tokens=16)) == "Get out of my sun."
+    return path
+
+def test_api_model_records_chunks_and_timings(recording):
+    [entry] = load_recordings(recording)
+    assert entry["key"] == conversation_key(MESSAGES)
+    assert entry["messages"] == MESSAGES
+    assert entry["params"]["max_tokens"] == 16
+    assert [text for _, text in entry["chunks"]] == ["Get ", "out ", "of ", "my ", "sun."]
+    assert all(delay >= 0.015 for delay, _ in entry["chunks"])
+
+def test_cancelled_responses_are_not_recorded(tmp_path, monkeypatch):
+    monkeypatch.setattr(huggingface_hub, "InferenceClient", FakeInferenceClient)
+    path = str(tmp_path / "streams.jsonl")
+    token = CancellationToken()
+    gen = APIModel("fake/model", record_path=path).generate(MESSAGES, hf_token="x", cancel_token=token)
+    next(gen)
+    token.cancel()
+    list(gen)
+    assert not os.path.exists(path)
+
+def test_replay_timing_modes(recording):
+    start = time.perf_counter()
+    assert "".join(ReplayModel(recording, timing="none").generate(MESSAGES)) == "Get out of my sun."
+    assert time.perf_counter() - start < 0.05
+
+    start = time.perf_counter()
+    assert "".join(ReplayModel(recording).generate(MESSAGES)) == "Get out of my sun."
+    assert time.perf_counter() - start >= 0.08
+
+    model = ReplayModel(recording, timing="scaled", time_scale=0.1)
+    start = time.perf_counter()
+    list(model.generate(MESSAGES))
+    assert time.perf_counter() - start < 0.08
+
+def test_replay_falls_back_and_honours_limits(recording):
+    model = ReplayModel(recording, timing="none")
+    other = [{"role": "user", "content": "Something never recorded"}]
+    assert "".join(model.generate(other)) == "Get out of my sun."
+    token = CancellationToken()
+    assert list(model.generate(MESSAGES, max_tokens=2, cancel_token=token)) == ["Get ", "out "]
+    assert token.generated_tokens == 2
+    with pytest.raises(ValueError):
+        ReplayModel(recording, timing="fast")
+
+def test_replay_backend_serves_chat_handler(recording, config):
+    config["backends"] = {"replay": {"type": "replay", "path": recording, "timing": "none"}}
+    assert isinstance(create_backend(config["backends"]["replay"]), ReplayModel)
+    handler = ChatHandler(ModelManager(config), config, ConfigManager().load_prompts())
+    # The first request starts the load in the background and waits for it
+    chunks = list(handler.respond("Hi", [], None, 32, 0.7, 0.9, "replay"))
+    assert chunks[-1].endswith("Get out of my sun.")
+    assert config["messages"]["model_load_failed"] not in chunks[-1]
+    chunks = list(handler.respond("Hi", [], None, 32, 0.7, 0.9, "replay"))
+    assert chunks[-1] == "Get out of my sun."
+
+def test_replay_empty_or_concurrent_loads(tmp_path, recording):
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    with pytest.raises(RuntimeError):
+        list(ReplayModel(str(empty)).generate(MESSAGES))
+
+    model = ReplayModel(recording, timing="none")
+    assert model.begin_load() and model.is_loading()
+    # A generate() racing the background load waits for it instead of loading again
+    results = []
+    thread = threading.Thread(target=lambda: results.append("".join(model.generate(MESSAGES))))
+    thread.start()
+    time.sleep(0.05)
+    assert thread.is_alive()
+    model.complete_load()
+    thread.join(5)
+    assert results == ["Get out of my sun."]
+
+def test_replay_takes_the_api_path(recording, config, monkeypatch):
+    monkeypatch.delenv("HF_TOKEN", raising=False)
+    config["backends"] = {"replay": {"type": "replay", "path": recording, "timing": "original"}}
+    handler = ChatHandler(ModelManager(config), config, ConfigManager().load_prompts())
+    # With the only local generation slot taken, replayed streams still run, and concurrently
+    with handler.model_manager.governor.generation_slot():
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            list(handler.respond("Hi", [], None, 32, 0.7, 0.9, "replay"))[-1])) for _ in range(4)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        elapsed = time.perf_counter() - start
+    assert results == ["Get out of my sun."] * 4
+    # Each stream takes about 0.1s; one after another they would take 0.4s
+    assert elapsed < 0.3
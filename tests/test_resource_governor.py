@@ -0,0 +1,58 @@
+import threading, time
+from src.resource_governor import ResourceGovernor
+
+CORES = list(range(32))
+
+def test_defaults_give_one_generation_all_cores():
+    governor = ResourceGovernor({}, cores=CORES)
+    assert governor.intra_op_threads == 32
+    assert governor.max_concurrent_generations == 1
+
+def test_concurrency_derived_from_thread_count():
+    governor = ResourceGovernor({"intra_op_threads": 8}, cores=CORES)
+    assert governor.max_concurrent_generations == 4
+
+def test_thread_count_derived_from_concurrency():
+    governor = ResourceGovernor({"max_concurrent_generations": 3}, cores=CORES)
+    assert governor.intra_op_threads == 10
+    assert governor.intra_op_threads * governor.max_concurrent_generations <= len(CORES)
+
+def test_oversubscribed_thread_count_is_clamped(capsys):
+    governor = ResourceGovernor({"intra_op_threads": 16, "max_concurrent_generations": 4}, cores=CORES)
+    assert governor.intra_op_threads == 8
+    assert governor.max_concurrent_generations == 4
+    assert "oversubscribes 32 cores" in capsys.readouterr().out
+    # A combination that fits is kept as configured
+    governor = ResourceGovernor({"intra_op_threads": 4, "max_concurrent_generations": 4}, cores=CORES)
+    assert governor.intra_op_threads == 4
+
+def test_cpu_affinity_limits_cores():
+    governor = ResourceGovernor({"cpu_affinity": [0, 1, 2, 3], "max_concurrent_generations": 2}, cores=CORES)
+    assert governor.intra_op_threads == 2
+
+def test_worker_core_sets_rotate():
+    governor = ResourceGovernor({"worker_core_sets": [[0, 1], [2, 3]]}, cores=CORES)
+    assert governor.core_set_for(0) == [0, 1]
+    assert governor.core_set_for(3) == [2, 3]
+    assert ResourceGovernor({}, cores=CORES).core_set_for(0) is None
+
+def test_generation_slots_cap_concurrency():
+    governor = ResourceGovernor({"intra_op_threads": 16}, cores=CORES)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def generate():
+        with governor.generation_slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=generate) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
@@ -0,0 +1,94 @@
+import http.client, json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.router_gateway import ConsistentHashRing, Router, RouterGateway, request_key
+
+KEYS = [f"session:{i}" for i in range(2000)]
+
+def test_ring_spreads_keys_and_remaps_minimally():
+    ring = ConsistentHashRing(["a", "b", "c", "d"])
+    before = {key: ring.home(key) for key in KEYS}
+    counts = {replica: list(before.values()).count(replica) for replica in ring.replicas}
+    assert min(counts.values()) > len(KEYS) / 4 * 0.6
+
+    ring.add("e")
+    after = {key: ring.home(key) for key in KEYS}
+    moved = [key for key in KEYS if before[key] != after[key]]
+    # Only keys taken over by the new replica move (about a fifth of them)
+    assert all(after[key] == "e" for key in moved)
+    assert len(moved) < len(KEYS) * 0.35
+
+    ring.remove("e")
+    assert {key: ring.home(key) for key in KEYS} == before
+
+def test_bounded_load_spills_hot_key():
+    ring = ConsistentHashRing(["a", "b", "c"], load_factor=1.25)
+    home = ring.home("persona:Diogenes")
+    loads = {"a": 0, "b": 0, "c": 0}
+    assert ring.choose("persona:Diogenes", loads) == home
+    # The home replica is well above the average load: the key moves on
+    loads[home] = 4
+    spilled = ring.choose("persona:Diogenes", loads)
+    assert spilled != home
+    assert loads[spilled] < ring.capacity(loads)
+
+def test_request_key_prefers_session_then_persona_then_client():
+    assert request_key("/gradio_api/queue/data?session_hash=abc", b"") == ("session", "abc")
+    body = json.dumps({"data": ["hi", [], "/tmp/Diogenes.jpg"], "session_hash": "xyz"}).encode()
+    assert request_key("/gradio_api/queue/join", body, ["Diogenes"]) == ("session", "xyz")
+    body = json.dumps({"data": ["hi", [], "/tmp/Diogenes.jpg"]}).encode()
+    assert request_key("/gradio_api/call/chat", body, ["Socrates", "Diogenes"]) == ("persona", "Diogenes")
+    assert request_key("/config", b"", ["Diogenes"], client="10.0.0.1") == ("client", "10.0.0.1")
+
+def test_sessions_stay_pinned_under_load():
+    router = Router(["a", "b"])
+    first = router.route("session", "s1")
+    router.loads[first] = 50
+    assert router.route("session", "s1") == first
+    # Until their replica leaves the ring
+    router.remove(first)
+    assert router.route("session", "s1") != first
+
+class Replica(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = self.server.name.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_replica(name):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Replica)
+    server.name = name
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def post(port, session_hash):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("POST", "/gradio_api/queue/join", body=json.dumps({"session_hash": session_hash}),
+                       headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    body = response.read().decode()
+    connection.close()
+    return response.status, body
+
+def test_gateway_proxies_with_affinity_and_fails_over():
+    one, two = start_replica("one"), start_replica("two")
+    gateway = RouterGateway([{"url": f"http://127.0.0.1:{server.server_address[1]}"} for server in (one, two)],
+                            port=0, addr="127.0.0.1", probe_seconds=0).start()
+    try:
+        served = {session: post(gateway.port, session)[1] for session in ("s1", "s2", "s3", "s4", "s5", "s6")}
+        assert set(served.values()) == {"one", "two"}
+        assert all(post(gateway.port, session)[1] == name for session, name in served.items())
+
+        # A replica going away sends its sessions to the survivor
+        two.shutdown()
+        two.server_close()
+        assert {post(gateway.port, session) for session in served} == {(200, "one")}
+    finally:
+        gateway.stop()
+        one.shutdown()
+        one.server_close()
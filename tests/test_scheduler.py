@@ -0,0 +1,104 @@
+import threading, time, pytest
+from src.config_manager import ConfigManager
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from src.scheduler import FairScheduler, Throttled, TokenBucket
+from helpers import StubModel
+
+def grant_order(scheduler, requests):
+    """Hold the only slot, queue requests (session, cost) in order, then record the grant order"""
+    order, lock = [], threading.Lock()
+    scheduler.acquire("holder", cost=1)
+
+    def run(session, cost):
+        with scheduler.slot(session, cost=cost):
+            with lock:
+                order.append((session, cost))
+
+    threads = []
+    for session, cost in requests:
+        thread = threading.Thread(target=run, args=(session, cost))
+        thread.start()
+        threads.append(thread)
+        # Make the enqueue order deterministic
+        deadline = time.time() + 2
+        while scheduler.queued() < len(threads) and time.time() < deadline:
+            time.sleep(0.005)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(5)
+    return order
+
+def test_light_session_not_stuck_behind_heavy_backlog():
+    scheduler = FairScheduler(1)
+    order = grant_order(scheduler, [("heavy", 2048)] * 4 + [("light", 64)])
+    # Served as soon as the heavy session's first request, not after its whole backlog
+    assert order.index(("light", 64)) <= 1
+
+def test_sessions_interleave_with_equal_costs():
+    scheduler = FairScheduler(1)
+    order = grant_order(scheduler, [("a", 100)] * 3 + [("b", 100)] * 3)
+    assert [session for session, _ in order] == ["a", "b", "a", "b", "a", "b"]
+
+def test_shortest_job_first():
+    scheduler = FairScheduler(1, {"shortest_job_first": True})
+    order = grant_order(scheduler, [("a", 2048), ("b", 512), ("c", 8)])
+    assert [cost for _, cost in order] == [8, 512, 2048]
+
+def test_aged_requests_go_first():
+    scheduler = FairScheduler(1, {"shortest_job_first": True, "max_wait_seconds": 0.2})
+    scheduler.acquire("holder", cost=1)
+    order = []
+    big = threading.Thread(target=lambda: scheduler.acquire("a", cost=2048) and order.append("a"))
+    big.start()
+    time.sleep(0.3)
+    small = threading.Thread(target=lambda: scheduler.acquire("b", cost=8) and order.append("b"))
+    small.start()
+    while scheduler.queued() < 2:
+        time.sleep(0.005)
+    scheduler.release("holder")
+    big.join(5)
+    assert order == ["a"]
+    scheduler.release("a")
+    small.join(5)
+    assert order == ["a", "b"]
+    scheduler.release("b")
+
+def test_token_bucket_throttles_session():
+    scheduler = FairScheduler(2, {"tokens_per_second": 100, "burst_tokens": 1000})
+    with scheduler.slot("spammer", cost=1000):
+        pass
+    with pytest.raises(Throttled) as excinfo:
+        scheduler.acquire("spammer", cost=500)
+    assert excinfo.value.retry_after == pytest.approx(5, rel=0.1)
+    # Other sessions have their own budget
+    with scheduler.slot("someone-else", cost=500):
+        pass
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=10, capacity=100, now=0)
+    assert bucket.take(100, now=0) == 0
+    assert bucket.take(50, now=1) == pytest.approx(4)
+    assert bucket.take(50, now=5) == 0
+
+def test_capacity_and_timeout():
+    scheduler = FairScheduler(1)
+    assert scheduler.acquire("a", cost=1)
+    assert scheduler.acquire("b", cost=1, timeout=0.05) is False
+    assert scheduler.queued() == 0
+    scheduler.release("a")
+    assert scheduler.acquire("b", cost=1, timeout=0.05)
+    scheduler.release("b")
+
+class FakeRequest:
+    username = None
+    def __init__(self, session_hash): self.session_hash = session_hash
+
+def test_chat_handler_reports_rate_limit(config):
+    config["scheduler"] = {"tokens_per_second": 1, "burst_tokens": 100}
+    handler = ChatHandler(ModelManager(config, local_model=StubModel()), config, ConfigManager().load_prompts())
+    request = FakeRequest("session-1")
+    assert list(handler.respond("Hi", [], None, 100, 0.7, 0.9, True, None, request))[-1] == "ok"
+    throttled = list(handler.respond("Hi", [], None, 100, 0.7, 0.9, True, None, request))[-1]
+    assert throttled.startswith(config["messages"]["rate_limited"][:10])
+    assert list(handler.respond("Hi", [], None, 100, 0.7, 0.9, True, None, FakeRequest("session-2")))[-1] == "ok"
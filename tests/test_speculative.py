@@ -0,0 +1,67 @@
+import pytest
+from src.model_manager import LocalModel, SPECULATIVE_ACCEPTED_TOKENS, SPECULATIVE_DRAFT_TOKENS
+
+def test_acceptance_excludes_the_prefill_step():
+    model = LocalModel("main", draft_model_name="draft")
+    model.draft_model = object()  # stands in for the loaded draft model
+    accepted_before = SPECULATIVE_ACCEPTED_TOKENS._value.get()
+    proposed_before = SPECULATIVE_DRAFT_TOKENS._value.get()
+
+    # Prefill: 5 draft proposals, then the main model reads the 20-token prompt
+    # and keeps 3 tokens. That step is not counted.
+    model._reset_passes()
+    for _ in range(5):
+        model._count_pass("draft")
+    model._count_step(23)
+    # 3 verification steps over 12 draft proposals produced 10 tokens:
+    # 7 accepted draft tokens plus one token from each verification step
+    for _ in range(12):
+        model._count_pass("draft")
+    for length in (27, 30, 33):
+        model._count_step(length)
+    assert model.acceptance() == (12, 7)
+    model._record_speed(13, 2.0)
+
+    assert SPECULATIVE_ACCEPTED_TOKENS._value.get() == accepted_before + 7
+    assert SPECULATIVE_DRAFT_TOKENS._value.get() == proposed_before + 12
+
+def test_no_acceptance_stats_without_draft_model():
+    model = LocalModel("main")
+    proposed_before = SPECULATIVE_DRAFT_TOKENS._value.get()
+    model._record_speed(10, 2.0)
+    assert SPECULATIVE_DRAFT_TOKENS._value.get() == proposed_before
+    assert model._assisted_kwargs() == {}
+
+def test_assisted_kwargs_name_the_draft_model():
+    model = LocalModel("main", draft_model_name="draft", num_assistant_tokens=3)
+    model.draft_model = object()
+    assert model._assisted_kwargs() == {"assistant_model": model.draft_model, "num_assistant_tokens": 3}
+
+class StubTokenizer:
+    def __call__(self, text, **kwargs):
+        return {"input_ids": list(range(len(text.split())))}
+
+    def decode(self, ids, **kwargs):
+        return "".join(ids)
+
+class StubPipeline:
+    """Calls a stub model.generate with what the pipeline would forward to it"""
+    def __init__(self):
+        self.tokenizer = StubTokenizer()
+        self.generate_kwargs = None
+
+    def __call__(self, prompt, streamer=None, **kwargs):
+        self.generate_kwargs = kwargs
+        streamer.on_finalized_text("Get out of my sun.\n", stream_end=True)
+
+def test_generate_passes_the_draft_model_to_generate():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    model = LocalModel("main", draft_model_name="draft", num_assistant_tokens=4)
+    model.pipe = StubPipeline()
+    model.draft_model = object()
+    model._ready = True
+    assert "".join(model.generate([{"role": "user", "content": "Hi"}], max_tokens=8)) == "Get out of my sun."
+    assert model.pipe.generate_kwargs["assistant_model"] is model.draft_model
+    assert model.pipe.generate_kwargs["num_assistant_tokens"] == 4
+    assert model.pipe.generate_kwargs["max_new_tokens"] == 8
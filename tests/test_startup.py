@@ -0,0 +1,62 @@
+import threading, time, pytest
+from prometheus_client import REGISTRY
+from src.startup import StartupStages, preload_modules
+
+def stage_seconds(stage):
+    return REGISTRY.get_sample_value('app_startup_stage_seconds', {'stage': stage})
+
+def test_run_records_timing_and_returns_result():
+    stages = StartupStages()
+    assert stages.run("config", lambda: {"a": 1}) == {"a": 1}
+    assert "config" in stages.timings
+    assert stage_seconds("config") == stages.timings["config"]
+
+def test_background_stages_overlap():
+    stages = StartupStages()
+    start = time.perf_counter()
+    stages.start("slow_a", time.sleep, 0.3)
+    stages.start("slow_b", lambda: time.sleep(0.3) or "done")
+    assert stages.wait("slow_b") == "done"
+    stages.wait("slow_a")
+    assert time.perf_counter() - start < 0.55
+    assert stages.timings["slow_a"] >= 0.29 and stages.timings["slow_b"] >= 0.29
+
+def test_wait_with_timeout_returns_none_while_running():
+    stages = StartupStages()
+    release = threading.Event()
+    stages.start("assets", lambda: release.wait() and ["a.jpg"])
+    assert stages.wait("assets", timeout=0) is None
+    assert not stages.is_done("assets")
+    release.set()
+    assert stages.wait("assets") == ["a.jpg"]
+    assert stages.is_done("assets")
+
+def test_failed_stage_reraises_on_wait():
+    stages = StartupStages()
+    def boom():
+        raise ValueError("no assets")
+    stages.start("assets", boom)
+    with pytest.raises(ValueError):
+        stages.wait("assets")
+    assert "assets" in stages.timings
+
+def test_track_times_external_thread():
+    stages = StartupStages()
+    thread = threading.Thread(target=time.sleep, args=(0.2,))
+    thread.start()
+    stages.track("model_load", thread).join()
+    assert stages.timings["model_load"] >= 0.19
+
+def test_report_lists_running_stages(capsys):
+    stages = StartupStages()
+    release = threading.Event()
+    stages.run("config", dict)
+    stages.start("model_load", release.wait)
+    stages.mark_ui_ready()
+    out = capsys.readouterr().out
+    assert "config" in out and "(done)" in out
+    assert "model_load" in out and "(running)" in out
+    release.set()
+
+def test_preload_modules_skips_missing():
+    assert preload_modules(["json", "definitely_not_a_module_xyz"]) == ["json"]
@@ -0,0 +1,96 @@
+import threading, time
+from src.config_manager import ConfigManager
+from src.model_manager import ModelManager
+from src.chat_handler import ChatHandler
+from src.streaming import ResponseAssembler, STREAM_DELTAS, STREAM_FRAMES
+from helpers import StubModel
+
+class FakeClock:
+    def __init__(self): self.now = 0.0
+    def __call__(self): return self.now
+
+def test_first_delta_is_shown_immediately():
+    assembler = ResponseAssembler(flush_interval=0.03, flush_chars=32, clock=FakeClock())
+    assert assembler.add("Hello") == "Hello"
+
+def test_deltas_coalesced_until_size_threshold():
+    assembler = ResponseAssembler(flush_interval=10, flush_chars=8, clock=FakeClock())
+    assembler.add("a")
+    assert assembler.add("bcd") is None
+    assert assembler.add("efg") is None
+    assert assembler.add("hijk") == "abcdefghijk"
+    assert assembler.frames == 2 and assembler.deltas == 4
+
+def test_deltas_coalesced_until_time_threshold():
+    clock = FakeClock()
+    assembler = ResponseAssembler(flush_interval=0.03, flush_chars=1000, clock=clock)
+    assembler.add("a")
+    clock.now = 0.01
+    assert assembler.add("b") is None
+    clock.now = 0.05
+    assert assembler.add("c") == "abc"
+
+def test_finish_flushes_remainder_only_when_pending():
+    assembler = ResponseAssembler(flush_interval=10, flush_chars=100, clock=FakeClock())
+    assembler.add("a")
+    assert assembler.finish() is None
+    assembler.add("b")
+    assert assembler.text == "ab"
+    assert assembler.finish() == "ab"
+
+def test_empty_deltas_ignored():
+    assembler = ResponseAssembler(clock=FakeClock())
+    assert assembler.add("") is None
+    assert assembler.deltas == 0
+
+def test_pending_text_flushed_while_backend_is_silent():
+    resume = threading.Event()
+
+    def deltas():
+        yield "a"
+        yield "b"
+        resume.wait(5)
+        yield "c"
+
+    frames = ResponseAssembler(flush_interval=0.05, flush_chars=1000).stream(deltas())
+    assert next(frames) == "a"
+    start = time.monotonic()
+    # "b" is shown at the flush deadline, without waiting for "c"
+    assert next(frames) == "ab"
+    assert time.monotonic() - start < 2
+    resume.set()
+    assert list(frames) == ["abc"]
+
+def test_closing_stream_closes_deltas():
+    closed = threading.Event()
+    resume = threading.Event()
+
+    def deltas():
+        try:
+            yield "a"
+            yield "b"
+            resume.wait(5)
+            yield "c"
+        finally:
+            closed.set()
+
+    frames = ResponseAssembler(flush_interval=0.01, flush_chars=1000).stream(deltas())
+    assert next(frames) == "a"
+    assert next(frames) == "ab"
+    # Closed while "c" is still being pulled: the stream is closed once the pull returns
+    frames.close()
+    assert not closed.is_set()
+    resume.set()
+    assert closed.wait(5)
+
+def test_respond_coalesces_frames(config):
+    config["streaming"] = {"flush_interval_ms": 10000, "flush_chars": 32}
+    handler = ChatHandler(ModelManager(config, local_model=StubModel(["x"] * 200)), config,
+                          ConfigManager().load_prompts())
+    deltas_before, frames_before = STREAM_DELTAS._value.get(), STREAM_FRAMES._value.get()
+    frames = list(handler.respond("Hi", [], None, 256, 0.7, 0.9, True))
+    assert frames[-1] == "x" * 200
+    # The first delta, then one frame per 32 characters, then the remainder
+    assert len(frames) == 1 + 199 // 32 + 1
+    assert STREAM_DELTAS._value.get() - deltas_before == 200
+    assert STREAM_FRAMES._value.get() - frames_before == len(frames)
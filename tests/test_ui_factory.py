@@ -1,12 +1,82 @@
+import threading, time
 from src.config_manager import ConfigManager
 from src.model_manager import ModelManager
 from src.chat_handler import ChatHandler
 from src.ui_factory import UIFactory
+from src.ui_image_scraper import UIImageScraper
+from helpers import StubModel
 
-def test_create_chatbot_interface():
+def test_create_chatbot_interface(tmp_path):
     config = ConfigManager().load_config()
     prompts = ConfigManager().load_prompts()
     model_manager = ModelManager(config)
     handler = ChatHandler(model_manager, config, prompts)
-    chatbot = UIFactory.create_chatbot_interface(handler, config)
-    assert hasattr(chatbot, "render")
\ No newline at end of file
+    chatbot = UIFactory.create_chatbot_interface(handler, config, scraper=UIImageScraper(output_dir=str(tmp_path)))
+    assert hasattr(chatbot, "render")
+
+def test_create_chatbot_interface_with_placeholders(tmp_path):
+    config = ConfigManager().load_config()
+    prompts = ConfigManager().load_prompts()
+    handler = ChatHandler(ModelManager(config), config, prompts)
+    scraper = UIImageScraper(output_dir=str(tmp_path))
+    ready = {"paths": None}
+    chatbot = UIFactory.create_chatbot_interface(
+        handler, config, pending_images=lambda: ready["paths"], scraper=scraper
+    )
+    assert hasattr(chatbot, "render")
+    gallery = next(b for b in chatbot.blocks.values() if b.elem_id == "image-gallery")
+    # Placeholders are served until the asset stage reports its paths
+    placeholder_items = gallery.load_event_to_attach[0]()
+    assert [caption for _, caption in placeholder_items] == scraper.image_keys()
+    assert all(path == scraper.placeholder_path() for path, _ in placeholder_items)
+    ready["paths"] = []
+    assert gallery.load_event_to_attach[0]() == []
+
+def test_stored_chat_does_not_send_history(tmp_path, config):
+    from gradio.helpers import special_args
+    config["conversation_store"] = {"enabled": True}
+    model = StubModel(lambda messages: [f"reply to {messages[-1]['content']}"])
+    handler = ChatHandler(ModelManager(config, local_model=model), config, ConfigManager().load_prompts())
+    demo = UIFactory.create_chatbot_interface(handler, config, image_paths=[],
+                                              scraper=UIImageScraper(output_dir=str(tmp_path)))
+    chatbot = next(b for b in demo.blocks.values() if b.get_block_name() == "chatbot")
+    submit = next(f for f in demo.fns.values() if f.name == "respond")
+    # The chatbot is only an output: its value is never sent with a turn
+    assert chatbot not in submit.inputs and chatbot in submit.outputs
+
+    request = type("FakeRequest", (), {"username": None, "session_hash": "s1"})()
+    args, _, _ = special_args(submit.fn, ["Hi", "Diogenes", 8, 0.7, 0.9, "local"], request)
+    _, shown = list(submit.fn(*args))[-1]
+    assert [turn["content"] for turn in shown] == ["Hi", "reply to Hi"]
+    args, _, _ = special_args(submit.fn, ["Again", "Diogenes", 8, 0.7, 0.9, "local"], request)
+    _, shown = list(submit.fn(*args))[-1]
+    assert [turn["content"] for turn in shown] == ["Hi", "reply to Hi", "Again", "reply to Again"]
+
+class EndlessModel(StubModel):
+    def generate(self, messages, cancel_token=None, **kwargs):
+        while not cancel_token.cancelled:
+            time.sleep(0.01)
+            yield "t "
+
+def test_stored_chat_stop_button_cancels_the_reply(tmp_path, config):
+    from gradio.helpers import special_args
+    config["conversation_store"] = {"enabled": True}
+    handler = ChatHandler(ModelManager(config, local_model=EndlessModel()), config, ConfigManager().load_prompts())
+    demo = UIFactory.create_chatbot_interface(handler, config, image_paths=[],
+                                              scraper=UIImageScraper(output_dir=str(tmp_path)))
+    submit = next(f for f in demo.fns.values() if f.name == "respond")
+    stop = next(f for f in demo.fns.values() if f.name == "stop")
+
+    request = type("FakeRequest", (), {"username": None, "session_hash": "s1"})()
+    args, _, _ = special_args(submit.fn, ["Hi", "Diogenes", 512, 0.7, 0.9, "local"], request)
+    replying = threading.Thread(target=lambda: list(submit.fn(*args)), daemon=True)
+    replying.start()
+    time.sleep(0.1)
+    # Another session's stop leaves this reply alone
+    other = type("FakeRequest", (), {"username": None, "session_hash": "s2"})()
+    stop.fn(*special_args(stop.fn, [], other)[0])
+    assert replying.is_alive()
+    stop.fn(*special_args(stop.fn, [], request)[0])
+    replying.join(5)
+    assert not replying.is_alive()
+    assert handler.in_flight == 0
@@ -1,6 +1,9 @@
 
-import os, pytest, tempfile, shutil, json
-from src.ui_image_scraper import UIImageScraper
+import io, os, pytest, json, requests, tempfile, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+import src.ui_image_scraper as ui_image_scraper
+from src.ui_image_scraper import UIImageScraper, transform_images
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'cm', 'ui_scraper_config.json')
 
@@ -9,13 +12,356 @@ def load_image_data_count(config_path):
 		config = json.load(f)
 	return len(config.get('image_data', []))
 
-def test_download_images_to_temp_dir():
-	temp_dir = tempfile.mkdtemp()
-	try:
-		scraper = UIImageScraper(config_path=CONFIG_PATH, output_dir=temp_dir)
+def test_download_images_to_temp_dir(tmp_path):
+	scraper = UIImageScraper(config_path=CONFIG_PATH, output_dir=str(tmp_path))
+	scraper.download_images_to_local()
+	files = [f for f in os.listdir(tmp_path) if os.path.isfile(os.path.join(tmp_path, f))]
+	expected_count = load_image_data_count(CONFIG_PATH)
+	assert len(files) == expected_count, f"Expected {expected_count} images, found {len(files)}"
+
+def make_fixture_image(size=(800, 600), fmt='JPEG'):
+	buffer = io.BytesIO()
+	Image.new('RGB', size, color=(120, 80, 40)).save(buffer, fmt)
+	return buffer.getvalue()
+
+class FixtureImageHandler(BaseHTTPRequestHandler):
+	"""Serves fixture images; /slow/<name> stalls before answering."""
+	images = {}
+	delay = 0
+	send_length = True
+	requests_seen = []
+
+	def do_GET(self):
+		FixtureImageHandler.requests_seen.append((self.path, self.headers.get('If-None-Match')))
+		path = self.path
+		if path.startswith('/slow/'):
+			time.sleep(FixtureImageHandler.delay)
+			path = path[len('/slow'):]
+		body = FixtureImageHandler.images.get(path.lstrip('/'))
+		if body is None:
+			self.send_response(404)
+			self.end_headers()
+			return
+		etag = '"%08x"' % (hash(body) & 0xffffffff)
+		if self.headers.get('If-None-Match') == etag:
+			self.send_response(304)
+			self.send_header('ETag', etag)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('ETag', etag)
+		self.send_header('Content-Type', 'image/jpeg')
+		if FixtureImageHandler.send_length:
+			self.send_header('Content-Length', str(len(body)))
+		else:
+			self.close_connection = True
+		self.end_headers()
+		try:
+			self.wfile.write(body)
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+
+	def log_message(self, format, *args):
+		pass
+
+@pytest.fixture
+def image_server():
+	FixtureImageHandler.images = {f"img{i}.jpg": make_fixture_image() for i in range(4)}
+	FixtureImageHandler.delay = 0
+	FixtureImageHandler.requests_seen = []
+	FixtureImageHandler.send_length = True
+	server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureImageHandler)
+	server.daemon_threads = True
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield f"http://127.0.0.1:{server.server_address[1]}"
+	server.shutdown()
+	server.server_close()
+
+def write_scraper_config(tmp_path, urls, fetch=None, cache=None, memory=None, transform=None, variants=None):
+	config = {
+		"image_data": [{"url": url, "filename": f"P{i}.jpg"} for i, url in enumerate(urls)],
+		"image_quality": 90,
+		"transform_parameters": {
+			"convert_to_grayscale": True,
+			"resize": {"enabled": True, "base_size": 20,
+			           "aspect_ratio": {"width_multiplier": 4, "height_multiplier": 3},
+			           "resampling": "LANCZOS"},
+			"output_format": "JPEG"
+		},
+		"fetch": fetch or {"concurrent": True, "max_concurrency": 4,
+		                   "request_timeout": 5, "overall_timeout": 10},
+		"cache": cache or {"enabled": False},
+		"memory": memory or {},
+		"transform": transform or {"workers": 0},
+		"variants": variants or []
+	}
+	config_path = tmp_path / "ui_scraper_config.json"
+	config_path.write_text(json.dumps(config))
+	return str(config_path)
+
+def test_concurrent_fetch_from_local_server(tmp_path, image_server):
+	urls = [f"{image_server}/img{i}.jpg" for i in range(4)]
+	output_dir = tmp_path / "images"
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls), output_dir=str(output_dir))
+	paths = scraper.download_images_to_local()
+	assert paths == [str(output_dir / f"P{i}.jpg") for i in range(4)]
+	for path in paths:
+		with Image.open(path) as image:
+			assert image.size == (80, 60)
+			assert image.mode == 'L'
+	assert [t["status"] for t in scraper.timings] == ["ok"] * 4
+	assert all(t["fetch_seconds"] is not None and t["process_seconds"] is not None for t in scraper.timings)
+
+def test_serial_and_concurrent_modes_match(tmp_path, image_server):
+	urls = [f"{image_server}/img{i}.jpg" for i in range(4)]
+	config_path = write_scraper_config(tmp_path, urls)
+	serial = UIImageScraper(config_path=config_path, output_dir=str(tmp_path / "serial"))
+	parallel = UIImageScraper(config_path=config_path, output_dir=str(tmp_path / "parallel"))
+	serial_paths = serial.download_images_to_local(concurrent=False)
+	parallel_paths = parallel.download_images_to_local(concurrent=True)
+	assert [os.path.basename(p) for p in serial_paths] == [os.path.basename(p) for p in parallel_paths]
+
+def test_slow_url_hits_request_timeout(tmp_path, image_server):
+	FixtureImageHandler.delay = 3
+	urls = [f"{image_server}/img0.jpg", f"{image_server}/slow/img1.jpg", f"{image_server}/missing.jpg"]
+	fetch = {"concurrent": True, "max_concurrency": 3, "request_timeout": 0.5, "overall_timeout": 10}
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, fetch), output_dir=str(tmp_path / "out"))
+	start = time.perf_counter()
+	paths = scraper.download_images_to_local()
+	assert time.perf_counter() - start < 2.5
+	assert [os.path.basename(p) for p in paths] == ["P0.jpg"]
+	assert [t["status"] for t in scraper.timings] == ["ok", "error", "http_404"]
+
+def test_overall_timeout_bounds_fetch(tmp_path, image_server):
+	FixtureImageHandler.delay = 3
+	urls = [f"{image_server}/img0.jpg", f"{image_server}/slow/img1.jpg"]
+	fetch = {"concurrent": True, "max_concurrency": 2, "request_timeout": 10, "overall_timeout": 0.5}
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, fetch), output_dir=str(tmp_path / "out"))
+	start = time.perf_counter()
+	paths = scraper.download_images_to_local()
+	assert time.perf_counter() - start < 2.5
+	assert [os.path.basename(p) for p in paths] == ["P0.jpg"]
+	assert scraper.timings[1]["status"] == "timeout"
+	time.sleep(3)
+	assert not os.path.exists(tmp_path / "out" / "P1.jpg")
+
+def test_stopped_fetch_leaves_session_and_pool_alone(tmp_path, image_server):
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, [f"{image_server}/img0.jpg"]),
+	                         output_dir=str(tmp_path / "out"))
+	item = {"url": f"{image_server}/img0.jpg", "filename": "P0.jpg"}
+	stop = threading.Event()
+
+	class StoppingSession(requests.Session):
+		def get(self, *args, **kwargs):
+			# The batch gives up while this request is in flight
+			stop.set()
+			return super().get(*args, **kwargs)
+
+	class ClosedPool:
+		def submit(self, *args):
+			raise RuntimeError("cannot schedule new futures after shutdown")
+
+	class ClosedSession:
+		def get(self, *args, **kwargs):
+			raise RuntimeError("session used after close")
+
+	with StoppingSession() as session:
+		record = scraper._download_one(session, item, str(tmp_path / "out"), 5,
+		                               transform_pool=ClosedPool(), stop=stop)
+	assert record["status"] == "timeout"
+	record = scraper._download_one(ClosedSession(), item, str(tmp_path / "out"), 5, stop=stop)
+	assert record["status"] == "timeout"
+	assert not os.path.exists(tmp_path / "out" / "P0.jpg")
+
+CACHE_ON = {"enabled": True, "revalidate": True, "offline": False}
+
+def test_cache_revalidates_with_etag(tmp_path, image_server):
+	urls = [f"{image_server}/img{i}.jpg" for i in range(3)]
+	config_path = write_scraper_config(tmp_path, urls, cache=CACHE_ON)
+	output_dir = str(tmp_path / "images")
+
+	cold = UIImageScraper(config_path=config_path, output_dir=output_dir)
+	cold_paths = cold.download_images_to_local()
+	assert cold.cache_stats == {"hits": 0, "misses": 3}
+	assert os.path.exists(os.path.join(output_dir, ".cache", "manifest.json"))
+	mtimes = [os.path.getmtime(p) for p in cold_paths]
+
+	FixtureImageHandler.requests_seen = []
+	warm = UIImageScraper(config_path=config_path, output_dir=output_dir)
+	assert warm.download_images_to_local() == cold_paths
+	assert warm.cache_stats == {"hits": 3, "misses": 0}
+	assert all(etag for _, etag in FixtureImageHandler.requests_seen)
+	assert [t["status"] for t in warm.timings] == ["not_modified"] * 3
+	assert [os.path.getmtime(p) for p in cold_paths] == mtimes
+
+def test_cache_refetches_changed_upstream_and_params(tmp_path, image_server):
+	urls = [f"{image_server}/img0.jpg", f"{image_server}/img1.jpg"]
+	config_path = write_scraper_config(tmp_path, urls, cache=CACHE_ON)
+	output_dir = str(tmp_path / "images")
+	UIImageScraper(config_path=config_path, output_dir=output_dir).download_images_to_local()
+
+	FixtureImageHandler.images["img1.jpg"] = make_fixture_image(size=(640, 480))
+	changed = UIImageScraper(config_path=config_path, output_dir=output_dir)
+	changed.download_images_to_local()
+	assert changed.cache_stats == {"hits": 1, "misses": 1}
+
+	# A different transform produces a different cache key
+	config = json.loads(open(config_path).read())
+	config["image_quality"] = 50
+	with open(config_path, 'w') as f:
+		json.dump(config, f)
+	retuned = UIImageScraper(config_path=config_path, output_dir=output_dir)
+	retuned.download_images_to_local()
+	assert retuned.cache_stats == {"hits": 0, "misses": 2}
+
+def test_cache_serves_offline_and_detects_tampering(tmp_path, image_server):
+	urls = [f"{image_server}/img0.jpg", f"{image_server}/img1.jpg"]
+	config_path = write_scraper_config(tmp_path, urls, cache=CACHE_ON)
+	output_dir = tmp_path / "images"
+	UIImageScraper(config_path=config_path, output_dir=str(output_dir)).download_images_to_local()
+	(output_dir / "P1.jpg").write_bytes(b"corrupt")
+
+	FixtureImageHandler.requests_seen = []
+	offline = UIImageScraper(config_path=config_path, output_dir=str(output_dir))
+	paths = offline.download_images_to_local(offline=True)
+	assert FixtureImageHandler.requests_seen == []
+	assert paths == [str(output_dir / "P0.jpg")]
+	assert offline.cache_stats == {"hits": 1, "misses": 1}
+
+def test_cache_falls_back_when_upstream_unreachable(tmp_path, image_server):
+	urls = [f"{image_server}/img0.jpg"]
+	config_path = write_scraper_config(tmp_path, urls, cache=CACHE_ON)
+	output_dir = str(tmp_path / "images")
+	UIImageScraper(config_path=config_path, output_dir=output_dir).download_images_to_local()
+
+	FixtureImageHandler.images = {}
+	scraper = UIImageScraper(config_path=config_path, output_dir=output_dir)
+	assert scraper.download_images_to_local() == [os.path.join(output_dir, "P0.jpg")]
+	assert scraper.timings[0]["status"] == "cached"
+	assert scraper.cache_stats == {"hits": 1, "misses": 0}
+
+def test_jpeg_draft_decodes_near_target_scale(tmp_path, image_server):
+	FixtureImageHandler.images["large.jpg"] = make_fixture_image(size=(4000, 3000))
+	urls = [f"{image_server}/large.jpg"]
+	config_path = write_scraper_config(tmp_path, urls)
+	scraper = UIImageScraper(config_path=config_path, output_dir=str(tmp_path / "draft"))
+	assert scraper.download_images_to_local()
+	# libjpeg can scale by at most 1/8 while staying above the 80x60 target
+	assert scraper.timings[0]["decoded_size"] == (500, 375)
+	assert scraper.memory_report["max_decoded_pixels"] == 500 * 375
+
+	full = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, memory={"draft_decode": False}),
+	                      output_dir=str(tmp_path / "full"))
+	assert full.download_images_to_local()
+	assert full.timings[0]["decoded_size"] == (4000, 3000)
+	with Image.open(tmp_path / "draft" / "P0.jpg") as image:
+		assert image.size == (80, 60)
+
+def test_non_jpeg_uses_reduce(tmp_path, image_server):
+	FixtureImageHandler.images["large.png"] = make_fixture_image(size=(1000, 700), fmt='PNG')
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, [f"{image_server}/large.png"]),
+	                         output_dir=str(tmp_path / "out"))
+	assert scraper.download_images_to_local()
+	assert scraper.timings[0]["decoded_size"] == (91, 64)
+
+@pytest.mark.parametrize("send_length", [True, False])
+def test_body_size_cap(tmp_path, image_server, send_length):
+	FixtureImageHandler.send_length = send_length
+	FixtureImageHandler.images["large.jpg"] = make_fixture_image(size=(2000, 1500))
+	urls = [f"{image_server}/large.jpg", f"{image_server}/img0.jpg"]
+	memory = {"max_download_bytes": 20000, "spool_max_memory_bytes": 4096}
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, memory=memory),
+	                         output_dir=str(tmp_path / "out"))
+	paths = scraper.download_images_to_local()
+	assert [os.path.basename(p) for p in paths] == ["P1.jpg"]
+	assert not os.path.exists(tmp_path / "out" / "P0.jpg")
+
+def test_process_pool_transforms_match_inline(tmp_path, image_server):
+	urls = [f"{image_server}/img{i}.jpg" for i in range(4)]
+	inline = UIImageScraper(config_path=write_scraper_config(tmp_path, urls), output_dir=str(tmp_path / "inline"))
+	pooled = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, transform={"workers": 2}),
+	                        output_dir=str(tmp_path / "pooled"))
+	inline_paths = inline.download_images_to_local()
+	pooled_paths = pooled.download_images_to_local()
+	assert len(pooled_paths) == 4
+	for a, b in zip(inline_paths, pooled_paths):
+		with open(a, 'rb') as fa, open(b, 'rb') as fb:
+			assert fa.read() == fb.read()
+	assert [t["decoded_size"] for t in pooled.timings] == [t["decoded_size"] for t in inline.timings]
+
+def test_process_pool_reads_bodies_from_temp_files(tmp_path, image_server, monkeypatch):
+	spool_dir = tmp_path / "spool"
+	spool_dir.mkdir()
+	monkeypatch.setattr(tempfile, "tempdir", str(spool_dir))
+	urls = [f"{image_server}/img{i}.jpg" for i in range(2)]
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, transform={"workers": 2}),
+	                         output_dir=str(tmp_path / "out"))
+	assert len(scraper.download_images_to_local()) == 2
+	# Each original went to a named temp file for the worker and was removed afterwards
+	assert list(spool_dir.iterdir()) == []
+
+def test_process_pool_shut_down_when_fetching_fails(tmp_path, image_server, monkeypatch):
+	pools = []
+	real_create = ui_image_scraper.create_transform_pool
+
+	def create(workers, start_method=None):
+		pools.append(real_create(workers, start_method))
+		return pools[-1]
+
+	def broken_session(pool_size):
+		raise RuntimeError("no session")
+
+	monkeypatch.setattr(ui_image_scraper, "create_transform_pool", create)
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, [f"{image_server}/img0.jpg"],
+	                                                          transform={"workers": 2}),
+	                         output_dir=str(tmp_path / "out"))
+	monkeypatch.setattr(scraper, "_create_session", broken_session)
+	with pytest.raises(RuntimeError):
 		scraper.download_images_to_local()
-		files = [f for f in os.listdir(temp_dir) if os.path.isfile(os.path.join(temp_dir, f))]
-		expected_count = load_image_data_count(CONFIG_PATH)
-		assert len(files) == expected_count, f"Expected {expected_count} images, found {len(files)}"
-	finally:
-		shutil.rmtree(temp_dir)
+	with pytest.raises(RuntimeError):
+		pools[0].submit(int, 1)
+
+def test_transform_images_serial_and_parallel(tmp_path):
+	settings = {"transform_parameters": {"convert_to_grayscale": True,
+	                                     "resize": {"enabled": True, "base_size": 10}},
+	            "image_quality": 80}
+	sources = [make_fixture_image(size=(400, 300)) for _ in range(3)]
+	serial = transform_images([(src, str(tmp_path / f"s{i}.jpg")) for i, src in enumerate(sources)], settings)
+	parallel = transform_images([(src, str(tmp_path / f"p{i}.jpg")) for i, src in enumerate(sources)], settings, workers=2)
+	assert serial == parallel == [(50, 38)] * 3
+	for i in range(3):
+		assert (tmp_path / f"s{i}.jpg").read_bytes() == (tmp_path / f"p{i}.jpg").read_bytes()
+
+VARIANTS = [
+	{"name": "thumb", "base_size": 5, "formats": {"WEBP": 70, "JPEG": 75}},
+	{"name": "preview", "base_size": 10, "formats": {"JPEG": 85}}
+]
+
+def test_variants_written_and_selected(tmp_path, image_server):
+	urls = [f"{image_server}/img0.jpg"]
+	output_dir = tmp_path / "images"
+	scraper = UIImageScraper(config_path=write_scraper_config(tmp_path, urls, variants=VARIANTS), output_dir=str(output_dir))
+	[primary] = scraper.download_images_to_local()
+	with Image.open(output_dir / "thumb" / "P0.webp") as image:
+		assert image.size == (20, 15) and image.format == 'WEBP'
+	with Image.open(output_dir / "preview" / "P0.jpg") as image:
+		assert image.size == (40, 30)
+	# Variants live in subdirectories, so the output directory still holds one file per image
+	assert [f for f in os.listdir(output_dir) if os.path.isfile(output_dir / f)] == ["P0.jpg"]
+
+	assert scraper.select_variant(primary, 20) == str(output_dir / "thumb" / "P0.webp")
+	assert scraper.select_variant(primary, 20, prefer_webp=False) == str(output_dir / "thumb" / "P0.jpg")
+	assert scraper.select_variant(primary, 30) == str(output_dir / "preview" / "P0.jpg")
+	assert scraper.select_variant(primary, 500) == primary
+
+def test_missing_variant_invalidates_cache(tmp_path, image_server):
+	urls = [f"{image_server}/img0.jpg"]
+	config_path = write_scraper_config(tmp_path, urls, cache=CACHE_ON, variants=VARIANTS)
+	output_dir = tmp_path / "images"
+	UIImageScraper(config_path=config_path, output_dir=str(output_dir)).download_images_to_local()
+	os.remove(output_dir / "preview" / "P0.jpg")
+	scraper = UIImageScraper(config_path=config_path, output_dir=str(output_dir))
+	scraper.download_images_to_local()
+	assert scraper.cache_stats == {"hits": 0, "misses": 1}
+	assert os.path.exists(output_dir / "preview" / "P0.jpg")